@@ -0,0 +1,60 @@
+"""seconds of a page rerun with every figure rebuilt and with the figures served from the figure cache
+usage: python -m benchmarks.bench_figure_cache [pages ...] [--repeat 3]
+
+Each page runs with AppTest in a fresh spawned process, over the data in util/data, once to
+warm the data caches, then reruns with the figure cache cleared before every run (each
+chart built and rendered again, as before the cache) and with the cache kept. The median
+rerun is reported, with the figure cache entries and bytes of the page."""
+import argparse
+import glob
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+
+def default_pages():
+    return sorted(glob.glob("pages/[12]_*.py"))
+
+
+def run_page(page, repeat):
+    import warnings
+    warnings.simplefilter("ignore")
+    sys.path.insert(0, os.getcwd())
+    os.environ["FRAUD_APP_WARMUP"] = "0"
+    from streamlit.logger import set_log_level
+    set_log_level("error")
+    from streamlit.testing.v1 import AppTest
+    from util.figure_cache import _FIGURES, figure_cache_stats
+    at = AppTest.from_file(os.path.abspath(page), default_timeout=600).run()
+    seconds = {}
+    for mode in ('rebuilt', 'cached'):
+        runs = []
+        for _ in range(repeat):
+            if mode == 'rebuilt':
+                _FIGURES.clear()
+            start = time.perf_counter()
+            at.run()
+            runs.append(time.perf_counter() - start)
+        seconds[mode] = statistics.median(runs)
+    return seconds, figure_cache_stats(), bool(at.exception)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pages", nargs="*")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'page':<32} {'rebuilt s':>10} {'cached s':>9} {'figures':>8} {'KB':>8}")
+    for page in args.pages or default_pages():
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+            seconds, stats, failed = pool.submit(run_page, page, args.repeat).result()
+        print(f"{os.path.basename(page):<32} {seconds['rebuilt']:>10.2f} {seconds['cached']:>9.2f} "
+              f"{stats['entries']:>8} {stats['bytes'] / 2**10:>8.0f}" + ("  (exception)" if failed else ""))
+
+
+if __name__ == "__main__":
+    main()
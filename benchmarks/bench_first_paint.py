@@ -0,0 +1,65 @@
+"""time to first paint and full render of every page, each in a cold process
+usage: python -m benchmarks.bench_first_paint [pages ...] [--repeat 3]
+
+Every run spawns a fresh process that has imported streamlit only (as a server has),
+then runs the page with AppTest. First paint is the time until the page sends its
+first element, full render until the script run ends; both include the page's own
+imports and loads, as for the first visitor after a deploy. The dataset and the
+aggregates are whatever util/data and util/aggregates hold. The median run is reported."""
+import argparse
+import glob
+import os
+import statistics
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+
+def default_pages():
+    return ["homePage.py"] + sorted(glob.glob("pages/*.py"))
+
+
+def run_page(page):
+    import sys
+    import time
+    import warnings
+    warnings.simplefilter("ignore")
+    sys.path.insert(0, os.getcwd())
+    from streamlit.logger import set_log_level
+    set_log_level("error")
+    from streamlit.testing.v1 import AppTest
+    from streamlit.runtime.scriptrunner_utils.script_run_context import ScriptRunContext
+    marks = {}
+    enqueue = ScriptRunContext.enqueue
+
+    def timed_enqueue(self, msg):
+        if msg.WhichOneof("type") == "delta" and "first" not in marks:
+            marks["first"] = time.perf_counter()
+        return enqueue(self, msg)
+
+    ScriptRunContext.enqueue = timed_enqueue
+    start = time.perf_counter()
+    at = AppTest.from_file(os.path.abspath(page), default_timeout=600).run()
+    end = time.perf_counter()
+    return marks.get("first", end) - start, end - start, bool(at.exception)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pages", nargs="*")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'page':<40} {'first paint s':>14} {'full render s':>14}")
+    for page in args.pages or default_pages():
+        runs = []
+        for _ in range(args.repeat):
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+                runs.append(pool.submit(run_page, page).result())
+        first = statistics.median(run[0] for run in runs)
+        full = statistics.median(run[1] for run in runs)
+        failed = any(run[2] for run in runs)
+        print(f"{os.path.basename(page):<40} {first:>14.2f} {full:>14.2f}" + ("  (exception)" if failed else ""))
+
+
+if __name__ == "__main__":
+    main()
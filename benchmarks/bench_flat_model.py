@@ -0,0 +1,66 @@
+"""load time, per-process memory and rows/sec of the flat model export against the pickled classifier
+usage: python -m benchmarks.bench_flat_model [--batch-sizes 1 100 10000 200000] [--repeat 5]
+
+Each engine runs in a fresh spawned process, so the import of xgboost and the
+unpickled booster count towards its memory. Rows are random probes around the
+model's split thresholds, scored with predict_proba."""
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from benchmarks.suite import _peak_rss_mb
+
+
+def _rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 2**10
+    return _peak_rss_mb()
+
+
+def run_engine(engine, batch_sizes, repeat):
+    import warnings
+    import numpy as np
+    from util.flat_model import read_flat_model, probe_rows
+    before = _rss_mb()
+    start = time.perf_counter()
+    if engine == 'flat':
+        model = read_flat_model()
+    else:
+        import pickle
+        warnings.simplefilter("ignore")  # xgboost warns about the older pickle format
+        with open("util/model.pkl", 'rb') as f:
+            model = pickle.load(f)
+    load_seconds = time.perf_counter() - start
+    load_mb = _rss_mb() - before
+    probes = probe_rows(read_flat_model(), max(batch_sizes))
+    rates = {}
+    for size in batch_sizes:
+        X = np.ascontiguousarray(probes[:size])
+        model.predict_proba(X)
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            model.predict_proba(X)
+            times.append(time.perf_counter() - start)
+        rates[size] = size / min(times)
+    return load_seconds, load_mb, rates
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 100, 10_000, 200_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'engine':>7} {'load s':>8} {'load MB':>8} " + " ".join(f"{f'rows/s @{n:,}':>16}" for n in args.batch_sizes))
+    for engine in ('pickle', 'flat'):
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+            load_seconds, load_mb, rates = pool.submit(run_engine, engine, args.batch_sizes, args.repeat).result()
+        print(f"{engine:>7} {load_seconds:>8.3f} {load_mb:>8.1f} " +
+              " ".join(f"{rates[n]:>16,.0f}" for n in args.batch_sizes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""high_risk_summary against the per-group lambda tables it replaced on the transactional page
+usage: python -m benchmarks.bench_high_risk_summary [--rows 1000000] [--threshold-sigma 3]"""
+import argparse
+import time
+import pandas as pd
+from benchmarks.synthetic import make_transactions
+from util.helper_function import high_risk_summary, calculate_fraud_rate, enrich_data, STORAGE_CATEGORY_COLS
+
+SUMMARIES = [('merchant', ()), ('last', ('first', 'cc_num')), ('city', ('first', 'last')), ('job', ('last', 'first'))]
+
+
+def legacy_high_risk_summary(data, key, extra_keys, threshold_sigma=3):
+    """previous page code: Fraud_Amount re-indexes a full length mask inside every group"""
+    fraud_rate = calculate_fraud_rate(data, key)
+    threshold = fraud_rate.mean() + threshold_sigma * fraud_rate.std()
+    high_risk_transactions = data[data[key].isin(fraud_rate[fraud_rate > threshold].index)]
+    summary_table = high_risk_transactions.groupby([key, *extra_keys], observed=True).agg(
+        Total_Amount=('amt', 'sum'),
+        Fraud_Amount=('amt', lambda x: x[high_risk_transactions['is_fraud'] == 1].sum()),
+        Total_Transactions=('amt', 'count'),
+        Fraud_Transactions=('is_fraud', 'sum')
+    ).reset_index()
+    summary_table['Fraud Rate (%)'] = (summary_table['Fraud_Transactions'] / summary_table['Total_Transactions']) * 100
+    return summary_table
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--threshold-sigma", type=float, default=3,
+                        help="lower values select more high-risk groups")
+    args = parser.parse_args()
+
+    df = make_transactions(args.rows)
+    df = df.astype({col: 'category' for col in STORAGE_CATEGORY_COLS})
+    df[['trans_date_trans_time', 'dob']] = df[['trans_date_trans_time', 'dob']].apply(pd.to_datetime)
+    data = enrich_data(df)
+
+    print(f"{'summary':>10} {'groups':>7} {'legacy s':>9} {'new s':>7} {'speedup':>8}")
+    for key, extra_keys in SUMMARIES:
+        start = time.perf_counter()
+        old = legacy_high_risk_summary(data, key, extra_keys, args.threshold_sigma)
+        t_old = time.perf_counter() - start
+        start = time.perf_counter()
+        new, _ = high_risk_summary(data, key, extra_keys, args.threshold_sigma)
+        t_new = time.perf_counter() - start
+        pd.testing.assert_frame_equal(old, new)
+        print(f"{key:>10} {len(new):>7} {t_old:>9.3f} {t_new:>7.3f} {t_old / t_new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
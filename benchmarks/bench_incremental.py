@@ -0,0 +1,90 @@
+"""IncrementalDataset.append against a full rebuild of the same rows: results are checked equal, times compared
+usage: python -m benchmarks.bench_incremental [--rows 200000] [--batches 3] [--split 0.7]
+
+Two splits of synthetic transactions: random keeps a random share of the rows as the history
+and appends the rest in batches, so most batches hold late rows of known cards; ordered keeps
+the oldest rows and appends the newest, with one old row of a known card moved to the last batch.
+The fraud stats of every dimension, the time gap state and the rows of every card in the card
+index must match a dataset built from all rows at once."""
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from benchmarks.synthetic import make_transactions
+from util.helper_function import IncrementalDataset, TIME_GAP_SUMS
+
+
+def split_random(df, share, batches, seed=0):
+    """history of a random share of the rows, the rest in batches of random rows"""
+    rng = np.random.default_rng(seed)
+    history = np.sort(rng.permutation(len(df))[:int(len(df) * share)])
+    rest = rng.permutation(np.setdiff1d(np.arange(len(df)), history))
+    return df.iloc[history], [df.iloc[np.sort(part)] for part in np.array_split(rest, batches)]
+
+
+def split_ordered(df, share, batches):
+    """history of the oldest rows, the newest in batches, the last batch also gets the oldest row of the
+    first card of the history, older than that card's last known transaction"""
+    cut = int(len(df) * share)
+    history, rest = df.iloc[:cut], df.iloc[cut:]
+    late = history.index[history['cc_num'] == history['cc_num'].iloc[0]][0]
+    parts = [df.loc[part] for part in np.array_split(rest.index, batches)]
+    parts[-1] = pd.concat([parts[-1], df.loc[[late]]])
+    return history.drop(index=late), parts
+
+
+def late_rows(dataset, batch):
+    """rows of batch older than their card's last transaction in dataset"""
+    last_time = batch['cc_num'].map(dataset.time_gaps['last_time'])
+    return int((pd.to_datetime(batch['trans_date_trans_time']) < last_time).sum())
+
+
+def check_equal(full, incremental):
+    """assert the fraud stats, time gaps and card rows of incremental match full"""
+    for dim, table in full.fraud_stats.items():
+        pd.testing.assert_frame_equal(incremental.fraud_stats[dim], table, obj=f"fraud stats of {dim}")
+    pd.testing.assert_frame_equal(incremental.time_gaps.sort_index()[TIME_GAP_SUMS],
+                                  full.time_gaps.sort_index()[TIME_GAP_SUMS], obj="time gap sums")
+    pd.testing.assert_series_equal(incremental.time_gaps.sort_index()['last_time'],
+                                   full.time_gaps.sort_index()['last_time'], obj="time gap last times")
+    assert sorted(incremental.card_index.offsets) == sorted(full.card_index.offsets), "indexed cards"
+    full_times = full.data['trans_date_trans_time'].to_numpy()
+    times = incremental.data['trans_date_trans_time'].to_numpy()
+    for cc in full.card_index.offsets:
+        expected = full.data.take(full.card_index.positions(cc, full_times))
+        rows = incremental.data.take(incremental.card_index.positions(cc, times))
+        assert rows['trans_date_trans_time'].is_monotonic_increasing, f"card {cc} out of time order"
+        # transactions at the same time may come in either order
+        assert sorted(rows['trans_num']) == sorted(expected['trans_num']), f"rows of card {cc}"
+        assert (rows['trans_date_trans_time'].to_numpy() == expected['trans_date_trans_time'].to_numpy()).all(), \
+            f"times of card {cc}"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--batches", type=int, default=3)
+    parser.add_argument("--split", type=float, default=0.7, help="share of the rows in the history")
+    args = parser.parse_args()
+
+    df = make_transactions(args.rows)
+    start = time.perf_counter()
+    full = IncrementalDataset(df)
+    t_full = time.perf_counter() - start
+
+    print(f"{'split':<8} {'batches':>7} {'late rows':>10} {'rebuild s':>10} {'append s':>9}  check")
+    for name, (history, batches) in {'random': split_random(df, args.split, args.batches),
+                                     'ordered': split_ordered(df, args.split, args.batches)}.items():
+        dataset = IncrementalDataset(history)
+        late, t_append = 0, 0.0
+        for batch in batches:
+            late += late_rows(dataset, batch)
+            start = time.perf_counter()
+            dataset.append(batch)
+            t_append += time.perf_counter() - start
+        check_equal(full, dataset)
+        print(f"{name:<8} {len(batches):>7} {late:>10} {t_full:>10.3f} {t_append:>9.3f}  ok")
+
+
+if __name__ == "__main__":
+    main()
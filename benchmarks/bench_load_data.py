@@ -0,0 +1,40 @@
+"""cold start of load_data: bz2 csv parse vs parquet cache
+usage: python -m benchmarks.bench_load_data [--rows 1300000] [--datapath path.csv.bz2]"""
+import argparse
+import os
+import tempfile
+import time
+import pandas as pd
+from benchmarks.synthetic import write_transactions
+from util.helper_function import read_data
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_300_000)
+    parser.add_argument("--datapath", default=None, help="existing csv.bz2, synthetic data is generated otherwise")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        datapath = args.datapath or write_transactions(os.path.join(tmpdir, "transactions.csv.bz2"), args.rows)
+        cachepath = os.path.join(tmpdir, "transactions.parquet")
+
+        df, t_csv = timed(pd.read_csv, datapath)
+        _, t_build = timed(read_data, datapath, cachepath)
+        _, t_cache = timed(read_data, datapath, cachepath)
+
+        print(f"rows: {len(df):,}")
+        print(f"bz2 csv read (before):     {t_csv:8.2f}s")
+        print(f"first read + cache build:  {t_build:8.2f}s")
+        print(f"parquet cache read (after):{t_cache:8.2f}s")
+        print(f"speedup: {t_csv / t_cache:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
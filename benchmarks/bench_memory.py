@@ -0,0 +1,50 @@
+"""memory footprint of the transaction frame with the dtype plan against the untyped frame the pages used to build
+usage: python -m benchmarks.bench_memory [--rows 1000000] [--datapath path.csv.bz2]"""
+import argparse
+import os
+import tempfile
+import pandas as pd
+from benchmarks.synthetic import write_transactions
+from util.helper_function import read_raw_data, enrich_data, compare_memory
+
+
+def legacy_frame(datapath):
+    """previous load_data plus the derived columns the pages added: object strings, 64-bit numbers, tuples"""
+    data = pd.read_csv(datapath, compression='bz2')
+    trans_time = pd.to_datetime(data['trans_date_trans_time'])
+    data['age'] = 2024 - pd.to_datetime(data['dob']).dt.year
+    data['age_group'] = pd.cut(data['age'], bins=list(range(0, 101, 5)))
+    data['card_bin'] = data['cc_num'].astype(str).str[:6]
+    data['day_of_week'] = trans_time.dt.day_name()
+    data['trans_hour'] = trans_time.dt.hour.astype('int64')
+    data['timeperiod'] = data['trans_hour'].apply(
+        lambda x: "morning" if 6 <= x < 12 else "noon" if 12 <= x < 14 else "afternoon" if 14 <= x < 18
+        else "evening" if 18 <= x < 22 else "midnight")
+    data['fraud_amt'] = data['amt'] * (data['is_fraud'] == 1)
+    data['name'] = data['first'] + ' ' + data['last']
+    data['lat_long'] = list(zip(data.lat, data.long))
+    data['merch_lat_long'] = list(zip(data.merch_lat, data.merch_long))
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--datapath", default=None, help="existing csv.bz2, synthetic data is generated otherwise")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        datapath = args.datapath or write_transactions(os.path.join(tmpdir, "transactions.csv.bz2"), args.rows)
+        before = legacy_frame(datapath)
+        after = enrich_data(read_raw_data(datapath))
+
+    report = compare_memory(before, after)
+    with pd.option_context('display.max_rows', None, 'display.max_columns', None, 'display.width', 200):
+        print(report)
+    total = report.loc['total']
+    print(f"rows: {len(after):,}  before: {total['MB_before']:,.0f} MB  after: {total['MB_after']:,.0f} MB  "
+          f"({total['MB_before'] / total['MB_after']:.1f}x smaller)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""rows/sec of pre_process on synthetic uploads, against the row-wise implementation it replaced
+usage: python -m benchmarks.bench_pre_process [--rows 10000 100000 1000000] [--legacy-max-rows 100000]"""
+import argparse
+import pickle
+import time
+import numpy as np
+import pandas as pd
+from benchmarks.synthetic import make_transactions
+from util.helper_function import pre_process, haversine, load_encoders, CATEGORICAL_COLS, NUMERIC_COLS, DICTPATH
+
+
+def legacy_pre_process(df, cate_cols=CATEGORICAL_COLS, numeric_cols=NUMERIC_COLS):
+    """previous implementation: row-wise haversine and df.replace per column"""
+    df['trans_datetime'] = pd.to_datetime(df.trans_date_trans_time)
+    df['age'] = ((df.trans_datetime - pd.to_datetime(df.dob)).dt.days/365).round()
+    df['distance_km'] = df.apply(lambda row: haversine(row['lat'], row['long'], row['merch_lat'], row['merch_long']), axis=1)
+    with open(DICTPATH, 'rb') as f:
+        dict_all_loaded = pickle.load(f)
+    for col in cate_cols:
+        df.replace(dict_all_loaded[col], inplace=True)
+    return pd.DataFrame(df[cate_cols + numeric_cols]), df.is_fraud
+
+
+def rows_per_sec(fn, df):
+    start = time.perf_counter()
+    result = fn(df)
+    return result, len(df) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--legacy-max-rows", type=int, default=100_000,
+                        help="skip the legacy implementation above this size, it takes minutes")
+    args = parser.parse_args()
+
+    encoders = load_encoders()
+    print(f"{'rows':>10} {'vectorized rows/s':>18} {'legacy rows/s':>14} {'speedup':>8}")
+    for n_rows in args.rows:
+        df = make_transactions(n_rows)
+        (X, _), vec_rate = rows_per_sec(lambda d: pre_process(d, encoders=encoders), df)
+        legacy = "-"
+        speedup = "-"
+        if n_rows <= args.legacy_max_rows:
+            (X_old, _), old_rate = rows_per_sec(legacy_pre_process, df.copy())
+            assert np.allclose(X.to_numpy(dtype=float), X_old.to_numpy(dtype=float))
+            legacy = f"{old_rate:,.0f}"
+            speedup = f"{vec_rate / old_rate:.0f}x"
+        print(f"{n_rows:>10,} {vec_rate:>18,.0f} {legacy:>14} {speedup:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""seconds and per-process memory of the page queries on the pandas and duckdb query backends
+usage: python -m benchmarks.bench_query_backend [--rows 100000 1000000] [--datapath data.parquet] [--cards 20]
+
+Each backend runs in a fresh spawned process over the same parquet file: every fraud
+stats dimension, the high risk summaries of the transactional page and --cards card
+lookups. The pandas backend first loads the dataset into memory, which counts
+towards its time and memory."""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from benchmarks.synthetic import make_transactions
+from benchmarks.suite import _peak_rss_mb
+
+
+def _rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 2**10
+    return _peak_rss_mb()
+
+
+def run_backend(name, path, n_cards):
+    import pandas as pd
+    from util.helper_function import DuckDBBackend, PandasBackend, IncrementalDataset, FRAUD_STAT_DIMENSIONS
+    from util.aggregates import HIGH_RISK_SUMMARIES
+    before = _rss_mb()
+    times = {}
+    start = time.perf_counter()
+    backend = DuckDBBackend([path]) if name == 'duckdb' else PandasBackend(IncrementalDataset(pd.read_parquet(path)))
+    times['load'] = time.perf_counter() - start
+    start = time.perf_counter()
+    for dim in FRAUD_STAT_DIMENSIONS:
+        backend.fraud_stats(dim)
+    times['fraud stats'] = time.perf_counter() - start
+    start = time.perf_counter()
+    for key, extra_keys in HIGH_RISK_SUMMARIES.items():
+        backend.high_risk_summary(key, extra_keys)
+    times['high risk'] = time.perf_counter() - start
+    cards = pd.read_parquet(path, columns=['cc_num'])['cc_num'].drop_duplicates().iloc[:n_cards].tolist()
+    start = time.perf_counter()
+    for cc in cards:
+        backend.card_transactions(cc)
+    times['card ms'] = (time.perf_counter() - start) / len(cards) * 1000
+    return times, _rss_mb() - before, _peak_rss_mb()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--datapath", help="parquet file of transactions instead of synthetic data")
+    parser.add_argument("--cards", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'backend':>8} {'load s':>7} {'stats s':>8} {'high risk s':>12} {'card ms':>8} "
+          f"{'RSS +MB':>8} {'peak MB':>8}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for n_rows in ([None] if args.datapath else args.rows):
+            path = args.datapath
+            if path is None:
+                from util.helper_function import apply_dtype_plan
+                path = os.path.join(tmpdir, f"transactions_{n_rows}.parquet")
+                apply_dtype_plan(make_transactions(n_rows)).to_parquet(path, index=False)
+            for name in ('pandas', 'duckdb'):
+                with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+                    times, rss, peak = pool.submit(run_backend, name, path, args.cards).result()
+                rows = f"{n_rows:,}" if n_rows else os.path.basename(path)
+                print(f"{rows:>10} {name:>8} {times['load']:>7.2f} {times['fraud stats']:>8.2f} "
+                      f"{times['high risk']:>12.2f} {times['card ms']:>8.1f} {rss:>8.0f} {peak:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
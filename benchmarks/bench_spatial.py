@@ -0,0 +1,55 @@
+"""build time and query latency of the grid spatial index against a full haversine scan, and hexbin time
+usage: python -m benchmarks.bench_spatial [--rows 10000 100000 1000000] [--queries 200] [--radius-km 50] [--k 20]
+
+Queries are centered on random merchant locations of the data. Every index result is
+checked against the scan, the k nearest by distance."""
+import argparse
+import time
+import numpy as np
+from benchmarks.synthetic import make_transactions
+from util.helper_function import haversine
+from util.spatial import GridIndex, hexbin_fraud
+
+
+def per_query_ms(fn, centers):
+    start = time.perf_counter()
+    results = [fn(lat, long) for lat, long in centers]
+    return results, (time.perf_counter() - start) / len(centers) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--radius-km", type=float, default=50)
+    parser.add_argument("--k", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'build s':>8} {'hexbin s':>9} {'radius ms':>10} {'scan ms':>8} "
+          f"{'knn ms':>7} {'knn scan ms':>12}")
+    for n_rows in args.rows:
+        df = make_transactions(n_rows)
+        lat, long = df['merch_lat'].to_numpy(), df['merch_long'].to_numpy()
+        start = time.perf_counter()
+        index = GridIndex(lat, long)
+        build = time.perf_counter() - start
+        start = time.perf_counter()
+        hexbin_fraud(lat, long, df['is_fraud'].to_numpy())
+        hexbin = time.perf_counter() - start
+        rows = np.random.default_rng(0).choice(n_rows, args.queries)
+        centers = list(zip(lat[rows], long[rows]))
+
+        found, radius_ms = per_query_ms(lambda a, b: index.within(a, b, args.radius_km)[0], centers)
+        scanned, scan_ms = per_query_ms(lambda a, b: np.flatnonzero(haversine(a, b, lat, long) <= args.radius_km),
+                                        centers)
+        assert all(np.array_equal(np.sort(f), s) for f, s in zip(found, scanned))
+        nearest, knn_ms = per_query_ms(lambda a, b: index.nearest(a, b, args.k)[1], centers)
+        nearest_scan, knn_scan_ms = per_query_ms(
+            lambda a, b: np.sort(np.partition(haversine(a, b, lat, long), args.k)[:args.k]), centers)
+        assert all(np.allclose(f, s) for f, s in zip(nearest, nearest_scan))
+        print(f"{n_rows:>10,} {build:>8.3f} {hexbin:>9.3f} {radius_ms:>10.3f} {scan_ms:>8.3f} "
+              f"{knn_ms:>7.3f} {knn_scan_ms:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""rows/sec of the velocity features in batch mode, chunked batches and one event at a time
+usage: python -m benchmarks.bench_velocity [--rows 10000 100000 1000000] [--chunks 10] [--online-max-rows 100000]"""
+import argparse
+import time
+import numpy as np
+from benchmarks.synthetic import make_transactions
+from util.velocity import VelocityEngine, VELOCITY_INPUT_COLS
+
+
+def rows_per_sec(fn, n_rows):
+    start = time.perf_counter()
+    result = fn()
+    return result, n_rows / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--chunks", type=int, default=10, help="chunks of the chunked batch run")
+    parser.add_argument("--online-max-rows", type=int, default=100_000,
+                        help="skip the one event at a time run above this size")
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'batch rows/s':>13} {'chunked rows/s':>15} {'online rows/s':>14} {'max diff':>9}")
+    for n_rows in args.rows:
+        df = make_transactions(n_rows)[VELOCITY_INPUT_COLS].sort_values('trans_date_trans_time', kind='stable')
+        full, batch_rate = rows_per_sec(lambda: VelocityEngine().batch(df), n_rows)
+        engine = VelocityEngine()
+        bounds = np.linspace(0, n_rows, args.chunks + 1).astype(int)
+        _, chunked_rate = rows_per_sec(lambda: [engine.batch(df.iloc[lo:hi]) for lo, hi in zip(bounds, bounds[1:])],
+                                       n_rows)
+        online, diff = "-", "-"
+        if n_rows <= args.online_max_rows:
+            engine = VelocityEngine()
+            records = df.to_dict('records')
+            rows, online_rate = rows_per_sec(lambda: [engine.update_record(record) for record in records], n_rows)
+            diff = f"{np.nanmax(np.abs(full.to_numpy() - np.array([list(r.values()) for r in rows]))):.0e}"
+            online = f"{online_rate:,.0f}"
+        print(f"{n_rows:>10,} {batch_rate:>13,.0f} {chunked_rate:>15,.0f} {online:>14} {diff:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""seconds until every cache component is ready, warmed one after another and concurrently with Warmup
+usage: python -m benchmarks.bench_warmup [--repeat 3]
+
+Each mode runs in a fresh spawned process over the data in util/data (and the aggregate
+build, if any), as on server start. Sequential runs the components in the order of
+COMPONENTS, concurrent is the thread pool of the server warm-up. Every column is the
+time from the start until that component is ready, the total until all are.
+The run with the median total is reported."""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+
+def run_warmup(mode):
+    import warnings
+    warnings.simplefilter("ignore")
+    sys.path.insert(0, os.getcwd())
+    from streamlit.logger import set_log_level
+    set_log_level("error")
+    from util.warmup import COMPONENTS, Warmup
+    start = time.perf_counter()
+    if mode == 'sequential':
+        seconds = {}
+        for name, warm in COMPONENTS.items():
+            warm()
+            seconds[name] = time.perf_counter() - start
+    else:
+        warmup = Warmup()
+        warmup.wait()
+        seconds = {name: state['seconds'] for name, state in warmup.status().items()}
+    return seconds, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    from util.warmup import COMPONENTS
+    print(f"{'mode':<12}" + "".join(f"{name + ' s':>14}" for name in COMPONENTS) + f"{'total s':>10}")
+    for mode in ('sequential', 'concurrent'):
+        runs = []
+        for _ in range(args.repeat):
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+                runs.append(pool.submit(run_warmup, mode).result())
+        run = sorted(runs, key=lambda run: run[1])[len(runs) // 2]
+        print(f"{mode:<12}" + "".join(f"{run[0][name]:>14.2f}" for name in COMPONENTS) + f"{run[1]:>10.2f}")
+    print(f"{os.cpu_count()} cpu")
+
+
+if __name__ == "__main__":
+    main()
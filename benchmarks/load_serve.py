@@ -0,0 +1,53 @@
+"""load test for the local scoring service (python -m util.serve)
+usage: python -m benchmarks.load_serve [--port 8765] [--concurrency 64] [--requests 20000]"""
+import argparse
+import asyncio
+import json
+import time
+import numpy as np
+from benchmarks.synthetic import make_transactions
+
+
+async def client(host, port, records, latencies):
+    reader, writer = await asyncio.open_connection(host, port)
+    for record in records:
+        body = json.dumps(record).encode()
+        start = time.perf_counter()
+        writer.write(f"POST /score HTTP/1.1\r\nHost: {host}\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+        await writer.drain()
+        headers = {}
+        await reader.readline()
+        while (line := await reader.readline()) != b'\r\n':
+            name, _, value = line.decode().partition(':')
+            headers[name.strip().lower()] = value.strip()
+        await reader.readexactly(int(headers['content-length']))
+        latencies.append(time.perf_counter() - start)
+    writer.close()
+
+
+async def run(host, port, concurrency, n_requests):
+    records = make_transactions(n_requests).astype({'trans_date_trans_time': str}).to_dict('records')
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*[client(host, port, records[i::concurrency], latencies) for i in range(concurrency)])
+    seconds = time.perf_counter() - start
+    ms = np.array(latencies) * 1000
+    print(f"{len(ms):,} requests, concurrency {concurrency}: {len(ms) / seconds:,.0f} req/s, "
+          f"p50 {np.percentile(ms, 50):.2f} ms, p99 {np.percentile(ms, 99):.2f} ms")
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(f"GET /stats HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n".encode())
+    print("server stats:", (await reader.read()).split(b'\r\n\r\n', 1)[1].decode())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=20_000)
+    args = parser.parse_args()
+    asyncio.run(run(args.host, args.port, args.concurrency, args.requests))
+
+
+if __name__ == "__main__":
+    main()
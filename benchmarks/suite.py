@@ -0,0 +1,231 @@
+"""benchmark suite for the data and scoring hot paths, on synthetic data in the Kaggle schema
+usage: python -m benchmarks.suite [--rows 10000 100000 1000000 5000000] [--cases pre_process haversine]
+                                  [--repeat 3] [--tolerance 0.2] [--save-baseline]
+
+Every case runs in a fresh process, so peak RSS is per case: setup_rss_mb is the
+peak after loading the inputs and peak_rss_mb the peak after running the case.
+Results are compared with benchmarks/baseline.json (rows/sec may not drop, and peak
+RSS may not grow, by more than the tolerance) and the exit code is 1 on a regression.
+Synthetic inputs are generated once per size into benchmarks/.data/, no real csv or
+network is needed. Baselines are machine specific, save one on the machine that checks it."""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+import pandas as pd
+from benchmarks.synthetic import write_transactions
+
+SIZES = [10_000, 100_000, 1_000_000, 5_000_000]
+DATA_DIR = os.path.join(os.path.dirname(__file__), ".data")
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+def _quiet_streamlit():
+    # st.cache_data warns on every call outside a streamlit server
+    from streamlit.logger import set_log_level
+    set_log_level("error")
+
+
+def dataset(n_rows, data_dir=DATA_DIR):
+    """paths of the synthetic csv.bz2 and its typed parquet cache, generated on first use"""
+    _quiet_streamlit()
+    from util.helper_function import read_data
+    os.makedirs(data_dir, exist_ok=True)
+    datapath = os.path.join(data_dir, f"transactions_{n_rows}.csv.bz2")
+    cachepath = os.path.join(data_dir, f"transactions_{n_rows}.parquet")
+    if not os.path.exists(datapath):
+        tmppath = os.path.join(data_dir, f"transactions_{n_rows}.tmp.csv.bz2")
+        write_transactions(tmppath, n_rows)
+        os.replace(tmppath, datapath)
+    read_data(datapath, cachepath)
+    return datapath, cachepath
+
+
+# each case: setup(datapath, cachepath) -> inputs, run(inputs)
+def _setup_typed(datapath, cachepath):
+    return pd.read_parquet(cachepath)
+
+
+def _setup_features(datapath, cachepath, engine='pickle'):
+    from util.helper_function import pre_process, prediction_model, load_encoders
+    X, _ = pre_process(pd.read_parquet(cachepath), encoders=load_encoders())
+    return prediction_model(engine=engine), X
+
+
+def _setup_flat_features(datapath, cachepath):
+    return _setup_features(datapath, cachepath, engine='flat')
+
+
+def _setup_enriched(datapath, cachepath):
+    from util.helper_function import enrich_data
+    return enrich_data(pd.read_parquet(cachepath))
+
+
+def _run_pre_process(df):
+    from util.helper_function import pre_process, load_encoders
+    return pre_process(df, encoders=load_encoders())
+
+
+def _run_haversine(df):
+    from util.helper_function import haversine
+    return haversine(df['lat'].to_numpy(), df['long'].to_numpy(), df['merch_lat'].to_numpy(), df['merch_long'].to_numpy())
+
+
+def _run_fraud_rate(df):
+    from util.helper_function import calculate_fraud_rate
+    return calculate_fraud_rate(df, 'merchant')
+
+
+def _run_time_gaps(df):
+    from util.helper_function import card_time_gaps
+    return card_time_gaps(df)
+
+
+def _run_predict(inputs):
+    model, X = inputs
+    return model.predict(X)
+
+
+def _run_load_csv(paths):
+    from util.helper_function import read_raw_data
+    return read_raw_data(paths[0])
+
+
+def _run_load_cache(paths):
+    from util.helper_function import read_data
+    return read_data(*paths)
+
+
+CASES = {
+    'load_data_csv': (lambda d, c: (d, c), _run_load_csv),
+    'load_data_cache': (lambda d, c: (d, c), _run_load_cache),
+    'pre_process': (_setup_typed, _run_pre_process),
+    'haversine': (_setup_typed, _run_haversine),
+    'calculate_fraud_rate': (_setup_typed, _run_fraud_rate),
+    'card_time_gaps': (_setup_enriched, _run_time_gaps),
+    'model_predict': (_setup_features, _run_predict),
+    'model_predict_flat': (_setup_flat_features, _run_predict),
+}
+
+
+def _peak_rss_mb():
+    # VmHWM is this process's own high water mark, ru_maxrss carries over from the parent on linux
+    if os.path.exists("/proc/self/status"):
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 2**10
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macOS
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+
+def run_case(name, n_rows, datapath, cachepath, repeat):
+    """time one case in the current process, best of repeat"""
+    _quiet_streamlit()
+    import util.helper_function  # noqa: F401, imports count towards the setup, not the case
+    setup, run = CASES[name]
+    inputs = setup(datapath, cachepath)
+    setup_rss = _peak_rss_mb()
+    run(inputs)  # warm up lazy imports and artifact loads
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run(inputs)
+        times.append(time.perf_counter() - start)
+    seconds = min(times)
+    return {
+        'case': name,
+        'rows': n_rows,
+        'seconds': round(seconds, 6),
+        'rows_per_sec': round(n_rows / seconds, 1),
+        'setup_rss_mb': round(setup_rss, 1),
+        'peak_rss_mb': round(_peak_rss_mb(), 1),
+    }
+
+
+def run_isolated(name, n_rows, datapath, cachepath, repeat):
+    """run_case in a fresh spawned process, so RSS does not carry over between cases"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+        return pool.submit(run_case, name, n_rows, datapath, cachepath, repeat).result()
+
+
+def machine():
+    return {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+            'pandas': pd.__version__}
+
+
+def read_baseline(path=BASELINE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(results, path=BASELINE_PATH):
+    """merge results into the stored baseline, keyed by case and rows"""
+    baseline = read_baseline(path)
+    baseline['machine'] = machine()
+    stored = baseline.setdefault('results', {})
+    for result in results:
+        stored[f"{result['case']}@{result['rows']}"] = result
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+
+
+def compare(result, baseline, tolerance):
+    """ratio of throughput and peak RSS against the baseline, and whether either regressed"""
+    before = baseline.get('results', {}).get(f"{result['case']}@{result['rows']}")
+    if before is None:
+        return None, None, False
+    speed = result['rows_per_sec'] / before['rows_per_sec']
+    memory = result['peak_rss_mb'] / before['peak_rss_mb']
+    return speed, memory, speed < 1 - tolerance or memory > 1 + tolerance
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.suite")
+    parser.add_argument("--rows", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per case, the fastest counts")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--json", default=None, help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    baseline = read_baseline(args.baseline)
+    results = []
+    regressed = False
+    print(f"{'case':>22} {'rows':>10} {'seconds':>9} {'rows/s':>13} {'setup MB':>9} {'peak MB':>8} "
+          f"{'vs baseline':>12}")
+    for n_rows in args.rows:
+        datapath, cachepath = dataset(n_rows)
+        for name in args.cases:
+            result = run_isolated(name, n_rows, datapath, cachepath, args.repeat)
+            results.append(result)
+            speed, memory, is_regression = compare(result, baseline, args.tolerance)
+            regressed |= is_regression
+            versus = "-" if speed is None else f"{speed:.2f}x/{memory:.2f}m" + (" !" if is_regression else "")
+            print(f"{name:>22} {n_rows:>10,} {result['seconds']:>9.4f} {result['rows_per_sec']:>13,.0f} "
+                  f"{result['setup_rss_mb']:>9.1f} {result['peak_rss_mb']:>8.1f} {versus:>12}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'machine': machine(), 'results': results}, f, indent=2)
+    if args.save_baseline:
+        save_baseline(results, args.baseline)
+        print(f"baseline saved to {args.baseline}")
+    elif regressed:
+        print(f"regression beyond {args.tolerance:.0%} of the baseline (throughput x / peak RSS m)")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+import pickle
+import numpy as np
+import pandas as pd
+
+DICTPATH = "util/dict_all.obj"
+
+FIRST_NAMES = ['Jennifer', 'Stephanie', 'Edward', 'Jeremy', 'Tyler', 'Misty', 'Jason', 'Joseph',
+               'Cynthia', 'James', 'Steven', 'Jordan', 'Jeffrey', 'Mary', 'Linda', 'David']
+LAST_NAMES = ['Banks', 'Gill', 'Sanchez', 'White', 'Garcia', 'Murray', 'Arnold', 'May',
+              'Strickland', 'Davis', 'Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Miller']
+STREET_SUFFIX = ['Cove', 'Rest', 'Course', 'Lake', 'Forges', 'Underpass', 'Road', 'Street']
+SYLLABLES = ['ba', 'ker', 'son', 'ril', 'mo', 'ton', 'la', 'vel', 'an', 'der', 'ro', 'wick']
+
+
+def _encoder_keys(dictpath=DICTPATH):
+    with open(dictpath, 'rb') as f:
+        dict_all = pickle.load(f)
+    return {col: np.array(sorted(mapping.keys()), dtype=object) for col, mapping in dict_all.items()}
+
+
+def make_transactions(n_rows, n_cards=1000, fraud_rate=0.0058, seed=42, dictpath=DICTPATH):
+    """synthetic transactions with the same columns and dtypes as the Kaggle csv
+    categorical values are drawn from the encoder dictionaries so the model can score them"""
+    rng = np.random.default_rng(seed)
+    keys = _encoder_keys(dictpath)
+
+    # one fixed identity per card, like the real data
+    cards = pd.DataFrame({
+        'cc_num': rng.integers(10**11, 10**16, n_cards, dtype=np.int64),
+        'first': rng.choice(FIRST_NAMES, n_cards),
+        'last': rng.choice(LAST_NAMES + [(a + b + c).title() for a in SYLLABLES for b in SYLLABLES for c in SYLLABLES[:3]], n_cards),
+        'gender': rng.choice(keys['gender'], n_cards),
+        'street': [f"{n} {s}" for n, s in zip(rng.integers(1, 99999, n_cards), rng.choice(STREET_SUFFIX, n_cards))],
+        'city': rng.choice(keys['city'], n_cards),
+        'state': rng.choice(keys['state'], n_cards),
+        'zip': rng.integers(1000, 99999, n_cards),
+        'lat': rng.uniform(25, 48, n_cards).round(4),
+        'long': rng.uniform(-124, -68, n_cards).round(4),
+        'city_pop': rng.integers(100, 2_000_000, n_cards),
+        'job': rng.choice(keys['job'], n_cards),
+        'dob': (pd.Timestamp('1930-01-01') + pd.to_timedelta(rng.integers(0, 26000, n_cards), unit='D')).strftime('%Y-%m-%d'),
+    })
+
+    card_idx = rng.integers(0, n_cards, n_rows)
+    unix_time = np.sort(rng.integers(1325376018, 1371817018, n_rows))
+    trans_time = pd.to_datetime(unix_time + 220924800, unit='s')
+    df = cards.iloc[card_idx].reset_index(drop=True)
+    df.insert(0, 'trans_date_trans_time', trans_time.strftime('%Y-%m-%d %H:%M:%S'))
+    df.insert(2, 'merchant', rng.choice(keys['merchant'], n_rows))
+    df.insert(3, 'category', rng.choice(keys['category'], n_rows))
+    df.insert(4, 'amt', rng.lognormal(3.5, 1.2, n_rows).round(2))
+    hi, lo = rng.integers(0, 2**63, (2, n_rows))
+    df['trans_num'] = [f"{a:016x}{b:016x}" for a, b in zip(hi, lo)]
+    df['unix_time'] = unix_time
+    df['merch_lat'] = (df['lat'] + rng.uniform(-1, 1, n_rows)).round(6)
+    df['merch_long'] = (df['long'] + rng.uniform(-1, 1, n_rows)).round(6)
+    # fraud is concentrated on a few compromised cards, as in the real data
+    compromised = rng.random(n_cards) < 0.02
+    card_fraud_rate = np.where(compromised, 0.25, fraud_rate / 3)
+    df['is_fraud'] = (rng.random(n_rows) < card_fraud_rate[card_idx]).astype(np.int64)
+    merch_zipcode = rng.integers(1000, 99999, n_rows).astype(float)
+    merch_zipcode[rng.random(n_rows) < 0.15] = np.nan
+    df['merch_zipcode'] = merch_zipcode
+    df.insert(0, 'Unnamed: 0', np.arange(n_rows))
+    df = df[['Unnamed: 0', 'trans_date_trans_time', 'cc_num', 'merchant', 'category', 'amt', 'first', 'last',
+             'gender', 'street', 'city', 'state', 'zip', 'lat', 'long', 'city_pop', 'job', 'dob', 'trans_num',
+             'unix_time', 'merch_lat', 'merch_long', 'is_fraud', 'merch_zipcode']]
+    return df
+
+
+def write_transactions(path, n_rows, **kwargs):
+    """write a synthetic dataset, bz2 compressed when the path ends with .bz2"""
+    df = make_transactions(n_rows, **kwargs)
+    df.to_csv(path, index=False, compression='bz2' if str(path).endswith('.bz2') else None)
+    return path
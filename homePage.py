@@ -1,5 +1,7 @@
 import streamlit as st
-from util.helper_function import load_data
+from util.helper_function import load_data, load_dataset_summary
+from util.profiling import start_page, step, finish_page
+from util.warmup import start_warmup, warmup_status
 
 st.set_page_config(
     page_title="Group 7 Final Project",
@@ -7,6 +9,7 @@ st.set_page_config(
     layout="wide",
     initial_sidebar_state="expanded"
 )
+start_page("Home")
 
 "## Data-Driven Insights for Detection and Prevention of Credit Card Fraud"
 "#### IS5126 Final Project - Group 7"
@@ -19,10 +22,23 @@ with col1:
         "Zhao Xinyan"
         "Zheng Zhiqing"
 "---"
-with st.spinner('Loading dataset, please wait...'):
-    data = load_data()
-    st.info('##### Dataset loaded! *Select a page on the sidebar to continue.*')
-    st.image("meme.png",  use_column_width=False)
-    "Preview of Dataset:"
-    f"Rows, Columns: {data.shape}"
-    st.write(data.head())
\ No newline at end of file
+# shape and preview from the parquet footers and first rows, the full dataset is loaded by the pages that need it
+with step("dataset summary"):
+    summary = load_dataset_summary()
+if summary is None:
+    with st.spinner('Loading dataset, please wait...'):
+        with step("load data"):
+            data = load_data()
+        summary = (*data.shape, data.head())
+rows, columns, preview = summary
+st.info('##### Dataset ready! *Select a page on the sidebar to continue.*')
+st.image("meme.png",  use_column_width=False)
+"Preview of Dataset:"
+f"Rows, Columns: {(rows, columns)}"
+st.write(preview)
+
+# the first run of the server process starts loading the data, aggregates and model in the background,
+# once this page, which needs none of them, is done
+start_warmup()
+warmup_status()
+finish_page()
@@ -1,12 +1,12 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-import plotly.graph_objects as go
-from scipy import stats
-from util.helper_function import load_data
-import plotly.express as px
+from util.helper_function import card_transactions
+from util.aggregates import load_aggregate, data_fingerprint
+from util.charts import counts_trace
+from util.figure_cache import show_plotly
+from util.profiling import start_page, step, section, finish_page
+from util.warmup import start_warmup, ready, warmup_status
 
 st.set_page_config(
     page_title="Behavioral Analysis",
@@ -14,34 +14,21 @@ st.set_page_config(
     layout="wide",
     initial_sidebar_state="expanded"
 )
+start_page("Behavioral Analysis")
 
 
-## data processing
-data = load_data()
-data['cc_num']=data['cc_num'].astype(str)
-
-# transform the date column to weekday
-data["day_of_week"] = pd.to_datetime(data['trans_date_trans_time']).dt.day_name()
-data["age"] = 2024 - data["dob"].apply(lambda x: int(x.split("-")[0]))
-data["date"] = pd.to_datetime(data["trans_date_trans_time"]).dt.date
-data["trans_hour"] = pd.to_datetime(data["trans_date_trans_time"]).dt.hour
-data["timeperiod"] = data["trans_hour"].apply(
-    lambda x: "morning" if 6 <= x < 12 else
-              "noon" if 12 <= x < 14 else
-              "afternoon" if 14 <= x < 18 else
-              "evening" if 18 <= x < 22 else
-              "midnight"
-)
-is_fraud = data[data["is_fraud"]==1]
-not_fraud = data[data["is_fraud"]==0]
-# 计算男女的欺诈交易比例
-fraud_counts = data[data["is_fraud"] == 1].groupby("gender").size()
-total_counts = data.groupby("gender").size()
-fraud_ratio = fraud_counts / total_counts
-# 将数据转换为DataFrame以便于绘图
-fraud_ratio_df = fraud_ratio.reset_index()
-fraud_ratio_df.columns = ['gender', 'fraud_ratio']
+def histogram_traces(name):
+    """fraud and non fraud traces of a class_histogram aggregate"""
+    table = load_aggregate(name)
+    edges = np.append(table['left'].to_numpy(), table['right'].iat[-1])
+    totals = table.attrs['totals']
+    return (counts_trace(edges, table['fraud'], totals['fraud'], name='Fraud', marker_color='red', opacity=0.5),
+            counts_trace(edges, table['not_fraud'], totals['not_fraud'], name='Non-Fraud', marker_color='green',
+                         opacity=0.5))
 tab1, tab2 = st.tabs(["Behavioral","Customer"])
+start_warmup()
+# figures are cached per data version, a rerun only builds the ones whose widgets changed
+version = data_fingerprint()
 
 
 
@@ -53,310 +40,310 @@ with tab1:
     st.write("1. Fraudulent transactions are more likely to occur consecutively.\n2. Fraudulent transactions are slightly more likely to occur on weekends.\n3. Fraudulent transactions are more likely to occur in the midnight.\n4. Fraudulent transactions are more likely to occur in online activities.")
 
     st.write("\n\n\n")
-    #########1. Consecutive Transactions#########
-    st.write("### Consecutive Transactions")
-    st.write("The table below displays the credit card numbers with the highest number of consecutive transactions. The line plot highlights the exact times when fraud occurs, marked with red dots. ")
-    st.write("The chart highlights that fraudulent transactions often appear clustered within a short period This visual pattern is consistent with scenarios involving card theft or unauthorized use, where fraudsters rapidly perform a series of transactions to take advantage of the card before it is reported or blocked. The cluster of red markers indicates consecutive high-value transactions, suggesting that once a fraudster gains access, they act quickly to maximize their illicit use before detection systems or cardholder intervention halt further activity.")
-    cc_cards = data.groupby("cc_num")["is_fraud"].sum().sort_values(ascending=False).reset_index()
-    cc_cards.columns = ["card_number","fraud_count"]
-
-
-    def plot_transcation_of_card(cc_num):
-        a = data[data["cc_num"] == cc_num].reset_index()
-        a.sort_values("trans_date_trans_time")
-        fig = go.Figure()
-
-        # 添加折线图
-        fig.add_trace(go.Scatter(
-            x=a['trans_date_trans_time'],
-            y=a['amt'],
-            mode='lines',
-            name='Amount'
-        ))
-
-        # 添加欺诈交易的红色点
-        fraud_transactions = a[a['is_fraud'] == True]
-        fig.add_trace(go.Scatter(
-            x=fraud_transactions['trans_date_trans_time'],
-            y=fraud_transactions['amt'],
-            mode='markers',
-            marker=dict(color='red'),
-            name='Fraud'
-        ))
-
-        # 添加标题和标签
-        fig.update_layout(
-            title='Transaction Amount Over Time',
-            xaxis_title='Time',
-            yaxis_title='Amount',
-            legend_title='Legend'
-        )
-
-        return fig
-
-
-    col1, col2 = st.columns([1,2])
-    with col1:
-        st.markdown("**Card Number and total fraud count**")
-        st.dataframe(cc_cards)
-    with col2:
-        cc_num = st.selectbox("Select a credit card number", cc_cards["card_number"])
-        st.plotly_chart(plot_transcation_of_card(cc_num))
-    st.write("\n\n\n\n")
-
-    st.write("The following table shows the detailed transactions of the selected credit card number.")
-    fraud_data = data[(data["cc_num"] == cc_num) & (data["is_fraud"] == 1)]
-    st.dataframe(fraud_data)
-
-
-
-    #########2. Day of Week#########
-    st.write("### Fraudulent Transactions by Day of Week")
-    st.write("The bar chart below shows the number of fraudulent transactions that occur on each day of the week. The chart highlights that fraudulent transactions are more likely to occur on weekends, with Sunday having the highest number of fraudulent transactions. This pattern may be due to reduced monitoring or oversight on weekends, making it easier for fraudsters to exploit vulnerabilities in the system.")
-    days_distribution = data.groupby("day_of_week")["is_fraud"].sum().reset_index()
-    days_distri_bar = go.Figure()
-    colors = ['rgb(55, 83, 109)' if day not in ['Saturday', 'Sunday'] else 'red' for day in days_distribution["day_of_week"]]
-
-    days_distri_bar.add_trace(go.Bar(
-        x=days_distribution["day_of_week"],
-        y=days_distribution["is_fraud"],
-        marker_color=colors
-    ))
-    days_distri_bar.add_hline(y=1216, line_dash="dot", line_color="blue", annotation_text="Sunday", annotation_position="bottom right")
-    days_distri_bar.update_layout(
-        title_text="Fraudulent Transactions by Day of Week",
-        xaxis_title="Day of Week",
-        yaxis_title="Number of Fraudulent Transactions",
-        yaxis=dict(range=[0, 2000]),
-        xaxis=dict(categoryorder='array', categoryarray=["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"])
-
-    )
-    st.plotly_chart(days_distri_bar, use_container_width=True)
-
-
-
-    # 获取欺诈交易的类别数据并计数
-    fraud_data = data[data["is_fraud"] == 1]
-    cat_data = fraud_data.groupby("category")["amt"].agg(total_amount="sum", average_amount="mean",count="size").reset_index()
-    cat_data = cat_data.sort_values(by="total_amount", ascending=False)
-
-    #######3. Time Period#########
-    st.write("### Fraudulent Transactions by Time Period")
-    st.write("The chart clearly illustrates that the highest number of fraudulent transactions occur during the midnight period, with a substantial spike compared to other time periods like morning, noon, afternoon, and evening. This pattern suggests that fraudsters prefer late-night hours for their activities, likely because it is a time when cardholders and financial institutions are less active. During these hours, individuals are often asleep, reducing the chance of immediate detection or transaction verification by cardholders.")
-    time_period = data.groupby("timeperiod")["is_fraud"].sum().reset_index()
-    time_period_bar = go.Figure()
-    time_period_bar.add_trace(go.Bar(
-        x=time_period["timeperiod"],
-        y=time_period["is_fraud"],
-        marker_color=['rgb(55, 83, 109)' if day not in ["midnight"] else 'red' for day in time_period["timeperiod"]]
-    ))
-    time_period_bar.update_layout(
-        title_text="Fraudulent Transactions by Time Period",
-        xaxis_title="Time Period",
-        yaxis_title="Number of Fraudulent Transactions",
-        yaxis=dict(range=[0, 2000]),
-        xaxis=dict(categoryorder='array', categoryarray=["morning", "noon", "afternoon", "evening", "midnight"])
-
-    )
-    st.plotly_chart(time_period_bar, use_container_width=True)
-
-    #########4. Category#########
-    st.write("### Fraudulent Transactions by Category")
-
-    cat_pie = go.Figure()   
-    cat_pie.add_trace(go.Pie(
-        labels=cat_data["category"],
-        values=cat_data["count"],
-        hole=0.3
-    ))
-    cat_pie.update_layout(
-        title_text="Fraudulent Transactions by Category"
-    )
-    cat_pie.update_layout(
-        width=800,
-        height=600
-    )
-
-
-
-    cat_bar = go.Figure()
-    # 添加总金额的条形图
-    cat_bar.add_trace(go.Bar(
-        x=cat_data["category"],
-        y=cat_data["total_amount"],
-        name='Total Amount',
-        yaxis='y1'
-    ))
-    # 添加平均金额的折线图
-    cat_bar.add_trace(go.Scatter(
-        x=cat_data["category"],
-        y=cat_data["average_amount"],
-        name='Average Amount',
-        yaxis='y2',
-        mode='lines+markers',
-        line=dict(color='orange')
-    ))
-
-    # 更新布局
-    cat_bar.update_layout(
-        title_text="Fraudulent Transactions by Category",
-        xaxis_title="Category",
-        yaxis=dict(
-            title="Total Amount",
-            titlefont=dict(color="#1f77b4"),
-            tickfont=dict(color="#1f77b4"),
-            side="left"
-        ),
-        yaxis2=dict(
-            title="Average Amount",
-            titlefont=dict(color="orange"),
-            tickfont=dict(color="orange"),
-            overlaying="y",
-            side="right"
-        ),
-        legend=dict(
-            x=0.8,
-            y=0.95,
-            bgcolor='rgba(255, 255, 255, 0)',
-            bordercolor='rgba(255, 255, 255, 0)'
-        )
-    )
-    cat_bar.update_layout(
-        width=800,
-        height=600
-    )
-
-
-    st.plotly_chart(cat_pie, use_container_width=True)
-    st.plotly_chart(cat_bar, use_container_width=True)
-
-
-    st.write("### Fraudulent Transactions by Amount")
-    # 创建重叠的直方图
-    amt_distribution = go.Figure()
-
-
-    # 添加欺诈交易的直方图
-    amt_distribution.add_trace(go.Histogram(
-        x=is_fraud["amt"],
-        histnorm='probability density',
-        name='Fraud',
-        marker_color='red',
-        opacity=0.5
-    ))
-
-    # 添加非欺诈交易的直方图
-    amt_distribution.add_trace(go.Histogram(
-        x=not_fraud["amt"],
-        histnorm='probability density',
-        name='Non-Fraud',
-        marker_color='green',
-        opacity=0.5
-    ))
-
-    # 更新布局
-    amt_distribution.update_layout(
-        title_text='Amount Distribution',
-        xaxis_title_text='Amount',
-        yaxis_title_text='Density',
-        barmode='overlay'
-    )
-    amt_distribution.update_xaxes(range=[0,1500])
-    st.plotly_chart(amt_distribution)
-    
-    st.write("")
-    cards = data['cc_num'].unique().tolist()
-    data["trans_date_trans_time"] = pd.to_datetime(data["trans_date_trans_time"])
-    results = pd.DataFrame(columns=['cc_num', 'is_fraud_mean_time_diff', 'is_not_fraud_mean_time_diff'])
+    # imported after the first elements are sent, so the page starts rendering before plotly is loaded
+    import plotly.graph_objects as go
+    import plotly.express as px
+    if ready('aggregates', placeholder="The behavioral analysis is loading..."):
+        #########1. Consecutive Transactions#########
+        section("consecutive transactions")
+        st.write("### Consecutive Transactions")
+        st.write("The table below displays the credit card numbers with the highest number of consecutive transactions. The line plot highlights the exact times when fraud occurs, marked with red dots. ")
+        st.write("The chart highlights that fraudulent transactions often appear clustered within a short period This visual pattern is consistent with scenarios involving card theft or unauthorized use, where fraudsters rapidly perform a series of transactions to take advantage of the card before it is reported or blocked. The cluster of red markers indicates consecutive high-value transactions, suggesting that once a fraudster gains access, they act quickly to maximize their illicit use before detection systems or cardholder intervention halt further activity.")
+        cc_cards = load_aggregate('card_fraud_counts')
+
+
+        def plot_transcation_of_card(cc_num):
+            a = card_transactions(cc_num).reset_index()
+            a.sort_values("trans_date_trans_time")
+            fig = go.Figure()
+
+            # 添加折线图
+            fig.add_trace(go.Scatter(
+                x=a['trans_date_trans_time'],
+                y=a['amt'],
+                mode='lines',
+                name='Amount'
+            ))
+
+            # 添加欺诈交易的红色点
+            fraud_transactions = a[a['is_fraud'] == True]
+            fig.add_trace(go.Scatter(
+                x=fraud_transactions['trans_date_trans_time'],
+                y=fraud_transactions['amt'],
+                mode='markers',
+                marker=dict(color='red'),
+                name='Fraud'
+            ))
+
+            # 添加标题和标签
+            fig.update_layout(
+                title='Transaction Amount Over Time',
+                xaxis_title='Time',
+                yaxis_title='Amount',
+                legend_title='Legend'
+            )
+
+            return fig
+
+
+        # a new card reruns this section only, the other charts stay as they are
+        @st.fragment
+        def card_section(cc_cards):
+            col1, col2 = st.columns([1,2])
+            with col1:
+                st.markdown("**Card Number and total fraud count**")
+                st.dataframe(cc_cards)
+            with col2:
+                cc_num = st.selectbox("Select a credit card number", cc_cards["card_number"])
+                show_plotly(('card transactions', version, cc_num), lambda: plot_transcation_of_card(cc_num))
+            st.write("\n\n\n\n")
+
+            st.write("The following table shows the detailed transactions of the selected credit card number.")
+            card_data = card_transactions(cc_num)
+            fraud_data = card_data[card_data["is_fraud"] == 1]
+            st.dataframe(fraud_data)
+        card_section(cc_cards)
+
+
+
+        #########2. Day of Week#########
+        section("day of week")
+        st.write("### Fraudulent Transactions by Day of Week")
+        st.write("The bar chart below shows the number of fraudulent transactions that occur on each day of the week. The chart highlights that fraudulent transactions are more likely to occur on weekends, with Sunday having the highest number of fraudulent transactions. This pattern may be due to reduced monitoring or oversight on weekends, making it easier for fraudsters to exploit vulnerabilities in the system.")
+        def day_of_week_figure():
+            days_distribution = load_aggregate('day_of_week_fraud')
+            days_distri_bar = go.Figure()
+            colors = ['rgb(55, 83, 109)' if day not in ['Saturday', 'Sunday'] else 'red' for day in days_distribution["day_of_week"]]
+
+            days_distri_bar.add_trace(go.Bar(
+                x=days_distribution["day_of_week"],
+                y=days_distribution["is_fraud"],
+                marker_color=colors
+            ))
+            days_distri_bar.add_hline(y=1216, line_dash="dot", line_color="blue", annotation_text="Sunday", annotation_position="bottom right")
+            days_distri_bar.update_layout(
+                title_text="Fraudulent Transactions by Day of Week",
+                xaxis_title="Day of Week",
+                yaxis_title="Number of Fraudulent Transactions",
+                yaxis=dict(range=[0, 2000]),
+                xaxis=dict(categoryorder='array', categoryarray=["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"])
+
+            )
+            return days_distri_bar
+        show_plotly(('day of week', version), day_of_week_figure, use_container_width=True)
+
+
+
+
+        #######3. Time Period#########
+        section("time period")
+        st.write("### Fraudulent Transactions by Time Period")
+        st.write("The chart clearly illustrates that the highest number of fraudulent transactions occur during the midnight period, with a substantial spike compared to other time periods like morning, noon, afternoon, and evening. This pattern suggests that fraudsters prefer late-night hours for their activities, likely because it is a time when cardholders and financial institutions are less active. During these hours, individuals are often asleep, reducing the chance of immediate detection or transaction verification by cardholders.")
+        def time_period_figure():
+            time_period = load_aggregate('time_period_fraud')
+            time_period_bar = go.Figure()
+            time_period_bar.add_trace(go.Bar(
+                x=time_period["timeperiod"],
+                y=time_period["is_fraud"],
+                marker_color=['rgb(55, 83, 109)' if day not in ["midnight"] else 'red' for day in time_period["timeperiod"]]
+            ))
+            time_period_bar.update_layout(
+                title_text="Fraudulent Transactions by Time Period",
+                xaxis_title="Time Period",
+                yaxis_title="Number of Fraudulent Transactions",
+                yaxis=dict(range=[0, 2000]),
+                xaxis=dict(categoryorder='array', categoryarray=["morning", "noon", "afternoon", "evening", "midnight"])
+
+            )
+            return time_period_bar
+        show_plotly(('time period', version), time_period_figure, use_container_width=True)
+
+        #########4. Category#########
+        section("category")
+        st.write("### Fraudulent Transactions by Category")
+
+        def category_pie_figure():
+            cat_data = load_aggregate('fraud_category_amounts')
+            cat_pie = go.Figure()   
+            cat_pie.add_trace(go.Pie(
+                labels=cat_data["category"],
+                values=cat_data["count"],
+                hole=0.3
+            ))
+            cat_pie.update_layout(
+                title_text="Fraudulent Transactions by Category"
+            )
+            cat_pie.update_layout(
+                width=800,
+                height=600
+            )
+            return cat_pie
+
+
+
+        def category_bar_figure():
+            cat_data = load_aggregate('fraud_category_amounts')
+            cat_bar = go.Figure()
+            # 添加总金额的条形图
+            cat_bar.add_trace(go.Bar(
+                x=cat_data["category"],
+                y=cat_data["total_amount"],
+                name='Total Amount',
+                yaxis='y1'
+            ))
+            # 添加平均金额的折线图
+            cat_bar.add_trace(go.Scatter(
+                x=cat_data["category"],
+                y=cat_data["average_amount"],
+                name='Average Amount',
+                yaxis='y2',
+                mode='lines+markers',
+                line=dict(color='orange')
+            ))
+
+            # 更新布局
+            cat_bar.update_layout(
+                title_text="Fraudulent Transactions by Category",
+                xaxis_title="Category",
+                yaxis=dict(
+                    title="Total Amount",
+                    titlefont=dict(color="#1f77b4"),
+                    tickfont=dict(color="#1f77b4"),
+                    side="left"
+                ),
+                yaxis2=dict(
+                    title="Average Amount",
+                    titlefont=dict(color="orange"),
+                    tickfont=dict(color="orange"),
+                    overlaying="y",
+                    side="right"
+                ),
+                legend=dict(
+                    x=0.8,
+                    y=0.95,
+                    bgcolor='rgba(255, 255, 255, 0)',
+                    bordercolor='rgba(255, 255, 255, 0)'
+                )
+            )
+            cat_bar.update_layout(
+                width=800,
+                height=600
+            )
+            return cat_bar
+
+
+        show_plotly(('category pie', version), category_pie_figure, use_container_width=True)
+        show_plotly(('category bar', version), category_bar_figure, use_container_width=True)
+
+
+        section("amount")
+        st.write("### Fraudulent Transactions by Amount")
+        def amount_histogram_figure():
+            # 创建重叠的直方图
+            amt_distribution = go.Figure()
+
+
+            # 添加欺诈交易和非欺诈交易的直方图
+            for trace in histogram_traces('amount_histogram'):
+                amt_distribution.add_trace(trace)
+
+            # 更新布局
+            amt_distribution.update_layout(
+                title_text='Amount Distribution',
+                xaxis_title_text='Amount',
+                yaxis_title_text='Density',
+                barmode='overlay'
+            )
+            amt_distribution.update_xaxes(range=[0,1500])
+            return amt_distribution
+        show_plotly(('amount histogram', version), amount_histogram_figure)
     
-    for card in cards:
-        card_data = data[data['cc_num'] == card]
-        card_data = card_data.sort_values(by='trans_date_trans_time')
-        card_data['time_diff_min'] = card_data["trans_date_trans_time"].diff().dt.total_seconds().fillna(0) / 60
-        result = pd.DataFrame({
-            'cc_num': [card],
-            'is_fraud_mean_time_diff': [card_data[card_data["is_fraud"] == 1]["time_diff_min"].mean()],
-            'is_not_fraud_mean_time_diff': [card_data[card_data["is_fraud"] == 0]["time_diff_min"].mean()]
-        })
-        results = pd.concat([results,result], ignore_index=True)
-
-
-
-    # 假设 results DataFrame 已经存在
-    # 计算 Q1 和 Q3
-    Q1 = results[['is_fraud_mean_time_diff', 'is_not_fraud_mean_time_diff']].quantile(0.25)
-    Q3 = results[['is_fraud_mean_time_diff', 'is_not_fraud_mean_time_diff']].quantile(0.75)
-    IQR = Q3 - Q1
-
-    # 过滤掉异常值
-    filtered_results = results[~((results[['is_fraud_mean_time_diff', 'is_not_fraud_mean_time_diff']] < (Q1 - 1.5 * IQR)) | (results[['is_fraud_mean_time_diff', 'is_not_fraud_mean_time_diff']] > (Q3 + 1.5 * IQR))).any(axis=1)]
-
-    # 计算平均值
-    mean_is_fraud_time_diff = filtered_results['is_fraud_mean_time_diff'].mean()
-    mean_is_not_fraud_time_diff = filtered_results['is_not_fraud_mean_time_diff'].mean()
-
-    # 创建一个新的 DataFrame 来存储平均值
-    mean_summary = pd.DataFrame({
-        'transaction_type': ['is_fraud', 'is_not_fraud'],
-        'mean_time_diff': [mean_is_fraud_time_diff, mean_is_not_fraud_time_diff]
-    })
-
-    # 绘制箱线图
-    fig_box = px.box(filtered_results.melt(id_vars='cc_num', value_vars=['is_fraud_mean_time_diff', 'is_not_fraud_mean_time_diff']),
-                     x='variable', y='value', title='Box Plot of Time Differences',
-                     color='variable', color_discrete_map={'is_fraud_mean_time_diff': 'red', 'is_not_fraud_mean_time_diff': 'blue'})
-    fig_box.update_layout(xaxis_title='Transaction Type', yaxis_title='Time Difference (minutes)')
-
-    # 显示箱线图
-    st.plotly_chart(fig_box)
-
-    # 绘制平均数直方图
-    fig_bar = px.bar(mean_summary, x='transaction_type', y='mean_time_diff', title='Mean Time Difference for Fraud and Non-Fraud Transactions',
-                     color='transaction_type', color_discrete_map={'is_fraud': 'red', 'is_not_fraud': 'blue'})
-    fig_bar.update_layout(xaxis_title='Transaction Type', yaxis_title='Mean Time Difference (minutes)')
-
-    # 显示直方图
-    st.plotly_chart(fig_bar)
+        st.write("")
+        section("time between transactions")
+        def time_gap_summary():
+            with step("card time gaps"):
+                results = load_aggregate('card_time_gaps')
+
+            # 假设 results DataFrame 已经存在
+            # 计算 Q1 和 Q3
+            Q1 = results[['is_fraud_mean_time_diff', 'is_not_fraud_mean_time_diff']].quantile(0.25)
+            Q3 = results[['is_fraud_mean_time_diff', 'is_not_fraud_mean_time_diff']].quantile(0.75)
+            IQR = Q3 - Q1
+
+            # 过滤掉异常值
+            filtered_results = results[~((results[['is_fraud_mean_time_diff', 'is_not_fraud_mean_time_diff']] < (Q1 - 1.5 * IQR)) | (results[['is_fraud_mean_time_diff', 'is_not_fraud_mean_time_diff']] > (Q3 + 1.5 * IQR))).any(axis=1)]
+
+            # 计算平均值
+            mean_is_fraud_time_diff = filtered_results['is_fraud_mean_time_diff'].mean()
+            mean_is_not_fraud_time_diff = filtered_results['is_not_fraud_mean_time_diff'].mean()
+
+            # 创建一个新的 DataFrame 来存储平均值
+            mean_summary = pd.DataFrame({
+                'transaction_type': ['is_fraud', 'is_not_fraud'],
+                'mean_time_diff': [mean_is_fraud_time_diff, mean_is_not_fraud_time_diff]
+            })
+            return filtered_results, mean_summary
+
+        def time_gap_box_figure():
+            filtered_results, _ = time_gap_summary()
+            # 绘制箱线图
+            fig_box = px.box(filtered_results.melt(id_vars='cc_num', value_vars=['is_fraud_mean_time_diff', 'is_not_fraud_mean_time_diff']),
+                             x='variable', y='value', title='Box Plot of Time Differences',
+                             color='variable', color_discrete_map={'is_fraud_mean_time_diff': 'red', 'is_not_fraud_mean_time_diff': 'blue'})
+            fig_box.update_layout(xaxis_title='Transaction Type', yaxis_title='Time Difference (minutes)')
+            return fig_box
+
+        # 显示箱线图
+        show_plotly(('time gap box', version), time_gap_box_figure)
+
+        def time_gap_bar_figure():
+            _, mean_summary = time_gap_summary()
+            # 绘制平均数直方图
+            fig_bar = px.bar(mean_summary, x='transaction_type', y='mean_time_diff', title='Mean Time Difference for Fraud and Non-Fraud Transactions',
+                             color='transaction_type', color_discrete_map={'is_fraud': 'red', 'is_not_fraud': 'blue'})
+            fig_bar.update_layout(xaxis_title='Transaction Type', yaxis_title='Mean Time Difference (minutes)')
+            return fig_bar
+
+        # 显示直方图
+        show_plotly(('time gap bar', version), time_gap_bar_figure)
 
 with tab2:
+    section("customer segmentation")
     st.header("## Customer Segmentation")
     st.write("Our goal is to segment customers based on their spending behavior, age, trends, and geographic locations. This segmentation will enable customized marketing strategies and personalized offers to boost customer engagement. To achieve this, we will utilize a subset of data known as the 'df' dataset.")
     
 
 
-    gender_pie = px.pie(fraud_ratio_df, names='gender', values='fraud_ratio', title='Fraud Transaction Ratio by Gender')
-    st.plotly_chart(gender_pie)
+    if ready('aggregates', placeholder="The customer segmentation is loading..."):
+        # 计算男女的欺诈交易比例
+        def gender_pie_figure():
+            with step("gender fraud ratio"):
+                fraud_ratio_df = load_aggregate('gender_fraud_ratio')
+            gender_pie = px.pie(fraud_ratio_df, names='gender', values='fraud_ratio', title='Fraud Transaction Ratio by Gender')
+            return gender_pie
+        show_plotly(('gender pie', version), gender_pie_figure)
     
 
-    # 创建重叠的直方图
-    age_distribution = go.Figure()
-
-    # 添加欺诈交易的直方图
-    age_distribution.add_trace(go.Histogram(
-        x=is_fraud["age"],
-        histnorm='probability density',
-        name='Fraud',
-        marker_color='red',
-        opacity=0.5
-    ))
-
-    # 添加非欺诈交易的直方图
-    age_distribution.add_trace(go.Histogram(
-        x=not_fraud["age"],
-        histnorm='probability density',
-        name='Non-Fraud',
-        marker_color='green',
-        opacity=0.5
-    ))
-
-    # 更新布局
-    age_distribution.update_layout(
-        title_text='Age Distribution',
-        xaxis_title_text='Age',
-        yaxis_title_text='Density',
-        barmode='overlay'
-    )
-
-    st.plotly_chart(age_distribution)
+        def age_histogram_figure():
+            # 创建重叠的直方图
+            age_distribution = go.Figure()
+
+            # 添加欺诈交易和非欺诈交易的直方图
+            for trace in histogram_traces('age_histogram'):
+                age_distribution.add_trace(trace)
+
+            # 更新布局
+            age_distribution.update_layout(
+                title_text='Age Distribution',
+                xaxis_title_text='Age',
+                yaxis_title_text='Density',
+                barmode='overlay'
+            )
+            return age_distribution
+
+        show_plotly(('age histogram', version), age_histogram_figure)
 
     
+
+warmup_status()
+finish_page()
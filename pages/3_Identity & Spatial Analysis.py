@@ -1,7 +1,12 @@
 import streamlit as st
 import numpy as np
 import pandas as pd
-from util.helper_function import load_data
+from util.helper_function import card_transactions, unpack_coordinates, current_dataset
+from util.aggregates import load_identity_links, load_aggregate
+from util.charts import hexbin_deck
+from util.spatial import load_spatial_index, area_summary, cards_within
+from util.profiling import start_page, step, section, finish_page
+from util.warmup import start_warmup, ready, warmup_status
 
 st.set_page_config(
     page_title="Behavioral Analysis",
@@ -9,82 +14,129 @@ st.set_page_config(
     layout="wide",
     initial_sidebar_state="expanded"
 )
-
-data = load_data()
+start_page("Identity & Spatial Analysis")
 
 '### Identity and Spatial Analysis'
-data['name']=data['first']+' '+data['last']
-data['trans_date_trans_time']=pd.to_datetime(data['trans_date_trans_time'])
-data['lat_long']=list(zip(data.lat,data.long))
-data['merch_lat_long']=list(zip(data.merch_lat,data.merch_long))
+start_warmup()
+
+if ready('aggregates', placeholder="The identity linkages are loading..."):
+    with step("identity linkages"):
+        links = load_identity_links()
+    name_cc = links[('name', 'cc_num')]
+    name_street = links[('name', 'street')]
+    cc_street = links[('cc_num', 'street')]
+    latlong_street = links[('lat_long', 'street')]
+
+    tab1,tab2,tab3,tab4=st.tabs(['Name vs CC','Name vs Address','CC vs Address/Geolocation','Geospatial Analysis'])
+    with tab1:
+        section("name vs cc")
+        '### Name vs CC Number'
+        col1a,col1b=st.columns(2)
+        with col1a:
+            f"Unique Names: {len(name_cc.left_keys)}"
+            f"Unique CC Numbers: {len(name_cc.right_keys)}"
+            df_name_cc2=name_cc.counts('name','cc_num')
+            st.warning('Some names have 2 CC numbers!')
+            st.write(df_name_cc2)
+        with col1b:
+            name = st.selectbox("Select name to check CC:", df_name_cc2['name'],index=None)
+            if name:
+                st.write(pd.DataFrame({'name':name,'cc_num':name_cc.partners(name)}))
+    with tab2:
+        section("name vs address")
+        '### Name vs Address (Street)'
+        col2a,col2b=st.columns(2)
+        with col2a:
+            f"Unique Names: {len(name_street.left_keys)}"
+            f"Unique Address(Street): {len(name_street.right_keys)}"
+            df_name_street2=name_street.counts('name','street')
+            st.warning('Some names have 2 addresses!')
+            st.write(df_name_street2)
+        with col2b:
+            name = st.selectbox("Select name to check address:", df_name_street2['name'],index=None)
+            if name:
+                st.write(pd.DataFrame({'name':name,'street':name_street.partners(name)}))
+    with tab3:
+        section("cc vs address/geolocation")
+        col3a,col3b=st.columns(2)
+        with col3a:
+            '### CC Number vs Address (Street)'
+            f"Unique CC Numbers: {len(cc_street.left_keys)}"
+            f"Unique Address(Street): {len(cc_street.right_keys)}"
+            df_cc_street2=cc_street.counts('cc_num','street')
+            st.success('Each CC Num has unique address.')
+            st.write(df_cc_street2)
+        with col3b:
+            '### Address (Street) vs Geolocation'
+            f"Unique Address(Street): {len(latlong_street.right_keys)}"
+            f"Unique Latitude&Longitude: {len(latlong_street.left_keys)}"
+            df_street_latlong2=latlong_street.counts('geolocation','street')
+            lat,long=unpack_coordinates(df_street_latlong2['geolocation'])
+            df_street_latlong2['geolocation']=[f"({a}, {b})" for a,b in zip(lat,long)]
+            st.info('Some streets has common latitude & longitude.')
+            st.write(df_street_latlong2)
+    with tab4:
+        section("geospatial")
+        '### Geospatial Analysis'
+        cc = st.selectbox("Select CC:", name_cc.right_keys,index=None)
+        if cc:
+            col4a,col4b=st.columns(2)
+            with col4a:
+                street=cc_street.partners(cc)[0]
+                f"**Name:** {name_cc.reverse_partners(cc)[0]}"
+                f"**Address (Street):** {street}"
+                "*Map Legend: Blue = Address, Green = Merchant, Red = Fraud*"
+                geo=unpack_coordinates(latlong_street.reverse_partners(street)[0])
+                with step("card transactions"):
+                    df_locs=card_transactions(cc)[['merch_lat','merch_long','is_fraud']].copy()
+            with col4b:
+                "**Transactions:**"
+                trans_count=df_locs['is_fraud'].value_counts()
+                trans_count.index=trans_count.index.map({0:'not fraud',1:'is fraud'})
+                trans_count.rename('Count',inplace=True)
+                st.write(trans_count)
+            df_locs['color']=df_locs['is_fraud'].map(lambda x:(255*(x),255*(1-x),0))
+            df_locs.loc[-1] = [geo[0], geo[1], 0, (0,0,255)]
+            df_locs = df_locs.reset_index()
+            with st.spinner('Loading map visualisation, please wait..'):
+                st.map(df_locs,latitude='merch_lat',longitude='merch_long',color='color')
+
+        '### Fraud Density'
+        location = st.radio("Locations:", ['merchant','customer'], horizontal=True, format_func=str.title)
+        with step("fraud hexbins"):
+            hexbins = load_aggregate(f"fraud_hexbins_{location}")
+        f"*{len(hexbins):,} hexagons of {hexbins.attrs['hex_km']} km: height = transactions, green to red = fraud rate*"
+        st.pydeck_chart(hexbin_deck(hexbins))
+
+        '### Radius Search'
+        if st.toggle("Search transactions around a location") and ready('data', placeholder="The transactions are loading..."):
+            # around the selected card's address, or the busiest hexagon
+            center = geo if cc else hexbins.loc[hexbins['count'].idxmax(), ['lat','long']]
+            col5a,col5b,col5c,col5d=st.columns(4)
+            lat = col5a.number_input("Latitude:", -90.0, 90.0, float(center[0]), format="%.4f")
+            long = col5b.number_input("Longitude:", -180.0, 180.0, float(center[1]), format="%.4f")
+            radius = col5c.slider("Radius (km):", 1, 500, 50)
+            k = col5d.number_input("Nearest transactions:", 1, 1000, 20)
+            with step("spatial index"):
+                index = load_spatial_index(location)
+                data = current_dataset().data
+            with step("radius query"):
+                positions, km = index.within(lat, long, radius)
+                summary = area_summary(data, positions)
+                cards = cards_within(data, positions, km)
+                nearest, nearest_km = index.nearest(lat, long, k)
+            col6a,col6b,col6c,col6d=st.columns(4)
+            col6a.metric("Transactions", f"{summary['transactions']:,}")
+            col6b.metric("Fraud Transactions", f"{summary['fraud_transactions']:,}")
+            col6c.metric("Fraud Rate", f"{summary['fraud_rate']:.2f}%")
+            col6d.metric("Cards", f"{summary['cards']:,}")
+            col7a,col7b=st.columns(2)
+            with col7a:
+                f"**Cards within {radius} km:**"
+                st.write(cards)
+            with col7b:
+                f"**{len(nearest)} nearest transactions:**"
+                st.write(data.take(nearest)[['trans_date_trans_time','cc_num','merchant','amt','is_fraud']].assign(km=nearest_km))
 
-tab1,tab2,tab3,tab4=st.tabs(['Name vs CC','Name vs Address','CC vs Address/Geolocation','Geospatial Analysis'])
-with tab1:
-    '### Name vs CC Number'
-    col1a,col1b=st.columns(2)
-    with col1a:
-        f"Unique Names: {data.name.nunique()}"
-        f"Unique CC Numbers: {data.cc_num.nunique()}"
-        df_name_cc=data[['name','cc_num']].drop_duplicates()
-        df_name_cc2=df_name_cc.name.value_counts().reset_index().rename(columns={'index':'name','name':'cc_num'})
-        st.warning('Some names have 2 CC numbers!')
-        st.write(df_name_cc2)
-    with col1b:
-        name = st.selectbox("Select name to check CC:", df_name_cc2['name'],index=None)
-        if name:
-            st.write(df_name_cc[df_name_cc['name']==name])
-with tab2:
-    '### Name vs Address (Street)'
-    col2a,col2b=st.columns(2)
-    with col2a:
-        f"Unique Names: {data.name.nunique()}"
-        f"Unique Address(Street): {data.street.nunique()}"
-        df_name_street=data[['name','street']].drop_duplicates()
-        df_name_street2=df_name_street.name.value_counts().reset_index().rename(columns={'index':'name','name':'street'})
-        st.warning('Some names have 2 addresses!')
-        st.write(df_name_street2)
-    with col2b:
-        name = st.selectbox("Select name to check address:", df_name_street2['name'],index=None)
-        if name:
-            st.write(df_name_street[df_name_street['name']==name])
-with tab3:
-    col3a,col3b=st.columns(2)
-    with col3a:
-        '### CC Number vs Address (Street)'
-        f"Unique CC Numbers: {data.cc_num.nunique()}"
-        f"Unique Address(Street): {data.street.nunique()}"
-        df_cc_street=data[['cc_num','street']].drop_duplicates()
-        df_cc_street2=df_cc_street.cc_num.value_counts().reset_index().rename(columns={'index':'cc_num','cc_num':'street'})
-        st.success('Each CC Num has unique address.')
-        st.write(df_cc_street2)
-    with col3b:
-        '### Address (Street) vs Geolocation'
-        f"Unique Address(Street): {data.street.nunique()}"
-        f"Unique Latitude&Longitude: {data.lat_long.nunique()}"
-        df_street_latlong=data[['street','lat_long']].drop_duplicates()
-        df_street_latlong2=df_street_latlong.lat_long.value_counts().reset_index().rename(columns={'index':'geolocation','lat_long':'street'})
-        st.info('Some streets has common latitude & longitude.')
-        st.write(df_street_latlong2)
-with tab4:
-    '### Geospatial Analysis'
-    cc = st.selectbox("Select CC:", df_name_cc['cc_num'].sort_values(),index=None)
-    if cc:
-        col4a,col4b=st.columns(2)
-        with col4a:
-            street=df_cc_street[df_cc_street['cc_num']==cc].iloc[0,1]
-            f"**Name:** {df_name_cc[df_name_cc['cc_num']==cc].iloc[0,0]}"
-            f"**Address (Street):** {street}"
-            "*Map Legend: Blue = Address, Green = Merchant, Red = Fraud*"
-            geo=df_street_latlong[df_street_latlong['street']==street].iloc[0,1]
-            df_locs=data[data['cc_num']==cc][['merch_lat','merch_long','is_fraud']]
-        with col4b:
-            "**Transactions:**"
-            trans_count=df_locs['is_fraud'].value_counts()
-            trans_count.index=trans_count.index.map({0:'not fraud',1:'is fraud'})
-            trans_count.rename('Count',inplace=True)
-            st.write(trans_count)
-        df_locs['color']=df_locs['is_fraud'].map(lambda x:(255*(x),255*(1-x),0))
-        df_locs.loc[-1] = [geo[0], geo[1], 0, (0,0,255)]
-        df_locs = df_locs.reset_index()
-        with st.spinner('Loading map visualisation, please wait..'):
-            st.map(df_locs,latitude='merch_lat',longitude='merch_long',color='color')
\ No newline at end of file
+warmup_status()
+finish_page()
@@ -1,24 +1,139 @@
+import os
+import shutil
+import tempfile
+import time
 import streamlit as st
 import pandas as pd
-from util.helper_function import pre_process, prediction_model
+from util.helper_function import prediction_model, load_encoders, score_frame, update_score_summary, ScoredFileWriter
+from util.model_registry import load_timings
+from util.velocity import VelocityEngine, with_velocity
+from util.profiling import start_page, step, finish_page
+from util.warmup import start_warmup, warmup_status
+
+CHUNKSIZE = 50_000
+PREVIEW_ROWS = 100
+# scored files live in one temp dir per session, dirs of sessions idle longer than this are removed
+SCORED_DIR = os.path.join(tempfile.gettempdir(), "fraud_app_scored")
+SCORED_MAX_AGE_SECONDS = 3600
+
+start_page("Predictive Modelling")
 
 # Set up the Streamlit app
 st.title("Detection of Fraud Transactions using Predictive Modelling")
+start_warmup()
 st.write("Upload transaction records: ")
 
 uploaded_file = st.file_uploader(
     "Choose a CSV file", accept_multiple_files=False
 )
+output_format = st.radio("Scored file format", ["csv", "parquet"], horizontal=True)
+
+
+def session_dir():
+    """temp dir of the scored files of this session, kept fresh while the session runs
+    the dirs of other sessions idle beyond SCORED_MAX_AGE_SECONDS are removed"""
+    os.makedirs(SCORED_DIR, exist_ok=True)
+    path = st.session_state.get('scored_dir')
+    if path is None or not os.path.isdir(path):
+        path = st.session_state['scored_dir'] = tempfile.mkdtemp(dir=SCORED_DIR)
+    os.utime(path)
+    for entry in os.scandir(SCORED_DIR):
+        if entry.path != path and entry.stat().st_mtime < time.time() - SCORED_MAX_AGE_SECONDS:
+            shutil.rmtree(entry.path, ignore_errors=True)
+    return path
+
+
+def remove_scored():
+    """remove the scored file of this session, if any"""
+    scored = st.session_state.pop('scored', None)
+    st.session_state.pop('scored_key', None)
+    if scored and 'path' in scored and os.path.exists(scored['path']):
+        os.remove(scored['path'])
 
-target_dict = {0:"Not Fraud",1:"Fraud"}
 
-if uploaded_file is not None:
-    df = pd.read_csv(uploaded_file)
+def score_upload(uploaded_file, output_format, outdir):
+    """score the upload chunk by chunk into a file in outdir, keeping only a preview and summary in memory
+    the partial file is removed when scoring fails or is interrupted"""
+    with step("load model and encoders"):
+        model = prediction_model()
+        encoders = load_encoders()
+    fd, outpath = tempfile.mkstemp(suffix=f".{output_format}", dir=outdir)
+    os.close(fd)
+    try:
+        return _score_chunks(uploaded_file, outpath, model, encoders)
+    except BaseException:
+        # also on a rerun (a widget changed while scoring), which stops the script with an exception
+        os.remove(outpath)
+        raise
+
+
+def _score_chunks(uploaded_file, outpath, model, encoders):
+    summary = {}
+    preview = None
+    # card velocity within the upload, carried from chunk to chunk
+    velocity = VelocityEngine()
+    progress = st.progress(0.0, text="Scoring transactions...")
+    try:
+        with ScoredFileWriter(outpath) as writer:
+            for chunk in pd.read_csv(uploaded_file, chunksize=CHUNKSIZE):
+                with step("velocity features"):
+                    chunk = with_velocity(chunk, velocity)
+                with step("score chunk"):
+                    scored = score_frame(chunk, model=model, encoders=encoders)
+                writer.write(scored)
+                update_score_summary(summary, scored)
+                if preview is None:
+                    preview = scored.head(PREVIEW_ROWS)
+                progress.progress(min(uploaded_file.tell() / max(uploaded_file.size, 1), 1.0),
+                                  text=f"Scored {summary['rows']:,} transactions")
+    finally:
+        progress.empty()
+    return {'path': outpath, 'summary': summary, 'preview': preview}
+
+
+outdir = session_dir()
+scored = None
+if uploaded_file is None:
+    # the upload was removed, so is its scored file
+    remove_scored()
+else:
     st.write("file uploaded successfully:", uploaded_file.name)
-    st.write(df)
-    X_pred, truth = pre_process(df)
+    # widget changes rerun the script, only score again for a new file or format
+    key = (uploaded_file.name, uploaded_file.size, output_format)
+    if st.session_state.get('scored_key') != key:
+        remove_scored()
+        try:
+            with step("score upload"):
+                st.session_state['scored'] = score_upload(uploaded_file, output_format, outdir)
+        except Exception as e:
+            st.session_state['scored'] = {'error': f"Could not score {uploaded_file.name}: {type(e).__name__}: {e}"}
+        st.session_state['scored_key'] = key
+    scored = st.session_state['scored']
+    if 'error' in scored:
+        st.error(scored['error'])
+        scored = None
+
+if scored is not None:
+    summary = scored['summary']
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Transactions", f"{summary.get('rows', 0):,}")
+    col2.metric("Predicted Fraud", f"{summary.get('predicted_fraud', 0):,}")
+    col3.metric("Mean Fraud Probability", f"{summary.get('probability_sum', 0) / max(summary.get('rows', 0), 1):.4f}")
+    if 'tp' in summary:
+        tp, fp, fn, tn = summary['tp'], summary['fp'], summary['fn'], summary['tn']
+        col1.metric("Accuracy", f"{(tp + tn) / max(tp + fp + fn + tn, 1):.4f}")
+        col2.metric("Precision", f"{tp / max(tp + fp, 1):.4f}")
+        col3.metric("Recall", f"{tp / max(tp + fn, 1):.4f}")
 
-    model = prediction_model()
+    st.write(f"Preview of scored transactions (first {PREVIEW_ROWS} rows):")
+    st.dataframe(scored['preview'])
+    if os.path.exists(scored['path']):
+        with open(scored['path'], 'rb') as f:
+            st.download_button("Download scored file", f,
+                               file_name=f"scored_{os.path.splitext(uploaded_file.name)[0]}.{output_format}")
+    with st.expander("Model load timings"):
+        st.write(load_timings())
 
-    y_pred = model.predict(X_pred)
-    st.write("Here is our prediction: ",[target_dict[y] for y in y_pred], "Here is the truth: ", [target_dict[y] for y in truth.values])
+warmup_status()
+finish_page()
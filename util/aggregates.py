@@ -0,0 +1,288 @@
+"""Materialized aggregate tables of the analysis pages.
+
+usage: python -m util.aggregates build [--datapath credit_card_transactions.csv.bz2] [--outdir util/aggregates]
+       python -m util.aggregates status
+
+build computes every aggregate table the pages show (fraud stats per dimension, high
+risk summaries, weekday/time period/category tables, histograms, card time gaps,
+identity linkage pairs, hex binned fraud density of merchant and customer locations) from the full dataset once and writes each as a small parquet
+file under AGGREGATE_DIR/<fingerprint>/, with a manifest.json. The fingerprint hashes
+the source files (store partitions, or the csv) and AGGREGATE_VERSION, so a build only
+serves the data it was made from. Pages read tables with load_aggregate(), which falls
+back to computing the table live when there is no build for the current data (never
+built, or partitions appended since): fraud stats and high risk summaries as queries of
+the query backend, the other tables from the in-memory dataset. Run from the repository root.
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+from datetime import datetime, timezone
+from functools import partial
+import numpy as np
+import pandas as pd
+import streamlit as st
+from util.charts import density_sample
+from util.helper_function import (IncrementalDataset, Linkage, FRAUD_STAT_DIMENSIONS, IDENTITY_LINKS, DATAPATH,
+                                  CACHEPATH, current_dataset, query_backend, high_risk_summary, time_gaps_from_state,
+                                  load_identity_links as load_live_identity_links)
+from util.model_registry import load_artifact
+from util.spatial import LOCATIONS, hexbin_fraud
+from util.store import STOREPATH, source_files, files_fingerprint
+
+AGGREGATE_DIR = "util/aggregates"
+# bump when an aggregate changes what it produces, so older builds are ignored
+AGGREGATE_VERSION = 2
+KEEP_BUILDS = 3
+# key -> extra keys of the high risk summaries on the transactional page
+HIGH_RISK_SUMMARIES = {'merchant': (), 'last': ('first', 'cc_num'), 'city': ('first', 'last'), 'job': ('last', 'first')}
+AMOUNT_HISTOGRAM = {'bins': 150, 'range': (0, 1500)}
+AGE_HISTOGRAM = {'bins': 100, 'range': (0, 100)}
+
+
+def fraud_stats_table(dataset, dim):
+    return dataset.fraud_stats[dim]
+
+
+def high_risk_table(dataset, key):
+    """high_risk_summary of key, the threshold in attrs['threshold']"""
+    table, threshold = high_risk_summary(dataset.data, key, HIGH_RISK_SUMMARIES[key],
+                                         fraud_rate=dataset.fraud_stats[key]['fraud_rate'].rename(None))
+    table.attrs['threshold'] = float(threshold)
+    return table
+
+
+def backend_fraud_stats_table(backend, dim):
+    return backend.fraud_stats(dim)
+
+
+def backend_high_risk_table(backend, key):
+    """high_risk_table computed by a query backend"""
+    table, threshold = backend.high_risk_summary(key, HIGH_RISK_SUMMARIES[key])
+    table = table.copy(deep=False)
+    table.attrs['threshold'] = float(threshold)
+    return table
+
+
+def amount_scatter(dataset):
+    """density aware sample of (amt, is_fraud) points, the largest amount in attrs['amt_max']"""
+    data = dataset.data
+    points = density_sample(data['amt'], data['is_fraud'])
+    table = pd.DataFrame({'amt': data['amt'].to_numpy()[points], 'is_fraud': data['is_fraud'].to_numpy()[points]})
+    table.attrs['amt_max'] = float(data['amt'].max())
+    return table
+
+
+def card_fraud_counts(dataset):
+    """fraud transactions per card, most first"""
+    counts = dataset.data.groupby("cc_num")["is_fraud"].sum().sort_values(ascending=False).reset_index()
+    counts.columns = ["card_number", "fraud_count"]
+    counts["card_number"] = counts["card_number"].astype(str)
+    return counts
+
+
+def fraud_counts(dataset, column):
+    """fraud transactions per value of column"""
+    return dataset.data.groupby(column, observed=True)["is_fraud"].sum().reset_index()
+
+
+def fraud_category_amounts(dataset):
+    """total, mean and count of fraud amounts per category, largest total first"""
+    data = dataset.data
+    fraud_data = data[data["is_fraud"] == 1]
+    table = fraud_data.groupby("category", observed=True)["amt"].agg(
+        total_amount="sum", average_amount="mean", count="size").reset_index()
+    return table.sort_values(by="total_amount", ascending=False)
+
+
+def gender_fraud_ratio(dataset):
+    data = dataset.data
+    fraud_counts = data[data["is_fraud"] == 1].groupby("gender", observed=True).size()
+    ratio = (fraud_counts / data.groupby("gender", observed=True).size()).reset_index()
+    ratio.columns = ['gender', 'fraud_ratio']
+    return ratio
+
+
+def class_histogram(dataset, column, bins, range):
+    """bin edges and counts of column for fraud and non fraud rows, the totals in attrs['totals']
+    totals count every non missing value, also those outside range, as counts_trace expects"""
+    data = dataset.data
+    values = data[column].to_numpy(dtype=float)
+    fraud = data['is_fraud'].to_numpy() == 1
+    table, totals = None, {}
+    for name, rows in (('fraud', fraud), ('not_fraud', ~fraud)):
+        class_values = values[rows & ~np.isnan(values)]
+        counts, edges = np.histogram(class_values, bins=bins, range=range)
+        if table is None:
+            table = pd.DataFrame({'left': edges[:-1], 'right': edges[1:]})
+        table[name] = counts
+        totals[name] = len(class_values)
+    table.attrs['totals'] = totals
+    return table
+
+
+def card_time_gaps_table(dataset):
+    return time_gaps_from_state(dataset.time_gaps)
+
+
+def link_pairs(dataset, left, right):
+    return Linkage(dataset.data[left], dataset.data[right]).pairs(left, right)
+
+
+def fraud_hexbins(dataset, location):
+    """hexbin_fraud of the merchant or customer locations"""
+    lat_col, long_col = LOCATIONS[location]
+    data = dataset.data
+    return hexbin_fraud(data[lat_col].to_numpy(), data[long_col].to_numpy(), data['is_fraud'].to_numpy())
+
+
+def link_name(left, right):
+    return f"links_{left}_{right}"
+
+
+# name -> function of an IncrementalDataset returning the table
+AGGREGATES = {
+    **{f"fraud_stats_{dim}": partial(fraud_stats_table, dim=dim) for dim in FRAUD_STAT_DIMENSIONS},
+    **{f"high_risk_{key}": partial(high_risk_table, key=key) for key in HIGH_RISK_SUMMARIES},
+    'amount_scatter': amount_scatter,
+    'card_fraud_counts': card_fraud_counts,
+    'day_of_week_fraud': partial(fraud_counts, column='day_of_week'),
+    'time_period_fraud': partial(fraud_counts, column='timeperiod'),
+    'fraud_category_amounts': fraud_category_amounts,
+    'gender_fraud_ratio': gender_fraud_ratio,
+    'amount_histogram': partial(class_histogram, column='amt', **AMOUNT_HISTOGRAM),
+    'age_histogram': partial(class_histogram, column='age', **AGE_HISTOGRAM),
+    'card_time_gaps': card_time_gaps_table,
+    **{f"fraud_hexbins_{location}": partial(fraud_hexbins, location=location) for location in LOCATIONS},
+    **{link_name(left, right): partial(link_pairs, left=left, right=right) for left, right in IDENTITY_LINKS},
+}
+
+
+# aggregates a query backend computes without the in-memory dataset: name -> function of the backend
+BACKEND_AGGREGATES = {
+    **{f"fraud_stats_{dim}": partial(backend_fraud_stats_table, dim=dim) for dim in FRAUD_STAT_DIMENSIONS},
+    **{f"high_risk_{key}": partial(backend_high_risk_table, key=key) for key in HIGH_RISK_SUMMARIES},
+}
+
+
+def data_fingerprint(datapath=DATAPATH, storepath=STOREPATH):
+    """fingerprint of the data the app reads and of the aggregate definitions"""
+    return files_fingerprint(source_files(datapath, storepath), [AGGREGATE_VERSION])
+
+
+def aggregate_path(name, fingerprint, outdir=AGGREGATE_DIR):
+    return os.path.join(outdir, fingerprint, f"{name}.parquet")
+
+
+def manifest_path(fingerprint, outdir=AGGREGATE_DIR):
+    return os.path.join(outdir, fingerprint, "manifest.json")
+
+
+def build_aggregates(dataset, fingerprint, outdir=AGGREGATE_DIR, keep=KEEP_BUILDS):
+    """write every aggregate of dataset to outdir/fingerprint, returns the manifest
+    the build is written aside and swapped in, older builds beyond keep are removed"""
+    builddir = os.path.join(outdir, fingerprint)
+    tmpdir = builddir + ".tmp"
+    shutil.rmtree(tmpdir, ignore_errors=True)
+    os.makedirs(tmpdir)
+    tables = {}
+    for name, aggregate in AGGREGATES.items():
+        start = time.perf_counter()
+        path = os.path.join(tmpdir, f"{name}.parquet")
+        table = aggregate(dataset)
+        table.to_parquet(path)
+        tables[name] = {'rows': len(table), 'bytes': os.path.getsize(path),
+                        'seconds': round(time.perf_counter() - start, 4)}
+    manifest = {
+        'fingerprint': fingerprint,
+        'aggregate_version': AGGREGATE_VERSION,
+        'rows': len(dataset.data),
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'tables': tables,
+    }
+    with open(os.path.join(tmpdir, "manifest.json"), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    shutil.rmtree(builddir, ignore_errors=True)
+    os.replace(tmpdir, builddir)
+    builds = sorted((entry for entry in os.scandir(outdir) if entry.is_dir() and not entry.name.endswith(".tmp")),
+                    key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in builds[keep:]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+    return manifest
+
+
+def load_aggregate(name):
+    """aggregate table of the current data, read from its build or computed live when there is none
+    shared across sessions, treat as read only"""
+    path = aggregate_path(name, data_fingerprint())
+    if os.path.exists(path):
+        return load_artifact(path, pd.read_parquet)
+    if name in BACKEND_AGGREGATES:
+        backend = query_backend()
+        return _backend_aggregate(name, backend.name, backend.version)
+    return _live_aggregate(name, current_dataset().version)
+
+
+@st.cache_data(max_entries=64)
+def _backend_aggregate(name, backend, version):
+    return BACKEND_AGGREGATES[name](query_backend(backend))
+
+
+@st.cache_data(max_entries=64)
+def _live_aggregate(name, version):
+    return AGGREGATES[name](current_dataset())
+
+
+def load_identity_links():
+    """identity linkages rebuilt from the built pair tables, or from the full dataset when there are none"""
+    fingerprint = data_fingerprint()
+    if all(os.path.exists(aggregate_path(link_name(*link), fingerprint)) for link in IDENTITY_LINKS):
+        return _built_identity_links(fingerprint)
+    return load_live_identity_links()
+
+
+@st.cache_resource(max_entries=1)
+def _built_identity_links(fingerprint):
+    links = {}
+    for left, right in IDENTITY_LINKS:
+        pairs = pd.read_parquet(aggregate_path(link_name(left, right), fingerprint))
+        links[(left, right)] = Linkage(pairs[left], pairs[right])
+    return links
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m util.aggregates", description="Materialized page aggregates.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="compute every page aggregate of the current data")
+    build.add_argument("--datapath", default=DATAPATH, help="csv.bz2 when the store is not initialised")
+    build.add_argument("--storepath", default=STOREPATH)
+    build.add_argument("--outdir", default=AGGREGATE_DIR)
+    status = commands.add_parser("status", help="show whether the current data has a build")
+    status.add_argument("--outdir", default=AGGREGATE_DIR)
+    args = parser.parse_args(argv)
+
+    if args.command == "status":
+        fingerprint = data_fingerprint()
+        path = manifest_path(fingerprint, args.outdir)
+        if not os.path.exists(path):
+            print(f"no build for the current data ({fingerprint}), pages compute aggregates live")
+            return
+        with open(path) as f:
+            manifest = json.load(f)
+        print(f"build {fingerprint}: {len(manifest['tables'])} tables, {manifest['rows']:,} rows, "
+              f"created {manifest['created_at']}")
+        return
+    start = time.perf_counter()
+    # the parquet cache belongs to the default dataset only
+    dataset = IncrementalDataset.load(args.datapath, CACHEPATH if args.datapath == DATAPATH else None, args.storepath)
+    loaded = time.perf_counter()
+    manifest = build_aggregates(dataset, data_fingerprint(args.datapath, args.storepath), args.outdir)
+    size = sum(table['bytes'] for table in manifest['tables'].values())
+    print(f"{len(manifest['tables'])} aggregates of {manifest['rows']:,} rows ({size / 2**10:,.0f} KB) -> "
+          f"{os.path.join(args.outdir, manifest['fingerprint'])} in {time.perf_counter() - loaded:.1f}s "
+          f"(+{loaded - start:.1f}s loading)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+
+# upper bounds on what a chart sends to the browser
+MAX_BARS = 50
+MAX_SCATTER_POINTS = 5000
+# tallest hexagon column of a density map, in meters
+HEX_COLUMN_METERS = 150_000
+
+
+def counts_trace(edges, counts, total, density=True, **trace_kwargs):
+    """pre-binned replacement for go.Histogram, ships one bar per bin instead of every value
+    edges and counts are computed server side, total is the number of values binned; density matches
+    histnorm='probability density' (normalised by all values, also those outside the bins)"""
+    import plotly.graph_objects as go
+    edges = np.asarray(edges, dtype=float)
+    widths = np.diff(edges)
+    y = np.asarray(counts) / (max(total, 1) * widths) if density else counts
+    return go.Bar(x=edges[:-1] + widths / 2, y=y, width=widths, **trace_kwargs)
+
+
+def density_sample(x, y, n_out=MAX_SCATTER_POINTS, grid=(200, 50), seed=0):
+    """density aware scatter downsampling
+    keeps one point in every occupied cell of a grid over (x, y), so sparse regions and
+    outliers survive, then fills up to n_out with a random sample of the dense cells
+    returns the indices of the kept points"""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n <= n_out:
+        return np.arange(n)
+
+    def cell(v, size):
+        span = v.max() - v.min()
+        return np.zeros(len(v), dtype=np.int64) if span == 0 else np.minimum(((v - v.min()) / span * size).astype(np.int64), size - 1)
+
+    cells = cell(x, grid[0]) * grid[1] + cell(y, grid[1])
+    _, first = np.unique(cells, return_index=True)
+    if len(first) >= n_out:
+        return np.sort(first)
+    rest = np.setdiff1d(np.arange(n), first, assume_unique=True)
+    extra = np.random.default_rng(seed).choice(rest, n_out - len(first), replace=False)
+    return np.sort(np.concatenate([first, extra]))
+
+
+def top_n_with_other(values, n=MAX_BARS, other_label="other", weights=None):
+    """keep the n largest values and fold the rest into one other bar
+    the other bar is the sum of the rest, or their weighted mean when weights are given
+    (e.g. fraud rates weighted by transaction counts gives the pooled rate)"""
+    values = values.sort_values(ascending=False)
+    if len(values) <= n + 1:
+        return values
+    top, rest = values.iloc[:n], values.iloc[n:]
+    if weights is None:
+        other = rest.sum()
+    else:
+        rest_weights = weights.reindex(rest.index)
+        other = (rest * rest_weights).sum() / rest_weights.sum()
+    top.index = top.index.astype(str)
+    return pd.concat([top, pd.Series([other], index=[f"{other_label} ({len(rest)})"])])
+
+
+def hexbin_deck(table, max_rate=None):
+    """pydeck map with one hexagonal column per row of a hexbin_fraud table
+    height is the transaction count, color goes from green to red with the fraud rate
+    (capped at max_rate %, the 99th percentile of the non zero rates by default)"""
+    import pydeck as pdk
+    if max_rate is None:
+        rates = table['fraud_rate'][table['fraud_rate'] > 0]
+        max_rate = float(rates.quantile(0.99)) if len(rates) else 1.0
+    share = np.clip(table['fraud_rate'].to_numpy() / max(max_rate, 1e-9), 0, 1)
+    points = table.assign(color=[[int(255 * s), int(255 * (1 - s)), 0, 200] for s in share],
+                          fraud_rate=table['fraud_rate'].round(2))
+    layer = pdk.Layer('ColumnLayer', points, get_position=['long', 'lat'], get_elevation='count',
+                      elevation_scale=HEX_COLUMN_METERS / max(int(table['count'].max()), 1) if len(table) else 1,
+                      # pointy top hexagons of hex_km from center to corner
+                      radius=table.attrs.get('hex_km', 25) * 1000, disk_resolution=6, angle=90, coverage=0.9,
+                      get_fill_color='color', pickable=True, extruded=True)
+    view = pdk.ViewState(latitude=float(table['lat'].mean()) if len(table) else 0,
+                         longitude=float(table['long'].mean()) if len(table) else 0, zoom=3, pitch=40)
+    return pdk.Deck(layers=[layer], initial_view_state=view,
+                    tooltip={'text': "{count} transactions\n{fraud_count} fraud ({fraud_rate}%)"})
@@ -0,0 +1,105 @@
+"""Rendered figure cache, shared by every session in the process.
+
+A chart is rendered once per key, the data version and the chart parameters, and a
+rerun for an unrelated widget sends the cached chart instead of building it again.
+Matplotlib figures are kept as the PNG bytes st.pyplot would send and closed as soon
+as they are rendered. Plotly figures are kept as the built figure: st.plotly_chart
+validates a figure given as JSON or a dict again, which costs more than building it,
+while a built figure goes straight to JSON. Entries are evicted least recently used
+beyond MAX_FIGURES entries or MAX_FIGURE_BYTES of rendered output.
+"""
+import io
+import threading
+from collections import OrderedDict
+import streamlit as st
+
+MAX_FIGURES = 256
+MAX_FIGURE_BYTES = 128 * 2**20
+# the savefig options of st.pyplot, so a cached chart looks like the one it replaces
+SAVEFIG_OPTIONS = {'format': 'png', 'dpi': 200, 'bbox_inches': 'tight'}
+
+
+class FigureCache:
+    """bounded LRU of rendered figures, by entry count and by bytes"""
+
+    def __init__(self, max_entries=MAX_FIGURES, max_bytes=MAX_FIGURE_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, render):
+        """the figure cached under key, render() -> (figure, bytes) on a miss"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        # rendered outside the lock, two sessions missing the same key at once both render it
+        figure, nbytes = render()
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = (figure, nbytes)
+                self.nbytes += nbytes
+            self.entries.move_to_end(key)
+            while len(self.entries) > 1 and (len(self.entries) > self.max_entries or self.nbytes > self.max_bytes):
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.nbytes -= evicted
+        return figure
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'bytes': self.nbytes, 'hits': self.hits, 'misses': self.misses}
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+
+_FIGURES = FigureCache()
+
+
+def matplotlib_png(key, build):
+    """PNG bytes of the matplotlib figure build() returns, rendered once per key, the figure is closed"""
+    def render():
+        import matplotlib.pyplot as plt
+        fig = build()
+        try:
+            image = io.BytesIO()
+            fig.savefig(image, **SAVEFIG_OPTIONS)
+        finally:
+            plt.close(fig)
+        png = image.getvalue()
+        return png, len(png)
+    return _FIGURES.get(('png',) + tuple(key), render)
+
+
+def plotly_figure(key, build):
+    """the Plotly figure build() returns, built once per key
+    shared across sessions, treat as read only"""
+    def render():
+        import plotly.io as pio
+        fig = build()
+        return fig, len(pio.to_json(fig, validate=False))
+    return _FIGURES.get(('plotly',) + tuple(key), render)
+
+
+def show_pyplot(key, build):
+    """st.pyplot of a cached matplotlib figure"""
+    st.image(matplotlib_png(key, build), use_container_width=True)
+
+
+def show_plotly(key, build, **kwargs):
+    """st.plotly_chart of a cached Plotly figure, kwargs go to st.plotly_chart"""
+    st.plotly_chart(plotly_figure(key, build), **kwargs)
+
+
+def figure_cache_stats():
+    """entries, bytes, hits and misses of the figure cache"""
+    return _FIGURES.stats()
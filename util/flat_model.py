@@ -0,0 +1,214 @@
+"""Flattened array form of the boosted tree model in util/model.pkl.
+
+usage: python -m util.flat_model [--modelpath util/model.pkl] [--outdir util/model_flat] [--check-rows 100000]
+
+The export reads every tree of the XGBoost classifier into contiguous node arrays
+(feature, threshold, left, right, missing child, leaf value) saved as .npy files,
+with the base margin and tree depth in meta.json. FlatTreeModel memory-maps the
+arrays and evaluates all trees over a block of rows at once with numpy, so
+scoring processes start without unpickling the model or importing xgboost.
+The export is checked against model.predict_proba before it is written.
+Run from the repository root.
+"""
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import numpy as np
+
+FLATMODELPATH = "util/model_flat"
+FLATMETAPATH = os.path.join(FLATMODELPATH, "meta.json")
+ARRAYS = ['feature', 'threshold', 'default_right', 'value']
+# rows evaluated together, small blocks keep the (rows x trees) working arrays in cache
+BLOCK_ROWS = 256
+# each tree is padded to a perfect binary tree of the deepest tree's depth
+MAX_DEPTH = 12
+
+
+def file_sha1(path):
+    with open(path, 'rb') as f:
+        return hashlib.file_digest(f, 'sha1').hexdigest()
+
+
+def _tree_depth(tree):
+    depth = [0] * len(tree['left_children'])
+    # children always come after their parent in xgboost's node order
+    for node in range(1, len(depth)):
+        depth[node] = depth[tree['parents'][node]] + 1
+    return max(depth)
+
+
+def flatten_model(model):
+    """(arrays, meta) of an XGBClassifier or Booster with the binary:logistic objective
+    every tree becomes a perfect binary tree in heap order: the children of position p are
+    2p+1 and 2p+2, so traversal needs no child pointers. Arrays are (trees, 2**depth - 1)
+    for the splits and (trees, 2**depth) for the leaves; a leaf above the last level fills
+    all the leaf slots under it, so the padded splits below it can go either way."""
+    booster = model.get_booster() if hasattr(model, 'get_booster') else model
+    learner = json.loads(booster.save_raw(raw_format='json'))['learner']
+    if learner['objective']['name'] != 'binary:logistic':
+        raise ValueError(f"unsupported objective {learner['objective']['name']}")
+    trees = learner['gradient_booster']['model']['trees']
+    if any(any(tree['split_type']) for tree in trees):
+        raise ValueError("categorical splits are not supported")
+    depth = max(_tree_depth(tree) for tree in trees)
+    if depth > MAX_DEPTH:
+        raise ValueError(f"trees of depth {depth} are too deep to flatten, at most {MAX_DEPTH}")
+    n_internal = 2 ** depth - 1
+    feature = np.zeros((len(trees), n_internal), dtype=np.int32)
+    threshold = np.zeros((len(trees), n_internal), dtype=np.float32)
+    default_right = np.zeros((len(trees), n_internal), dtype=bool)
+    value = np.zeros((len(trees), n_internal + 1), dtype=np.float32)
+    for t, tree in enumerate(trees):
+        left, right = tree['left_children'], tree['right_children']
+        stack = [(0, 0)]
+        while stack:
+            node, position = stack.pop()
+            if left[node] == -1:
+                first = last = position
+                while first < n_internal:
+                    first, last = 2 * first + 1, 2 * last + 2
+                # leaves keep their value in split_conditions
+                value[t, first - n_internal:last - n_internal + 1] = tree['split_conditions'][node]
+                continue
+            feature[t, position] = tree['split_indices'][node]
+            threshold[t, position] = tree['split_conditions'][node]
+            default_right[t, position] = not tree['default_left'][node]
+            stack += [(left[node], 2 * position + 1), (right[node], 2 * position + 2)]
+    # base_score is stored in probability space, as "[5E-1]" in recent versions
+    base_score = float(learner['learner_model_param']['base_score'].strip('[]'))
+    meta = {
+        'base_margin': float(np.log(base_score / (1 - base_score))),
+        'depth': depth,
+        'n_trees': len(trees),
+        'feature_names': booster.feature_names,
+    }
+    return {'feature': feature, 'threshold': threshold, 'default_right': default_right, 'value': value}, meta
+
+
+class FlatTreeModel:
+    """vectorized predictor over flattened trees, with the predict/predict_proba of the classifier"""
+
+    def __init__(self, arrays, meta):
+        for name in ARRAYS:
+            # plain ndarray views, still backed by the memory map when loaded from disk
+            setattr(self, name, np.asarray(arrays[name]))
+        self.meta = meta
+        self.base_margin = meta['base_margin']
+        self.depth = meta['depth']
+        self.feature_names = meta.get('feature_names')
+        n_trees, n_internal = self.threshold.shape
+        self._split_offset = (np.arange(n_trees) * n_internal).astype(np.int32)
+        self._leaf_offset = (np.arange(n_trees) * (n_internal + 1) - n_internal).astype(np.int32)
+
+    def _features(self, X):
+        if hasattr(X, 'columns') and self.feature_names:
+            X = X[self.feature_names]
+        # xgboost compares float32 values with float32 thresholds
+        return np.asarray(X, dtype=np.float32)
+
+    def decision_function(self, X):
+        """raw margins: base margin plus the leaf values of every tree"""
+        X = self._features(X)
+        margin = np.empty(len(X), dtype=np.float64)
+        for start in range(0, len(X), BLOCK_ROWS):
+            block = X[start:start + BLOCK_ROWS]
+            n = len(block)
+            # value of feature j for row i sits at j * n + i
+            columns = np.ascontiguousarray(block.T).ravel()
+            row = np.arange(n, dtype=np.int32)[:, None]
+            position = np.zeros((n, len(self._split_offset)), dtype=np.int32)
+            has_missing = np.isnan(block).any()
+            for _ in range(self.depth):
+                node = position + self._split_offset
+                x = columns.take(self.feature.take(node) * n + row)
+                right = ~(x < self.threshold.take(node))
+                if has_missing:
+                    right &= ~np.isnan(x) | self.default_right.take(node)
+                position = 2 * position + 1 + right
+            margin[start:start + n] = self.value.take(position + self._leaf_offset).sum(axis=1, dtype=np.float64)
+        return margin + self.base_margin
+
+    def predict_proba(self, X):
+        probability = 1 / (1 + np.exp(-self.decision_function(X)))
+        return np.column_stack([1 - probability, probability])
+
+    def predict(self, X):
+        return (self.decision_function(X) >= 0).astype(np.int64)
+
+
+def max_difference(model, flat, X):
+    """largest absolute difference between the fraud probabilities of model and flat on X"""
+    return float(np.abs(model.predict_proba(X)[:, 1] - flat.predict_proba(X)[:, 1]).max())
+
+
+def probe_rows(flat, n_rows, seed=0):
+    """random feature rows around every split threshold, with some missing values"""
+    rng = np.random.default_rng(seed)
+    n_features = len(flat.feature_names) if flat.feature_names else int(flat.feature.max()) + 1
+    X = np.empty((n_rows, n_features), dtype=np.float32)
+    for j in range(n_features):
+        thresholds = np.unique(flat.threshold[(flat.feature == j) & (flat.threshold != 0)])
+        if not len(thresholds):
+            X[:, j] = rng.uniform(0, 1, n_rows)
+            continue
+        # half the rows exactly on a threshold, where x < threshold is decided by a tie
+        on_split = rng.choice(thresholds, n_rows)
+        X[:, j] = np.where(rng.random(n_rows) < 0.5, on_split,
+                           rng.uniform(thresholds.min() - 1, thresholds.max() + 1, n_rows))
+    X[rng.random(X.shape) < 0.01] = np.nan
+    return X
+
+
+def export_model(model, outdir=FLATMODELPATH, source_sha1=None, check_rows=100_000, tolerance=1e-5):
+    """flatten model, check it against model.predict_proba and write it to outdir
+    the new export is written aside and swapped in, returns the maximum difference found"""
+    arrays, meta = flatten_model(model)
+    meta['source_sha1'] = source_sha1
+    flat = FlatTreeModel(arrays, meta)
+    X = probe_rows(flat, check_rows)
+    difference = max_difference(model, flat, X)
+    if difference > tolerance:
+        raise ValueError(f"flattened model differs from predict_proba by {difference:.2e}")
+    meta['max_difference'] = difference
+    tmpdir = outdir.rstrip("/") + ".tmp"
+    shutil.rmtree(tmpdir, ignore_errors=True)
+    os.makedirs(tmpdir)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmpdir, f"{name}.npy"), array)
+    with open(os.path.join(tmpdir, "meta.json"), 'w') as f:
+        json.dump(meta, f, indent=2)
+    olddir = outdir.rstrip("/") + ".old"
+    if os.path.exists(outdir):
+        os.replace(outdir, olddir)
+    os.replace(tmpdir, outdir)
+    shutil.rmtree(olddir, ignore_errors=True)
+    return difference
+
+
+def read_flat_model(metapath=FLATMETAPATH):
+    """FlatTreeModel of an export, arrays memory-mapped read only"""
+    outdir = os.path.dirname(metapath)
+    with open(metapath) as f:
+        meta = json.load(f)
+    arrays = {name: np.load(os.path.join(outdir, f"{name}.npy"), mmap_mode='r') for name in ARRAYS}
+    return FlatTreeModel(arrays, meta)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m util.flat_model", description="Export the flattened model.")
+    parser.add_argument("--modelpath", default="util/model.pkl")
+    parser.add_argument("--outdir", default=FLATMODELPATH)
+    parser.add_argument("--check-rows", type=int, default=100_000, help="probe rows compared with predict_proba")
+    args = parser.parse_args(argv)
+    with open(args.modelpath, 'rb') as f:
+        model = pickle.load(f)
+    difference = export_model(model, args.outdir, file_sha1(args.modelpath), args.check_rows)
+    print(f"exported {args.modelpath} to {args.outdir}, max |p - predict_proba| = {difference:.2e} "
+          f"over {args.check_rows:,} probe rows")
+
+
+if __name__ == "__main__":
+    main()
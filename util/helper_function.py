@@ -1,12 +1,60 @@
+import hashlib
+import os
+import threading
+import weakref
+from functools import lru_cache
+from importlib.util import find_spec
+from datetime import datetime
 import pandas as pd
 import numpy as np
 import pickle
 import streamlit as st
-import matplotlib.pyplot as plt
+from util.model_registry import load_artifact
+from util.figure_cache import show_pyplot
+from util.flat_model import FLATMETAPATH, read_flat_model, file_sha1
+from util.store import STOREPATH, ROW_GROUP_ROWS, list_partition_files, read_partition_files, files_fingerprint
 
 CATEGORICAL_COLS = ['merchant','category','gender','city','state', 'job']
 NUMERIC_COLS = ['amt','age','distance_km']
 MODELPATH = "util/model.pkl"
+DICTPATH = "util/dict_all.obj"
+# "flat" scores with the array export of the model (python -m util.flat_model), "pickle" with the classifier
+MODEL_ENGINE_ENV = "FRAUD_APP_MODEL_ENGINE"
+# xgboost scores large chunks about twice as fast, the flat export loads in a millisecond and wins on small batches
+BATCH_ENGINE = 'pickle'
+ONLINE_ENGINE = 'flat'
+# code for categories the encoders have never seen
+UNSEEN_CODE = -1
+DATAPATH = "./util/data/credit_card_transactions.csv.bz2"
+CACHEPATH = "./util/data/credit_card_transactions.parquet"
+# low cardinality string columns stored as categoricals in the cache
+STORAGE_CATEGORY_COLS = ['merchant','category','first','last','gender','street','city','state','job']
+DATETIME_COLS = ['trans_date_trans_time','dob']
+# unique per row strings, arrow backed strings take a fraction of the memory of python str objects
+STRING_DTYPE = 'string[pyarrow]' if find_spec('pyarrow') else object
+# dtype plan of the transaction columns: categoricals for low cardinality strings, the narrowest
+# integers that hold the values; amounts and coordinates stay float64 (money sums, micro degree keys)
+COLUMN_DTYPES = {
+    'Unnamed: 0': 'int32', 'cc_num': 'int64', 'amt': 'float64', 'zip': 'int32',
+    'lat': 'float64', 'long': 'float64', 'city_pop': 'int32', 'trans_num': STRING_DTYPE,
+    'unix_time': 'int64', 'merch_lat': 'float64', 'merch_long': 'float64', 'is_fraud': 'int8',
+    'merch_zipcode': 'float32',
+    **{col: 'category' for col in STORAGE_CATEGORY_COLS},
+}
+AGE_REFERENCE_YEAR = 2024
+AGE_GROUP_BINS = list(range(0, 101, 5))
+DAYS_OF_WEEK = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+TIME_PERIODS = ["morning", "noon", "afternoon", "evening", "midnight"]
+# packed coordinate key = lat_micro_degrees * COORD_KEY_SCALE + long_micro_degrees
+COORD_KEY_SCALE = 360_000_001
+# dimensions the transactional page reports fraud rates for
+FRAUD_STAT_DIMENSIONS = ['category','merchant','last','gender','city','job','age_group','card_bin']
+# "duckdb" answers fraud stats, high risk summaries and card lookups with queries over the parquet files,
+# "pandas" from the in-memory dataset; duckdb falls back to pandas when it is not installed or there are no parquet files
+QUERY_BACKEND_ENV = "FRAUD_APP_QUERY_BACKEND"
+# per process limits of the duckdb backend, it spills to disk above the memory limit
+DUCKDB_THREADS = os.cpu_count() or 1
+DUCKDB_MEMORY_LIMIT = os.environ.get("FRAUD_APP_DUCKDB_MEMORY_LIMIT", "1GB")
 
 def haversine(lat1, lon1, lat2, lon2):
     # Radius of Earth in kilometers
@@ -27,54 +75,743 @@ def haversine(lat1, lon1, lat2, lon2):
     distance = R * c
     return distance
 
-def pre_process(df , cate_cols = CATEGORICAL_COLS, numeric_cols = NUMERIC_COLS):
-    """function to preprocess the dataframe of input
-    input shape must be the same as the original data"""
-    df['trans_datetime'] = pd.to_datetime(df.trans_date_trans_time)
-    df['age'] = ((df.trans_datetime - pd.to_datetime(df.dob)).dt.days/365).round()
-    df['distance_km'] = df.apply(lambda row: haversine(row['lat'],row['long'],row['merch_lat'],row['merch_long']),axis=1)
+def fit_encoders(df, cate_cols=CATEGORICAL_COLS):
+    """label encoder dictionaries {column: {value: code}} of df, codes in sorted value order like LabelEncoder"""
+    dict_all = {}
+    for col in cate_cols:
+        values = np.sort(pd.Series(df[col]).dropna().astype(str).unique())
+        dict_all[col] = dict(zip(values.tolist(), range(len(values))))
+    return dict_all
+
+def encoder_indexes(dict_all):
+    """label encoder dictionaries as lookup indexes {column: (index of category names, array of codes)}"""
+    return {col: (pd.Index(list(mapping.keys())), np.fromiter(mapping.values(), dtype=np.int64, count=len(mapping)))
+            for col, mapping in dict_all.items()}
 
-    file = open("util/dict_all.obj",'rb')
-    dict_all_loaded = pickle.load(file)
-    file.close()
+def read_encoders(dictpath=DICTPATH):
+    """read the label encoder dictionaries as lookup indexes
+    returns {column: (index of category names, array of codes)}"""
+    with open(dictpath, 'rb') as f:
+        dict_all = pickle.load(f)
+    return encoder_indexes(dict_all)
 
+def load_encoders(dictpath=DICTPATH):
+    """encoder lookup indexes, loaded once per process and reloaded when the file changes"""
+    return load_artifact(dictpath, read_encoders)
+
+def encode_column(values, keys, codes, unseen_code=UNSEEN_CODE):
+    """vectorized label encoding, each distinct value is looked up once
+    values missing from keys (and NaN) get unseen_code"""
+    value_codes, uniques = pd.factorize(values)
+    pos = keys.get_indexer(uniques)
+    # trailing unseen_code so NaN (factorize code -1) maps to it as well
+    mapped = np.append(np.where(pos >= 0, codes[pos], unseen_code), unseen_code)
+    return mapped[value_codes]
+
+def pre_process(df , cate_cols = CATEGORICAL_COLS, numeric_cols = NUMERIC_COLS, encoders = None):
+    """function to preprocess the dataframe of input
+    input shape must be the same as the original data, df is not modified
+    the returned truth is None when df has no is_fraud column"""
+    trans_datetime = pd.to_datetime(df.trans_date_trans_time)
+    features = pd.DataFrame(index=df.index)
+    if encoders is None:
+        encoders = load_encoders()
     for col in cate_cols:
-        df.replace(dict_all_loaded[col], inplace=True)
+        features[col] = encode_column(df[col], *encoders[col])
+    features['amt'] = df['amt']
+    features['age'] = ((trans_datetime - pd.to_datetime(df.dob)).dt.days/365).round()
+    features['distance_km'] = haversine(df['lat'].to_numpy(), df['long'].to_numpy(),
+                                        df['merch_lat'].to_numpy(), df['merch_long'].to_numpy())
 
-    return pd.DataFrame(df[cate_cols + numeric_cols]) , df.is_fraud
+    return features[cate_cols + numeric_cols] , df.get('is_fraud')
 
-def prediction_model(modelpath=MODELPATH):
+def pre_process_record(record, cate_cols = CATEGORICAL_COLS, numeric_cols = NUMERIC_COLS, encoders = None):
+    """per transaction version of pre_process for online scoring, without pandas overhead
+    record is a dict with the original data columns, returns the feature values in model order"""
+    if encoders is None:
+        encoders = load_encoders()
+    features = {}
+    for col in cate_cols:
+        keys, codes = encoders[col]
+        value = record[col]
+        try:
+            features[col] = codes[keys.get_loc(value)]
+        except (KeyError, TypeError, pd.errors.InvalidIndexError):
+            # unknown values, and lists or dicts a JSON body can hold, are unseen categories
+            features[col] = UNSEEN_CODE
+    trans_datetime = datetime.fromisoformat(str(record['trans_date_trans_time']))
+    features['amt'] = float(record['amt'])
+    features['age'] = round((trans_datetime - datetime.fromisoformat(str(record['dob']))).days / 365)
+    features['distance_km'] = float(haversine(float(record['lat']), float(record['long']),
+                                              float(record['merch_lat']), float(record['merch_long'])))
+    return [features[col] for col in cate_cols + numeric_cols]
+
+def read_model(modelpath=MODELPATH):
     with open(modelpath, 'rb') as f:
         model = pickle.load(f)
 
     return model
 
+def prediction_model(modelpath=MODELPATH, engine=None, flatmetapath=FLATMETAPATH):
+    """trained model, loaded once per process and reloaded when the file changes
+    engine defaults to MODEL_ENGINE_ENV, else BATCH_ENGINE; the memory-mapped flat export is used
+    when it was made from this model file, the pickle otherwise"""
+    engine = engine or os.environ.get(MODEL_ENGINE_ENV, BATCH_ENGINE)
+    if engine == 'flat' and os.path.exists(flatmetapath):
+        flat = load_artifact(flatmetapath, read_flat_model)
+        if flat.meta.get('source_sha1') == load_artifact(modelpath, file_sha1, key=f"{modelpath}:sha1"):
+            return flat
+    return load_artifact(modelpath, read_model)
+
+
+def score_frame(df, model=None, encoders=None):
+    """preprocess and score a frame of raw transactions
+    returns df with fraud_probability and prediction columns added"""
+    X, _ = pre_process(df, encoders=encoders)
+    model = model if model is not None else prediction_model()
+    probability = model.predict_proba(X)[:, 1]
+    return df.assign(fraud_probability=probability, prediction=(probability >= 0.5).astype(np.int8))
+
+def update_score_summary(summary, scored):
+    """accumulate row, fraud and confusion counts of a scored chunk into summary"""
+    summary['rows'] = summary.get('rows', 0) + len(scored)
+    summary['predicted_fraud'] = summary.get('predicted_fraud', 0) + int(scored['prediction'].sum())
+    summary['probability_sum'] = summary.get('probability_sum', 0.0) + float(scored['fraud_probability'].sum())
+    if 'is_fraud' in scored:
+        truth = scored['is_fraud'].to_numpy() == 1
+        pred = scored['prediction'].to_numpy() == 1
+        for key, mask in [('tp', truth & pred), ('fp', ~truth & pred), ('fn', truth & ~pred), ('tn', ~truth & ~pred)]:
+            summary[key] = summary.get(key, 0) + int(mask.sum())
+    return summary
+
+class ScoredFileWriter:
+    """append scored chunks to a csv or parquet file, picked by the file extension"""
+
+    def __init__(self, path):
+        self.path = path
+        self.parquet = str(path).endswith('.parquet')
+        self._writer = None
+        self._header = True
+
+    def write(self, scored):
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            if self._writer is None:
+                table = pa.Table.from_pandas(scored, preserve_index=False)
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            else:
+                # later chunks can infer other dtypes (e.g. all-null columns), cast to the first schema
+                table = pa.Table.from_pandas(scored, schema=self._writer.schema, preserve_index=False)
+            self._writer.write_table(table)
+        else:
+            scored.to_csv(self.path, mode='w' if self._header else 'a', header=self._header, index=False)
+            self._header = False
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
 def calculate_fraud_rate(data, group_by_column):
-    return data.groupby(group_by_column).apply(lambda x: (x['is_fraud'].sum() / len(x)) * 100)
+    """fraud rate in percent per group, unnamed series indexed by the group keys"""
+    return (data.groupby(group_by_column, observed=True)['is_fraud'].mean() * 100).rename(None)
+
+def high_risk_summary(data, key, extra_keys=(), threshold_sigma=3, fraud_rate=None):
+    """totals for the groups of key whose fraud rate is above mean + threshold_sigma * std
+    rows are key + extra_keys combinations, returns (summary table, threshold)
+    fraud_rate can pass an already computed rate per key (e.g. a query backend's fraud_rate)"""
+    if fraud_rate is None:
+        fraud_rate = calculate_fraud_rate(data, key)
+    threshold = fraud_rate.mean() + threshold_sigma * fraud_rate.std()
+    high_risk = data[data[key].isin(fraud_rate[fraud_rate > threshold].index)]
+    fraud_amt = high_risk['fraud_amt'] if 'fraud_amt' in high_risk else high_risk['amt'] * (high_risk['is_fraud'] == 1)
+    summary_table = high_risk.assign(fraud_amt=fraud_amt).groupby([key, *extra_keys], observed=True).agg(
+        Total_Amount=('amt', 'sum'),
+        Fraud_Amount=('fraud_amt', 'sum'),
+        Total_Transactions=('amt', 'count'),
+        Fraud_Transactions=('is_fraud', 'sum')
+    ).reset_index()
+    summary_table['Fraud Rate (%)'] = (summary_table['Fraud_Transactions'] / summary_table['Total_Transactions']) * 100
+    return summary_table, threshold
+
+def group_codes(column):
+    """integer codes (-1 for missing) and sorted unique keys of a column, categoricals reuse their codes"""
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return column.cat.codes.to_numpy(), column.cat.categories
+    return pd.factorize(column, sort=True)
+
+def aggregate_fraud_stats(data, dimensions=FRAUD_STAT_DIMENSIONS):
+    """transaction count, fraud count, amount sums and fraud rate (%) for every dimension
+    one bincount per dimension over integer codes, returns {dimension: table indexed by key}"""
+    is_fraud = data['is_fraud'].to_numpy()
+    amt = data['amt'].to_numpy(dtype=float)
+    fraud_amt = amt * is_fraud
+    tables = {}
+    for dim in dimensions:
+        codes, keys = group_codes(data[dim])
+        valid = codes >= 0
+        codes = codes[valid]
+        count = np.bincount(codes, minlength=len(keys))
+        fraud_count = np.bincount(codes, weights=is_fraud[valid], minlength=len(keys)).astype(np.int64)
+        table = pd.DataFrame({
+            'count': count,
+            'fraud_count': fraud_count,
+            'amount': np.bincount(codes, weights=amt[valid], minlength=len(keys)),
+            'fraud_amount': np.bincount(codes, weights=fraud_amt[valid], minlength=len(keys)),
+        }, index=pd.Index(keys, name=dim))
+        table = table[table['count'] > 0]
+        table['fraud_rate'] = table['fraud_count'] / table['count'] * 100
+        tables[dim] = table
+    return tables
+
+def merge_fraud_stats(stats, new_stats):
+    """aggregate_fraud_stats of two disjoint sets of rows combined, from their tables alone
+    keys only in new_stats are added, and tables stay sorted when they were"""
+    merged = {}
+    for dim, table in stats.items():
+        sums, new_sums = table.drop(columns='fraud_rate'), new_stats[dim].drop(columns='fraud_rate')
+        index = sums.index.append(new_sums.index[~new_sums.index.isin(sums.index)])
+        total = sums.reindex(index, fill_value=0) + new_sums.reindex(index, fill_value=0)
+        if sums.index.is_monotonic_increasing:
+            total = total.sort_index()
+        total['fraud_rate'] = total['fraud_count'] / total['count'] * 100
+        merged[dim] = total
+    return merged
 
 def display_dataframe(title, data):
     st.write(title)
     st.dataframe(data)
 
 
+def series_version(data):
+    """hash of the values, index and name of a series, changes whenever a chart of it would"""
+    h = hashlib.sha1(pd.util.hash_pandas_object(data).to_numpy().tobytes())
+    h.update(repr(data.name).encode())
+    return h.hexdigest()[:16]
+
 def plot_bar_chart(data, title, xlabel, ylabel, reference_line=None, rotation=45, color="skyblue"):
-    fig, ax = plt.subplots(figsize=(8, 6))
-    data.plot(kind='bar', ax=ax, color=color, alpha=0.7)
-    if reference_line:
-        ax.axhline(y=reference_line, color='red', linestyle='--', label=f'Reference Line: {reference_line:.2f}%')
-        ax.legend()
-    ax.set_xlabel(xlabel)
-    ax.set_ylabel(ylabel)
-    ax.set_title(title)
-    plt.xticks(rotation=rotation, fontsize=8)
-    st.pyplot(fig, use_container_width=True)
+    """bar chart of a series, rendered once per content and options and served from the figure cache"""
+    def build():
+        import matplotlib.pyplot as plt
+        fig, ax = plt.subplots(figsize=(8, 6))
+        data.plot(kind='bar', ax=ax, color=color, alpha=0.7)
+        if reference_line:
+            ax.axhline(y=reference_line, color='red', linestyle='--', label=f'Reference Line: {reference_line:.2f}%')
+            ax.legend()
+        ax.set_xlabel(xlabel)
+        ax.set_ylabel(ylabel)
+        ax.set_title(title)
+        plt.setp(ax.get_xticklabels(), rotation=rotation, fontsize=8)
+        return fig
+    show_pyplot(('bar', series_version(data), title, xlabel, ylabel, reference_line, rotation, color), build)
 
 
 
-@st.cache_data
+def apply_dtype_plan(df, dtypes=COLUMN_DTYPES):
+    """cast the columns of df to the dtype plan in place and return it, datetimes parsed once
+    columns that already have their planned dtype are left alone"""
+    for col in DATETIME_COLS:
+        if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.to_datetime(df[col])
+    for col, dtype in dtypes.items():
+        if col in df.columns and df[col].dtype != dtype:
+            df[col] = df[col].astype(dtype)
+    return df
+
+def memory_report(df):
+    """deep memory use of every column in MB with its dtype, largest first"""
+    usage = df.memory_usage(deep=True, index=False) / 2**20
+    return pd.DataFrame({'dtype': df.dtypes.astype(str), 'MB': usage}).sort_values('MB', ascending=False)
+
+def compare_memory(before, after):
+    """memory_report of two versions of a frame side by side, with a total row"""
+    report = memory_report(before).join(memory_report(after), how='outer', lsuffix='_before', rsuffix='_after')
+    report.loc['total'] = ['', report['MB_before'].sum(), '', report['MB_after'].sum()]
+    report['saved %'] = (1 - report['MB_after'] / report['MB_before']) * 100
+    return report.round(2)
+
+def read_raw_data(datapath=DATAPATH):
+    """parse the compressed csv with datetimes and the dtype plan applied while parsing"""
+    return pd.read_csv(datapath, compression='bz2', dtype=COLUMN_DTYPES, parse_dates=DATETIME_COLS)
+
+def read_batch(path):
+    """read a batch of new transactions (csv, compressed or not, or parquet) typed like the dataset"""
+    if str(path).endswith(".parquet"):
+        return apply_dtype_plan(pd.read_parquet(path))
+    return pd.read_csv(path, dtype=COLUMN_DTYPES, parse_dates=DATETIME_COLS)
+
+def write_data_cache(df, cachepath=CACHEPATH):
+    """write the typed frame as parquet, via a temp file so readers never see a partial cache"""
+    tmppath = cachepath + ".tmp"
+    df.to_parquet(tmppath, index=False, row_group_size=ROW_GROUP_ROWS)
+    os.replace(tmppath, cachepath)
+
+def read_data(datapath=DATAPATH, cachepath=CACHEPATH):
+    """read from the parquet cache when it is newer than the csv, rebuild it when stale
+    cachepath None reads the csv without caching"""
+    if cachepath is None:
+        return read_raw_data(datapath)
+    if os.path.exists(cachepath) and os.path.getmtime(cachepath) >= os.path.getmtime(datapath):
+        # caches written before the dtype plan are brought up to it
+        return apply_dtype_plan(pd.read_parquet(cachepath))
+    df = read_raw_data(datapath)
+    try:
+        write_data_cache(df, cachepath)
+    except (ImportError, OSError):
+        # no parquet engine or read only filesystem, serve the parsed csv without caching
+        pass
+    return df
+
 def load_data():
-    """Load and cache the machine learning model.
-    hard coded path to read file in data folder"""
-    return pd.read_csv("./util/data/credit_card_transactions.csv.bz2",compression='bz2')
-    
\ No newline at end of file
+    """Load the transaction dataset, appended partitions included.
+    hard coded path to read file in data folder, served from the store or the parquet cache
+    the stored columns typed by the dtype plan, without derived columns; a frame of the caller's own"""
+    dataset = current_dataset()
+    return dataset.data[dataset.columns]
+
+def time_period(hour):
+    """bucket hour of day into the time periods used on the behavioral page"""
+    hour = np.asarray(hour)
+    conditions = [(6 <= hour) & (hour < 12), (12 <= hour) & (hour < 14),
+                  (14 <= hour) & (hour < 18), (18 <= hour) & (hour < 22)]
+    return np.select(conditions, TIME_PERIODS[:4], default="midnight")
+
+def pack_coordinates(lat, long):
+    """pack (lat, long) pairs into one int64 key at 1e-6 degree precision, instead of tuples"""
+    lat = np.round((np.asarray(lat, dtype=float) + 90) * 1e6).astype(np.int64)
+    long = np.round((np.asarray(long, dtype=float) + 180) * 1e6).astype(np.int64)
+    return lat * COORD_KEY_SCALE + long
+
+def unpack_coordinates(key):
+    """(lat, long) arrays of keys made by pack_coordinates"""
+    lat, long = np.divmod(np.asarray(key, dtype=np.int64), COORD_KEY_SCALE)
+    return np.round(lat / 1e6 - 90, 6), np.round(long / 1e6 - 180, 6)
+
+def enrich_data(df):
+    """add every derived column used by the analysis pages to df, vectorized, and return it
+    derived columns follow the dtype plan: categoricals for labels, narrow integers, int64 coordinate keys"""
+    trans_time = df['trans_date_trans_time']
+    df['age'] = (AGE_REFERENCE_YEAR - df['dob'].dt.year).astype(np.int16)
+    df['age_group'] = pd.cut(df['age'], bins=AGE_GROUP_BINS)
+    df['card_bin'] = df['cc_num'].astype(str).str[:6].astype('category')
+    df['day_of_week'] = pd.Categorical(trans_time.dt.day_name(), categories=DAYS_OF_WEEK)
+    df['trans_hour'] = trans_time.dt.hour.astype(np.int8)
+    df['timeperiod'] = pd.Categorical(time_period(df['trans_hour']), categories=TIME_PERIODS)
+    df['fraud_amt'] = df['amt'] * (df['is_fraud'] == 1)
+    df['name'] = (df['first'].astype(str) + ' ' + df['last'].astype(str)).astype('category')
+    df['lat_long'] = pack_coordinates(df['lat'], df['long'])
+    df['merch_lat_long'] = pack_coordinates(df['merch_lat'], df['merch_long'])
+    return df
+
+def load_enriched_data():
+    """Load the dataset with all derived columns, kept up to date on append and shared across sessions.
+    the frame is shared, pages must treat it as read only and copy before mutating"""
+    return current_dataset().data
+
+def concat_frames(data, new):
+    """data with the rows of new appended, categoricals kept as categoricals over the union of categories"""
+    new = new.copy(deep=False)
+    for col in data.columns:
+        dtype = data[col].dtype
+        if isinstance(dtype, pd.CategoricalDtype) and not new[col].dtype == dtype:
+            categories = dtype.categories.union(new[col].astype('category').cat.categories)
+            data = data.assign(**{col: data[col].cat.set_categories(categories)})
+            new[col] = pd.Categorical(new[col], categories=categories, ordered=dtype.ordered)
+    return pd.concat([data, new[data.columns]], ignore_index=True)
+
+TIME_GAP_SUMS = ['fraud_sum', 'fraud_count', 'not_fraud_sum', 'not_fraud_count']
+
+def time_gap_state(data, previous=None):
+    """per card sums and counts of minutes since the card's previous transaction, for fraud and
+    non fraud transactions, and the time of its last transaction, indexed by cc_num in order of first appearance
+    with previous (the state of earlier rows), only data is scanned, which must not predate those rows"""
+    order = np.lexsort((data['trans_date_trans_time'].to_numpy(), data['cc_num'].to_numpy()))
+    cc = data['cc_num'].to_numpy()[order]
+    times = data['trans_date_trans_time'].to_numpy()[order]
+    is_fraud = data['is_fraud'].to_numpy()[order] == 1
+    # each card is one contiguous run of the sorted rows
+    starts = np.flatnonzero(np.r_[True, cc[1:] != cc[:-1]]) if len(cc) else np.empty(0, dtype=np.int64)
+    minutes = np.zeros(len(cc))
+    minutes[1:] = (times[1:] - times[:-1]).astype('timedelta64[ns]').astype(np.int64) / 6e10
+    minutes[starts] = 0
+    if previous is not None:
+        # the first gap of a known card is measured from its last transaction so far
+        last_time = pd.Series(cc[starts]).map(previous['last_time']).to_numpy()
+        known = ~pd.isna(last_time)
+        minutes[starts[known]] = (times[starts[known]] - last_time[known].astype(times.dtype)).astype(np.int64) / 6e10
+    sums = np.add.reduceat(np.column_stack([np.where(is_fraud, minutes, 0), is_fraud, np.where(is_fraud, 0, minutes), ~is_fraud]),
+                           starts) if len(cc) else np.zeros((0, 4))
+    state = pd.DataFrame(sums, columns=TIME_GAP_SUMS, index=cc[starts])
+    state[['fraud_count', 'not_fraud_count']] = state[['fraud_count', 'not_fraud_count']].astype(np.int64)
+    state['last_time'] = times[np.r_[starts[1:], len(cc)] - 1] if len(cc) else times[:0]
+    state = state.reindex(data['cc_num'].unique())
+    if previous is None:
+        return state
+    index = previous.index.append(state.index[~state.index.isin(previous.index)])
+    merged = previous[TIME_GAP_SUMS].reindex(index, fill_value=0) + state[TIME_GAP_SUMS].reindex(index, fill_value=0)
+    merged['last_time'] = pd.concat([previous['last_time'].reindex(index), state['last_time'].reindex(index)], axis=1).max(axis=1)
+    return merged
+
+def time_gaps_from_state(state):
+    """card_time_gaps table of a time_gap_state"""
+    return pd.DataFrame({
+        'cc_num': state.index.to_numpy(),
+        'is_fraud_mean_time_diff': (state['fraud_sum'] / state['fraud_count']).to_numpy(),
+        'is_not_fraud_mean_time_diff': (state['not_fraud_sum'] / state['not_fraud_count']).to_numpy(),
+    })
+
+def card_time_gaps(data):
+    """mean minutes since the card's previous transaction, for fraud and non fraud transactions
+    one row per card, in order of first appearance, from one sort and a grouped diff"""
+    return time_gaps_from_state(time_gap_state(data))
+
+class CardIndex:
+    """row positions of every card's transactions in time order
+    made of segments, one per indexed batch of rows, each sorted by card then time, with
+    {cc_num: ((segment, start, stop), ...)} offsets, so appending a batch only sorts the batch"""
+
+    def __init__(self, segments=(), offsets=None):
+        self.segments = list(segments)
+        self.offsets = offsets if offsets is not None else {}
+
+    def append(self, data, first_position=0):
+        """a new index that also covers data, whose rows sit at first_position onwards of the indexed frame"""
+        positions = np.lexsort((data['trans_date_trans_time'].to_numpy(), data['cc_num'].to_numpy()))
+        cards, starts, counts = np.unique(data['cc_num'].to_numpy()[positions], return_index=True, return_counts=True)
+        segment = len(self.segments)
+        offsets = dict(self.offsets)
+        for cc, start, stop in zip(cards.tolist(), starts.tolist(), (starts + counts).tolist()):
+            offsets[cc] = offsets.get(cc, ()) + ((segment, start, stop),)
+        return CardIndex(self.segments + [positions + first_position], offsets)
+
+    def positions(self, cc_num, times=None):
+        """row positions of one card, in time order when the times of all rows are given"""
+        parts = self.offsets.get(int(cc_num), ())
+        if len(parts) == 1:
+            segment, start, stop = parts[0]
+            return self.segments[segment][start:stop]
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        positions = np.concatenate([self.segments[segment][start:stop] for segment, start, stop in parts])
+        # batches are appended in time order, a late batch needs the segments merged by time
+        return positions if times is None else positions[np.argsort(times[positions], kind='stable')]
+
+def build_card_index(data):
+    """CardIndex of data, a card's transactions are card_index.positions(cc_num)"""
+    return CardIndex().append(data)
+
+def card_transactions(cc_num, data=None, card_index=None):
+    """transactions of one card in time order, without scanning the other cards
+    defaults to the card index of the full dataset once it is loaded, the query backend before"""
+    if data is None:
+        dataset = loaded_dataset()
+        if dataset is None:
+            return query_backend().card_transactions(cc_num)
+        data, card_index = dataset.data, dataset.card_index
+    return data.take(card_index.positions(cc_num, data['trans_date_trans_time'].to_numpy()))
+
+class IncrementalDataset:
+    """the enriched dataset with the fraud stats, card index and time gap state the pages use
+    new batches are enriched, aggregated and indexed on their own and merged in, the history is
+    never re-read or re-aggregated; version changes with every append"""
+
+    def __init__(self, data, files=(), storepath=None):
+        # the stored columns, ahead of the derived ones enrich_data adds
+        self.columns = list(data.columns)
+        self.data = enrich_data(apply_dtype_plan(data.reset_index(drop=True)))
+        self.fraud_stats = aggregate_fraud_stats(self.data)
+        self.card_index = build_card_index(self.data)
+        self.time_gaps = time_gap_state(self.data)
+        self.files = set(files)
+        self.storepath = storepath
+        self.version = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, datapath=DATAPATH, cachepath=CACHEPATH, storepath=STOREPATH):
+        """from the partitioned store once it has been initialised, otherwise from the csv (or its parquet cache)"""
+        files = list_partition_files(storepath)
+        if files:
+            return cls(read_partition_files(files), files, storepath)
+        return cls(read_data(datapath, cachepath))
+
+    def append(self, batch, files=()):
+        """merge a batch of new raw transactions"""
+        with self.lock:
+            self._append(batch, files)
+
+    def refresh(self):
+        """merge the part files written to the store since the last refresh, returns how many there were"""
+        if self.storepath is None:
+            return 0
+        with self.lock:
+            files = [path for path in list_partition_files(self.storepath) if path not in self.files]
+            if files:
+                self._append(read_partition_files(files), files)
+        return len(files)
+
+    def _append(self, batch, files):
+        new = enrich_data(apply_dtype_plan(batch.reset_index(drop=True)))
+        data = concat_frames(self.data, new)
+        card_index = self.card_index.append(new, len(self.data))
+        # cards with transactions older than their last known one can not be updated from the batch alone
+        last_time = new['cc_num'].map(self.time_gaps['last_time'])
+        late_cards = new.loc[(new['trans_date_trans_time'] < last_time).to_numpy(), 'cc_num'].unique()
+        time_gaps = time_gap_state(new[~new['cc_num'].isin(late_cards)], previous=self.time_gaps)
+        if len(late_cards):
+            positions = np.concatenate([card_index.positions(cc) for cc in late_cards])
+            time_gaps.loc[late_cards] = time_gap_state(data.take(positions)).loc[late_cards, time_gaps.columns]
+        # built aside and swapped in when complete, readers holding the previous frame keep a consistent view
+        self.data, self.card_index, self.time_gaps = data, card_index, time_gaps
+        self.fraud_stats = merge_fraud_stats(self.fraud_stats, aggregate_fraud_stats(new))
+        self.files.update(files)
+        self.version += 1
+
+# the dataset load_dataset built, so lookups can use it when loaded without loading it
+# weak, clearing the resource cache frees the dataset
+_loaded = weakref.WeakValueDictionary()
+
+@st.cache_resource
+def load_dataset():
+    """IncrementalDataset of the full dataset, built once and shared across sessions"""
+    dataset = IncrementalDataset.load()
+    _loaded['dataset'] = dataset
+    return dataset
+
+def current_dataset():
+    """the shared dataset, after merging partitions appended to the store since the last call"""
+    dataset = load_dataset()
+    dataset.refresh()
+    return dataset
+
+def loaded_dataset():
+    """current_dataset when this process has loaded it already, None otherwise"""
+    dataset = _loaded.get('dataset')
+    if dataset is not None:
+        dataset.refresh()
+    return dataset
+
+class PandasBackend:
+    """page queries answered from the shared in-memory dataset"""
+    name = 'pandas'
+
+    def __init__(self, dataset=None):
+        self.dataset = dataset if dataset is not None else current_dataset()
+        self.version = self.dataset.version
+
+    def fraud_stats(self, dimension):
+        """aggregate_fraud_stats table of one dimension"""
+        stats = self.dataset.fraud_stats
+        return stats[dimension] if dimension in stats else aggregate_fraud_stats(self.dataset.data, [dimension])[dimension]
+
+    def fraud_rate(self, dimension):
+        return self.fraud_stats(dimension)['fraud_rate'].rename(None)
+
+    def high_risk_summary(self, key, extra_keys=(), threshold_sigma=3):
+        return high_risk_summary(self.dataset.data, key, extra_keys, threshold_sigma, fraud_rate=self.fraud_rate(key))
+
+    def card_transactions(self, cc_num):
+        return card_transactions(cc_num, self.dataset.data, self.dataset.card_index)
+
+def _age_group_sql(age):
+    """bucket number (0 based) of pd.cut(age, AGE_GROUP_BINS), NULL outside the bins"""
+    cases = " ".join(f"WHEN {age} > {lo} AND {age} <= {hi} THEN {i}"
+                     for i, (lo, hi) in enumerate(zip(AGE_GROUP_BINS[:-1], AGE_GROUP_BINS[1:])))
+    return f"CASE {cases} END"
+
+_AGE_SQL = f"{AGE_REFERENCE_YEAR} - year(CAST(dob AS TIMESTAMP))"
+_HOUR_SQL = "hour(CAST(trans_date_trans_time AS TIMESTAMP))"
+# enrich_data columns the duckdb backend groups by, as sql over the stored columns
+DERIVED_SQL = {
+    'age': _AGE_SQL,
+    # refers to the age column above, duckdb resolves aliases of the same select list
+    'age_group': _age_group_sql('age'),
+    'card_bin': "left(CAST(cc_num AS VARCHAR), 6)",
+    'day_of_week': "dayname(CAST(trans_date_trans_time AS TIMESTAMP))",
+    'trans_hour': _HOUR_SQL,
+    # same buckets as time_period
+    'timeperiod': f"""CASE WHEN {_HOUR_SQL} >= 6 AND {_HOUR_SQL} < 12 THEN 'morning'
+        WHEN {_HOUR_SQL} >= 12 AND {_HOUR_SQL} < 14 THEN 'noon'
+        WHEN {_HOUR_SQL} >= 14 AND {_HOUR_SQL} < 18 THEN 'afternoon'
+        WHEN {_HOUR_SQL} >= 18 AND {_HOUR_SQL} < 22 THEN 'evening' ELSE 'midnight' END""",
+    'fraud_amt': "CASE WHEN is_fraud = 1 THEN amt ELSE 0 END",
+    'name': "CAST(\"first\" AS VARCHAR) || ' ' || CAST(\"last\" AS VARCHAR)",
+}
+
+def _sql_name(column):
+    return '"' + column.replace('"', '""') + '"'
+
+class DuckDBBackend:
+    """page queries pushed down to duckdb over parquet files, nothing but the results is held in memory
+    scans run on DUCKDB_THREADS threads; an instance serves one set of files and caches its fraud stats and card lookups"""
+    name = 'duckdb'
+
+    def __init__(self, files, threads=DUCKDB_THREADS, memory_limit=DUCKDB_MEMORY_LIMIT):
+        import duckdb
+        self.files = list(files)
+        self.version = files_fingerprint(self.files)
+        # no cache of the parquet file contents, the os page cache has them and worker memory stays flat
+        self.con = duckdb.connect(config={'threads': threads, 'memory_limit': memory_limit,
+                                          'enable_external_file_cache': False})
+        paths = "[" + ", ".join("'" + path.replace("'", "''") + "'" for path in self.files) + "]"
+        self.con.execute(f"CREATE VIEW stored AS SELECT * FROM read_parquet({paths}, union_by_name = true, "
+                         f"filename = true, file_row_number = true)")
+        derived = ", ".join(f"{sql} AS {name}" for name, sql in DERIVED_SQL.items())
+        self.con.execute(f"CREATE VIEW transactions AS SELECT *, {derived} FROM stored")
+        # position of each file's first row in the concatenated dataset, like the rows of IncrementalDataset
+        counts = dict(self.con.execute(f"SELECT file_name, num_rows FROM parquet_file_metadata({paths})").fetchall())
+        self.offsets = dict(zip(self.files, np.cumsum([0] + [counts[path] for path in self.files[:-1]]).tolist()))
+        self.fraud_stats = lru_cache(maxsize=64)(self._fraud_stats)
+        self.card_transactions = lru_cache(maxsize=64)(self._card_transactions)
+
+    def query(self, sql, params=None):
+        """result of sql as a frame, on its own cursor so sessions can query concurrently"""
+        with self.con.cursor() as cursor:
+            return cursor.execute(sql, params).df()
+
+    def _fraud_stats(self, dimension):
+        """aggregate_fraud_stats table of one dimension, shared, treat as read only"""
+        key = _sql_name(dimension)
+        table = self.query(f"""SELECT {key} AS key, count(*) AS count, CAST(sum(is_fraud) AS BIGINT) AS fraud_count,
+            sum(amt) AS amount, sum(fraud_amt) AS fraud_amount FROM transactions GROUP BY ALL ORDER BY key""")
+        # the missing key group is dropped here, a filter in sql evaluates a derived key once more per row
+        table = table[table['key'].notna()].reset_index(drop=True)
+        keys = table.pop('key')
+        if dimension == 'age_group':
+            keys = pd.IntervalIndex.from_breaks(AGE_GROUP_BINS)[keys.to_numpy()]
+        table.index = pd.Index(keys, name=dimension)
+        table['fraud_rate'] = table['fraud_count'] / table['count'] * 100
+        return table
+
+    def fraud_rate(self, dimension):
+        return self.fraud_stats(dimension)['fraud_rate'].rename(None)
+
+    def high_risk_summary(self, key, extra_keys=(), threshold_sigma=3):
+        """high_risk_summary, the totals of the high risk groups computed by duckdb"""
+        fraud_rate = self.fraud_rate(key)
+        threshold = fraud_rate.mean() + threshold_sigma * fraud_rate.std()
+        high_risk = fraud_rate[fraud_rate > threshold].index.tolist()
+        columns = ", ".join(_sql_name(col) for col in (key, *extra_keys))
+        not_null = " AND ".join(f"{_sql_name(col)} IS NOT NULL" for col in extra_keys) or "true"
+        summary_table = self.query(f"""SELECT {columns}, sum(amt) AS Total_Amount, sum(fraud_amt) AS Fraud_Amount,
+            count(amt) AS Total_Transactions, CAST(sum(is_fraud) AS BIGINT) AS Fraud_Transactions
+            FROM transactions WHERE list_contains(?, {_sql_name(key)}) AND {not_null}
+            GROUP BY {columns} ORDER BY {columns}""", [high_risk])
+        summary_table['Fraud Rate (%)'] = (summary_table['Fraud_Transactions'] / summary_table['Total_Transactions']) * 100
+        return summary_table, threshold
+
+    def _card_transactions(self, cc_num):
+        """transactions of one card in time order, enriched and indexed by their position in the dataset
+        a scan of the cc_num column, card_transactions uses the card index instead once the dataset is loaded"""
+        # the card's rows are found from cc_num alone before any other column is read, reading every column
+        # while filtering decodes them for all rows
+        rows = self.query("""SELECT * FROM stored WHERE (filename, file_row_number) IN
+            (SELECT (filename, file_row_number) FROM stored WHERE cc_num = ?)""", [int(cc_num)])
+        positions = rows.pop('filename').map(self.offsets).to_numpy() + rows.pop('file_row_number').to_numpy()
+        rows = enrich_data(apply_dtype_plan(rows.set_axis(positions).sort_index()))
+        return rows.sort_values('trans_date_trans_time', kind='stable')
+
+def parquet_source_files(datapath=DATAPATH, cachepath=CACHEPATH, storepath=STOREPATH):
+    """parquet files holding the whole dataset: the store partitions, or the parquet cache when it is fresh"""
+    files = list_partition_files(storepath)
+    if files:
+        return files
+    if os.path.exists(cachepath) and os.path.exists(datapath) and os.path.getmtime(cachepath) >= os.path.getmtime(datapath):
+        return [cachepath]
+    return []
+
+def dataset_summary(files, preview_rows=5):
+    """(rows, columns, preview) of the dataset stored in parquet files, like load_data().shape and .head()
+    rows and columns come from the file footers and the preview from the first rows of the first file, nothing else is read"""
+    import pyarrow.parquet as pq
+    rows = sum(pq.ParquetFile(path).metadata.num_rows for path in files)
+    # the columns of the first file, like the dataset schema read_partition_files infers
+    first = pq.ParquetFile(files[0])
+    head = next(first.iter_batches(batch_size=preview_rows)).to_pandas()
+    return rows, len(first.schema_arrow.names), apply_dtype_plan(head)
+
+def load_dataset_summary():
+    """dataset_summary of the parquet source files, once per version of the files
+    None before the parquet cache exists, the first full load writes it"""
+    files = parquet_source_files()
+    if not files:
+        return None
+    return _dataset_summary(tuple(files), files_fingerprint(files))
+
+@st.cache_data(max_entries=2)
+def _dataset_summary(files, fingerprint):
+    return dataset_summary(list(files))
+
+def query_backend_name(name=None):
+    """name of the backend query_backend returns, without creating it"""
+    name = name or os.environ.get(QUERY_BACKEND_ENV, 'duckdb')
+    if name == 'duckdb' and find_spec('duckdb') and parquet_source_files():
+        return 'duckdb'
+    return 'pandas'
+
+def query_backend(name=None):
+    """backend for the page queries, picked by QUERY_BACKEND_ENV (duckdb by default)"""
+    if query_backend_name(name) == 'duckdb':
+        files = parquet_source_files()
+        return _duckdb_backend(tuple(files), files_fingerprint(files))
+    return PandasBackend()
+
+@st.cache_resource(max_entries=2)
+def _duckdb_backend(files, fingerprint):
+    return DuckDBBackend(files)
+
+class Linkage:
+    """distinct (left, right) value pairs of two columns, stored as sorted integer codes
+    with offset arrays so both directions are looked up without scanning the data"""
+
+    def __init__(self, left, right):
+        left_codes, self.left_keys = group_codes(left)
+        right_codes, self.right_keys = group_codes(right)
+        valid = (left_codes >= 0) & (right_codes >= 0)
+        n_right = len(self.right_keys)
+        pairs = np.unique(left_codes[valid].astype(np.int64) * n_right + right_codes[valid])
+        self.left, self.right = np.divmod(pairs, n_right)
+        self.left_offsets = np.searchsorted(self.left, np.arange(len(self.left_keys) + 1))
+        self.by_right = np.argsort(self.right, kind='stable')
+        self.right_offsets = np.searchsorted(self.right[self.by_right], np.arange(n_right + 1))
+
+    def partners(self, value):
+        """distinct right values linked to one left value"""
+        i = self.left_keys.get_loc(value)
+        return self.right_keys[self.right[self.left_offsets[i]:self.left_offsets[i + 1]]]
+
+    def reverse_partners(self, value):
+        """distinct left values linked to one right value"""
+        i = self.right_keys.get_loc(value)
+        return self.left_keys[self.left[self.by_right[self.right_offsets[i]:self.right_offsets[i + 1]]]]
+
+    def counts(self, left_name, right_name):
+        """number of distinct right values per left value, largest first, like value_counts"""
+        counts = np.diff(self.left_offsets)
+        table = pd.DataFrame({left_name: self.left_keys, right_name: counts})
+        return table[counts > 0].sort_values(right_name, ascending=False, kind='stable').reset_index(drop=True)
+
+    def pairs(self, left_name, right_name):
+        """the distinct pairs as a frame of categoricals over all keys, Linkage(*columns) rebuilds the linkage"""
+        return pd.DataFrame({left_name: pd.Categorical.from_codes(self.left, categories=self.left_keys),
+                             right_name: pd.Categorical.from_codes(self.right, categories=self.right_keys)})
+
+IDENTITY_LINKS = [('name', 'cc_num'), ('name', 'street'), ('cc_num', 'street'), ('lat_long', 'street')]
+
+def identity_links(data, links=IDENTITY_LINKS):
+    """Linkage of every column pair in links, keyed by the pair"""
+    return {(left, right): Linkage(data[left], data[right]) for left, right in links}
+
+def load_identity_links():
+    """name/cc/street/geolocation linkages of the full dataset, built once per dataset version and shared across sessions"""
+    return _identity_links(current_dataset().version)
+
+@st.cache_resource(max_entries=1)
+def _identity_links(version):
+    return identity_links(load_enriched_data())
@@ -0,0 +1,44 @@
+import os
+import threading
+import time
+
+# path -> artifact entry, shared by every session in the process
+_ARTIFACTS = {}
+_LOCK = threading.Lock()
+
+
+def load_artifact(path, loader, key=None):
+    """return loader(path), loaded lazily once per process
+    the entry is keyed by path (or key) and mtime, so a replaced file is loaded again on next use"""
+    key = key or path
+    mtime = os.path.getmtime(path)
+    entry = _ARTIFACTS.get(key)
+    if entry is not None and entry['mtime'] == mtime:
+        return entry['artifact']
+    with _LOCK:
+        # another thread may have loaded it while we waited
+        entry = _ARTIFACTS.get(key)
+        if entry is not None and entry['mtime'] == mtime:
+            return entry['artifact']
+        start = time.perf_counter()
+        artifact = loader(path)
+        _ARTIFACTS[key] = {
+            'artifact': artifact,
+            'mtime': mtime,
+            'load_seconds': time.perf_counter() - start,
+            'loaded_at': time.time(),
+            'loads': entry['loads'] + 1 if entry else 1,
+        }
+    return artifact
+
+
+def load_timings():
+    """load time, mtime and reload count of every artifact loaded so far"""
+    return {path: {key: value for key, value in entry.items() if key != 'artifact'}
+            for path, entry in _ARTIFACTS.items()}
+
+
+def clear():
+    """drop all loaded artifacts, the next use loads them again"""
+    with _LOCK:
+        _ARTIFACTS.clear()
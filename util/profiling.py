@@ -0,0 +1,202 @@
+"""Per page render profiling.
+
+Enabled with the environment variable FRAUD_APP_PROFILE=1 or by opening a page
+with ?debug=1. When enabled, every step records wall time and peak traced memory,
+the sidebar shows a timing panel and a JSON trace is written to PROFILE_DIR
+(default .profile_traces/) for comparing runs across versions.
+When disabled, step(), section() and profiled() only cost a flag check; when
+enabled, tracemalloc slows the page down, so compare traces with each other
+rather than with unprofiled timings. tracemalloc and its peak are process wide, so
+one run at a time traces memory, from start_page until finish_page stops tracing;
+a profiled run overlapping it records wall times only (peak_mb and retained_mb None).
+"""
+import functools
+import json
+import os
+import subprocess
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+import streamlit as st
+
+PROFILE_ENV = "FRAUD_APP_PROFILE"
+PROFILE_DIR = os.environ.get("FRAUD_APP_PROFILE_DIR", ".profile_traces")
+
+# each streamlit session runs its script in its own thread
+_state = threading.local()
+# thread of the run tracing memory, None when no run is
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+def profiling_enabled():
+    if os.environ.get(PROFILE_ENV, "") not in ("", "0"):
+        return True
+    try:
+        return st.query_params.get("debug") == "1"
+    except Exception:
+        return False
+
+
+@functools.lru_cache(maxsize=1)
+def code_version():
+    """short git commit of the running code, if available"""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def start_page(page):
+    """begin the trace of one script run of page"""
+    _state.enabled = profiling_enabled()
+    _state.page = page
+    _state.steps = []
+    _state.open = []
+    _state.section = None
+    _state.started = time.perf_counter()
+    _state.started_at = time.time()
+    _state.memory = _state.enabled and _start_tracing()
+    if not _state.enabled and _tracer is not None:
+        _stop_stale_tracing()
+
+
+def _start_tracing():
+    """start tracing memory for the current run, False while another run is tracing"""
+    global _tracer
+    current = threading.current_thread()
+    with _tracer_lock:
+        # a run stopped before finish_page (st.stop, an exception) leaves its thread here,
+        # taken over once that thread has ended or runs the script again
+        if _tracer is not None and _tracer is not current and _tracer.is_alive():
+            return False
+        _tracer = current
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        return True
+
+
+def _stop_tracing():
+    global _tracer
+    with _tracer_lock:
+        if _tracer is threading.current_thread():
+            _tracer = None
+            tracemalloc.stop()
+
+
+def _stop_stale_tracing():
+    """stop the tracing a run left on when it ended without finish_page"""
+    global _tracer
+    current = threading.current_thread()
+    with _tracer_lock:
+        if _tracer is not None and (_tracer is current or not _tracer.is_alive()):
+            _tracer = None
+            tracemalloc.stop()
+
+
+def _open(name):
+    memory = 0
+    if _state.memory:
+        # peaks are reset per frame, so fold the peak so far into the enclosing frames first
+        peak = tracemalloc.get_traced_memory()[1]
+        for frame in _state.open:
+            frame["peak"] = max(frame["peak"], peak)
+        tracemalloc.reset_peak()
+        memory = tracemalloc.get_traced_memory()[0]
+    # rows are listed in the order steps start, so nested steps follow their parent
+    frame = {"row": {"step": "  " * len(_state.open) + name}, "memory": memory,
+             "peak": 0, "start": time.perf_counter()}
+    _state.steps.append(frame["row"])
+    _state.open.append(frame)
+    return frame
+
+
+def _close(frame):
+    seconds = time.perf_counter() - frame["start"]
+    _state.open.remove(frame)
+    if not _state.memory:
+        frame["row"].update({"seconds": round(seconds, 6), "peak_mb": None, "retained_mb": None})
+        return
+    current, peak = tracemalloc.get_traced_memory()
+    peak = max(peak, frame["peak"])
+    for parent in _state.open:
+        parent["peak"] = max(parent["peak"], peak)
+    frame["row"].update({
+        "seconds": round(seconds, 6),
+        "peak_mb": round((peak - frame["memory"]) / 2**20, 3),
+        "retained_mb": round((current - frame["memory"]) / 2**20, 3),
+    })
+
+
+@contextmanager
+def step(name):
+    """time a block of the page, with its peak memory when tracing"""
+    if not getattr(_state, "enabled", False):
+        yield
+        return
+    frame = _open(name)
+    try:
+        yield
+    finally:
+        _close(frame)
+
+
+def section(name):
+    """end the previous section of the page and start timing the next one
+    for top level script code, where wrapping every block in a with statement is awkward"""
+    if not getattr(_state, "enabled", False):
+        return
+    if _state.section is not None:
+        _close(_state.section)
+    _state.section = _open(name)
+
+
+def profiled(name=None):
+    """decorator form of step, named after the function by default"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with step(name or fn.__name__):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def trace():
+    """the current run's trace as a dict"""
+    return {
+        "page": getattr(_state, "page", None),
+        "version": code_version(),
+        "started_at": getattr(_state, "started_at", None),
+        "memory_traced": getattr(_state, "memory", False),
+        "total_seconds": round(time.perf_counter() - _state.started, 6) if hasattr(_state, "started") else None,
+        "steps": list(getattr(_state, "steps", [])),
+    }
+
+
+def write_trace(run_trace, profile_dir=PROFILE_DIR):
+    os.makedirs(profile_dir, exist_ok=True)
+    page = "".join(c if c.isalnum() else "_" for c in run_trace["page"] or "page")
+    path = os.path.join(profile_dir, f"{page}_{int(run_trace['started_at'] * 1000)}.json")
+    with open(path, "w") as f:
+        json.dump(run_trace, f, indent=2)
+    return path
+
+
+def finish_page():
+    """show the sidebar timing panel and write the JSON trace, when profiling is enabled"""
+    if not getattr(_state, "enabled", False):
+        return
+    if _state.section is not None:
+        _close(_state.section)
+        _state.section = None
+    if _state.memory:
+        _stop_tracing()
+    run_trace = trace()
+    path = write_trace(run_trace)
+    with st.sidebar.expander("Render profile", expanded=True):
+        st.write(f"Total: {run_trace['total_seconds']:.3f}s")
+        st.dataframe(run_trace["steps"], use_container_width=True)
+        st.caption(f"Trace written to {path}")
@@ -0,0 +1,125 @@
+"""Headless batch scoring with the app's preprocessing and model.
+
+usage: python -m util.score INPUT [INPUT ...] [--output-dir DIR] [--format csv|parquet]
+                            [--chunksize 100000] [--n-jobs 4] [--engine flat|pickle]
+                            [--velocity-state velocity.pkl]
+
+INPUT is a csv or parquet file, or a directory of them. Each input is written
+to OUTPUT_DIR/<name>_scored.<format> with fraud_probability and prediction columns.
+With --velocity-state the per-card velocity features of util/velocity are added
+as columns; the card state is read from and saved back to that file, so the next
+run continues where this one stopped. Inputs are taken in time order.
+Run from the repository root, model and encoder paths are relative to it.
+"""
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from util.helper_function import score_frame, update_score_summary, ScoredFileWriter, MODEL_ENGINE_ENV
+from util.velocity import VelocityEngine, with_velocity
+
+INPUT_EXTENSIONS = ('.csv', '.csv.bz2', '.csv.gz', '.parquet')
+
+
+def find_inputs(paths):
+    """expand directories into the csv/parquet files they contain"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(INPUT_EXTENSIONS))
+        else:
+            files.append(path)
+    return files
+
+
+def read_chunks(path, chunksize):
+    """yield the file as frames of at most chunksize rows"""
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunksize)
+
+
+def output_path(path, output_dir, fmt):
+    name = os.path.basename(path)
+    for ext in INPUT_EXTENSIONS:
+        if name.endswith(ext):
+            name = name[:-len(ext)]
+            break
+    return os.path.join(output_dir, f"{name}_scored.{fmt}")
+
+
+class _Done:
+    """completed result with the Future interface, for the single process path"""
+
+    def __init__(self, value):
+        self.value = value
+
+    def result(self):
+        return self.value
+
+
+def score_file(path, outpath, chunksize, executor=None, max_pending=None, velocity=None):
+    """score one file chunk by chunk, in order, with at most max_pending chunks in flight
+    velocity features are computed here, in chunk order, before a chunk goes to a worker"""
+    summary = {}
+    pending = deque()
+    with ScoredFileWriter(outpath) as writer:
+        def drain(n):
+            while len(pending) > n:
+                scored = pending.popleft().result()
+                writer.write(scored)
+                update_score_summary(summary, scored)
+
+        for chunk in read_chunks(path, chunksize):
+            chunk = with_velocity(chunk, velocity)
+            if executor is None:
+                pending.append(_Done(score_frame(chunk)))
+            else:
+                pending.append(executor.submit(score_frame, chunk))
+            drain(max_pending or 0)
+        drain(0)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m util.score", description="Score transaction files for fraud.")
+    parser.add_argument("inputs", nargs="+", help="csv/parquet files or directories")
+    parser.add_argument("--output-dir", default=".", help="directory for the scored files")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="parquet")
+    parser.add_argument("--chunksize", type=int, default=100_000, help="rows per chunk")
+    parser.add_argument("--n-jobs", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--engine", choices=["flat", "pickle"], default=None,
+                        help="flat export (fast start, small workers) or the pickled classifier (default, faster on large chunks)")
+    parser.add_argument("--velocity-state", default=None, help="add velocity features, keeping card state in this file")
+    args = parser.parse_args(argv)
+    if args.engine:
+        # set before the workers start, they inherit the environment
+        os.environ[MODEL_ENGINE_ENV] = args.engine
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    executor = ProcessPoolExecutor(max_workers=args.n_jobs) if args.n_jobs > 1 else None
+    velocity = VelocityEngine.load(args.velocity_state) if args.velocity_state else None
+    try:
+        for path in find_inputs(args.inputs):
+            start = time.perf_counter()
+            outpath = output_path(path, args.output_dir, args.format)
+            summary = score_file(path, outpath, args.chunksize, executor, max_pending=2 * args.n_jobs,
+                                 velocity=velocity)
+            if velocity is not None:
+                velocity.save(args.velocity_state)
+            seconds = time.perf_counter() - start
+            rows = summary.get('rows', 0)
+            print(f"{path} -> {outpath}: {rows:,} rows, {summary.get('predicted_fraud', 0):,} predicted fraud, "
+                  f"{seconds:.1f}s ({rows / max(seconds, 1e-9):,.0f} rows/s)")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
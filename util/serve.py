@@ -0,0 +1,189 @@
+"""Local fraud scoring service with micro-batching.
+
+usage: python -m util.serve [--host 127.0.0.1] [--port 8765] [--max-batch 256] [--max-wait-ms 2]
+                            [--velocity-state velocity.pkl]
+
+POST /score   body: one transaction as a JSON object, or a list of them
+              -> {"fraud_probability": p, "prediction": 0/1} (or a list)
+GET  /stats   -> request count, batch sizes and p50/p99 latency in milliseconds
+GET  /health  -> {"status": "ok"}
+
+Concurrent requests are queued and scored together, so the model evaluates
+arrays of rows instead of one row per call. With --velocity-state every response
+also carries the card's velocity features (util/velocity), updated per request from
+the state file written by util.score; the state is saved back on shutdown.
+Run from the repository root.
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import time
+from collections import deque
+import numpy as np
+from util.helper_function import pre_process_record, prediction_model, load_encoders, MODEL_ENGINE_ENV, ONLINE_ENGINE
+from util.velocity import VelocityEngine
+
+LATENCY_WINDOW = 10_000
+
+
+class MicroBatcher:
+    """collect feature rows from concurrent requests and score them in batches"""
+
+    def __init__(self, model, max_batch=256, max_wait_ms=2.0):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.queue = asyncio.Queue()
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.batch_sizes = deque(maxlen=LATENCY_WINDOW)
+        self.requests = 0
+
+    async def score(self, features):
+        """fraud probability of one feature row, resolved when its batch has been scored"""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((features, future, time.perf_counter()))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            X = np.array([features for features, _, _ in batch], dtype=float)
+            try:
+                # predict off the event loop so new requests keep queueing meanwhile
+                probability = await loop.run_in_executor(None, lambda: self.model.predict_proba(X)[:, 1])
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            done = time.perf_counter()
+            for (_, future, start), p in zip(batch, probability):
+                if not future.done():
+                    future.set_result(float(p))
+                self.latencies.append(done - start)
+            self.batch_sizes.append(len(batch))
+            self.requests += len(batch)
+
+    def stats(self):
+        latencies = np.array(self.latencies) * 1000
+        return {
+            'requests': self.requests,
+            'batches': len(self.batch_sizes),
+            'mean_batch_size': float(np.mean(self.batch_sizes)) if self.batch_sizes else 0.0,
+            'p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else None,
+            'p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else None,
+        }
+
+
+class ScoringServer:
+    """minimal HTTP/1.1 server with keep-alive on top of asyncio streams"""
+
+    def __init__(self, batcher, encoders, velocity=None):
+        self.batcher = batcher
+        self.encoders = encoders
+        self.velocity = velocity
+
+    async def score_record(self, record):
+        features = pre_process_record(record, encoders=self.encoders)
+        # updated before awaiting, on the event loop, so card state changes in arrival order
+        velocity = self.velocity.update_record(record) if self.velocity is not None else {}
+        probability = await self.batcher.score(features)
+        result = {'fraud_probability': probability, 'prediction': int(probability >= 0.5)}
+        # NaN (first transaction of a card) is not valid JSON
+        result.update({name: None if value != value else value for name, value in velocity.items()})
+        return result
+
+    async def route(self, method, path, body):
+        if method == 'GET' and path == '/health':
+            return 200, {'status': 'ok'}
+        if method == 'GET' and path == '/stats':
+            return 200, self.batcher.stats()
+        if method == 'POST' and path == '/score':
+            try:
+                payload = json.loads(body)
+                if isinstance(payload, list):
+                    return 200, list(await asyncio.gather(*[self.score_record(record) for record in payload]))
+                return 200, await self.score_record(payload)
+            except (ValueError, KeyError, TypeError) as e:
+                return 400, {'error': f"{type(e).__name__}: {e}"}
+        return 404, {'error': 'not found'}
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                try:
+                    status, result = await self.route(method, path, body)
+                except Exception as e:
+                    # any other failure of a request is answered, not a dropped connection
+                    status, result = 500, {'error': f"{type(e).__name__}: {e}"}
+                payload = json.dumps(result).encode()
+                writer.write(f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                             f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n".encode()
+                             + payload)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(host, port, max_batch, max_wait_ms, velocity_state=None):
+    # load once before accepting traffic so the first request is not cold
+    # micro-batches are small, where the flat export scores fastest
+    model = prediction_model(engine=os.environ.get(MODEL_ENGINE_ENV, ONLINE_ENGINE))
+    batcher = MicroBatcher(model, max_batch, max_wait_ms)
+    velocity = VelocityEngine.load(velocity_state) if velocity_state else None
+    server = ScoringServer(batcher, load_encoders(), velocity)
+    batch_task = asyncio.create_task(batcher.run())
+    tcp_server = await asyncio.start_server(server.handle, host, port)
+    print(f"scoring service listening on http://{host}:{port}")
+    try:
+        async with tcp_server:
+            await tcp_server.serve_forever()
+    finally:
+        batch_task.cancel()
+        if velocity is not None:
+            velocity.save(velocity_state)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m util.serve", description="Local micro-batching fraud scoring service.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-batch", type=int, default=256, help="largest batch passed to the model")
+    parser.add_argument("--max-wait-ms", type=float, default=2.0, help="how long a batch waits to fill up")
+    parser.add_argument("--velocity-state", default=None, help="add velocity features, keeping card state in this file")
+    args = parser.parse_args(argv)
+    # stop on SIGTERM like on Ctrl-C, so the velocity state is saved
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        asyncio.run(serve(args.host, args.port, args.max_batch, args.max_wait_ms, args.velocity_state))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""Spatial index and hex binned fraud density of transaction locations.
+
+GridIndex buckets points into cell_degrees x cell_degrees lat/long cells and keeps the
+row positions sorted by cell with an offsets array, like CardIndex. A radius query reads
+only the cells overlapping the circle's bounding box and keeps the points within the
+radius by haversine; nearest() doubles the radius until it holds k points, so the k
+nearest are exact. hexbin_fraud aggregates points into hexagons server side, so a map
+layer draws one column per hexagon instead of one point per transaction.
+"""
+import numpy as np
+import pandas as pd
+import streamlit as st
+from util.helper_function import haversine, current_dataset
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = np.pi * EARTH_RADIUS_KM / 180
+CELL_DEGREES = 0.5
+# indexed locations: name -> (lat column, long column)
+LOCATIONS = {'customer': ('lat', 'long'), 'merchant': ('merch_lat', 'merch_long')}
+# hexagon size, center to corner
+HEX_KM = 25
+
+
+def _ranges(starts, stops):
+    """concatenation of arange(start, stop) for every pair, without a python loop"""
+    lengths = stops - starts
+    total = lengths.sum()
+    if not total:
+        return np.zeros(0, dtype=np.int64)
+    ends = np.cumsum(lengths)
+    return np.arange(total) - np.repeat(ends - lengths, lengths) + np.repeat(starts, lengths)
+
+
+class GridIndex:
+    """points bucketed by lat/long grid cell, for radius and k nearest queries in km"""
+
+    def __init__(self, lat, long, cell_degrees=CELL_DEGREES):
+        lat = np.asarray(lat, dtype=float)
+        long = np.asarray(long, dtype=float)
+        self.cell_degrees = cell_degrees
+        self.n_lat = int(np.ceil(180 / cell_degrees))
+        self.n_long = int(np.ceil(360 / cell_degrees))
+        cells = self._lat_cell(lat) * self.n_long + self._long_cell(long)
+        # row positions in cell order, with the coordinates in the same order for locality
+        self.order = np.argsort(cells, kind='stable')
+        self.lat = lat[self.order]
+        self.long = long[self.order]
+        self.offsets = np.searchsorted(cells[self.order], np.arange(self.n_lat * self.n_long + 1))
+
+    def __len__(self):
+        return len(self.order)
+
+    def _lat_cell(self, lat):
+        return np.clip(np.floor((lat + 90) / self.cell_degrees), 0, self.n_lat - 1).astype(np.int64)
+
+    def _long_cell(self, long):
+        return (np.floor(((long + 180) % 360) / self.cell_degrees) % self.n_long).astype(np.int64)
+
+    def _candidates(self, lat, long, radius_km):
+        """sorted positions of the points in the cells around the circle's bounding box"""
+        lat_span = radius_km / KM_PER_DEGREE
+        low, high = max(lat - lat_span, -90), min(lat + lat_span, 90)
+        lat_cells = np.arange(self._lat_cell(low), self._lat_cell(high) + 1)
+        widest = np.cos(np.radians(min(max(abs(low), abs(high)), 90)))
+        long_span = radius_km / (KM_PER_DEGREE * widest) if widest > 1e-9 else 180
+        if long_span >= 180:
+            long_cells = np.arange(self.n_long)
+        else:
+            first = int(np.floor((long - long_span + 180) / self.cell_degrees))
+            last = int(np.floor((long + long_span + 180) / self.cell_degrees))
+            long_cells = np.unique(np.arange(first, last + 1) % self.n_long)
+        cells = (lat_cells[:, None] * self.n_long + long_cells).ravel()
+        return _ranges(self.offsets[cells], self.offsets[cells + 1])
+
+    def within(self, lat, long, radius_km):
+        """(row positions, km) of the points within radius_km of (lat, long), nearest first"""
+        candidates = self._candidates(lat, long, radius_km)
+        km = haversine(lat, long, self.lat[candidates], self.long[candidates])
+        inside = km <= radius_km
+        candidates, km = candidates[inside], km[inside]
+        nearest = np.argsort(km, kind='stable')
+        return self.order[candidates[nearest]], km[nearest]
+
+    def nearest(self, lat, long, k):
+        """(row positions, km) of the k points nearest to (lat, long), nearest first"""
+        k = min(k, len(self))
+        radius_km = self.cell_degrees * KM_PER_DEGREE
+        while True:
+            positions, km = self.within(lat, long, radius_km)
+            # every point closer than the radius is found, so the k nearest are among them
+            if len(positions) >= k or radius_km > np.pi * EARTH_RADIUS_KM:
+                return positions[:k], km[:k]
+            radius_km *= 2
+
+
+def build_spatial_index(data, location, cell_degrees=CELL_DEGREES):
+    lat_col, long_col = LOCATIONS[location]
+    return GridIndex(data[lat_col].to_numpy(), data[long_col].to_numpy(), cell_degrees)
+
+
+def load_spatial_index(location):
+    """GridIndex of the customer or merchant locations of the full dataset, per dataset version"""
+    return _spatial_index(location, current_dataset().version)
+
+
+@st.cache_resource(max_entries=2)
+def _spatial_index(location, version):
+    return build_spatial_index(current_dataset().data, location)
+
+
+def area_summary(data, positions):
+    """transactions, fraud transactions, fraud rate (%) and cards of the rows at positions"""
+    rows = data.take(positions)
+    fraud = int(rows['is_fraud'].sum())
+    return {
+        'transactions': len(rows),
+        'fraud_transactions': fraud,
+        'fraud_rate': fraud / len(rows) * 100 if len(rows) else 0.0,
+        'cards': rows['cc_num'].nunique(),
+    }
+
+
+def cards_within(data, positions, km):
+    """per card transactions, fraud transactions and closest distance among the rows at positions"""
+    rows = data[['cc_num', 'is_fraud']].take(positions).assign(km=km)
+    return rows.groupby('cc_num').agg(transactions=('is_fraud', 'size'), fraud_transactions=('is_fraud', 'sum'),
+                                      closest_km=('km', 'min')).sort_values('closest_km').reset_index()
+
+
+def hexbin_fraud(lat, long, is_fraud, hex_km=HEX_KM, ref_lat=None):
+    """transactions and fraud per pointy top hexagon of hex_km (center to corner)
+    points are projected equirectangular around ref_lat (the mean latitude by default);
+    returns one row per non empty hexagon with its center, ref_lat and hex_km in attrs"""
+    lat = np.asarray(lat, dtype=float)
+    long = np.asarray(long, dtype=float)
+    is_fraud = np.asarray(is_fraud)
+    ref_lat = float(np.nanmean(lat)) if ref_lat is None else ref_lat
+    scale = np.cos(np.radians(ref_lat))
+    x = np.radians(long) * EARTH_RADIUS_KM * scale / hex_km
+    y = np.radians(lat) * EARTH_RADIUS_KM / hex_km
+    # axial coordinates, rounded to the nearest hexagon in cube coordinates
+    q, r = np.sqrt(3) / 3 * x - y / 3, 2 / 3 * y
+    s = -q - r
+    rq, rr, rs = np.round(q), np.round(r), np.round(s)
+    dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+    rq = np.where((dq > dr) & (dq > ds), -rr - rs, rq)
+    rr = np.where(~((dq > dr) & (dq > ds)) & (dr > ds), -rq - rs, rr)
+    # one int64 key per hexagon, |q| and |r| stay far below 2**31 for any hex_km over a meter
+    keys, inverse = np.unique(rq.astype(np.int64) * 2**32 + rr.astype(np.int64), return_inverse=True)
+    count = np.bincount(inverse, minlength=len(keys))
+    fraud_count = np.bincount(inverse, weights=is_fraud, minlength=len(keys)).astype(np.int64)
+    cell_r = (keys + 2**31) % 2**32 - 2**31
+    cell_q = (keys - cell_r) // 2**32
+    center_x = np.sqrt(3) * (cell_q + cell_r / 2) * hex_km
+    center_y = 1.5 * cell_r * hex_km
+    table = pd.DataFrame({
+        'lat': np.degrees(center_y / EARTH_RADIUS_KM),
+        'long': np.degrees(center_x / (EARTH_RADIUS_KM * scale)),
+        'count': count,
+        'fraud_count': fraud_count,
+        'fraud_rate': fraud_count / count * 100,
+    })
+    table.attrs.update(hex_km=hex_km, ref_lat=ref_lat)
+    return table
@@ -0,0 +1,106 @@
+"""Monthly partitioned parquet store for the transaction dataset.
+
+usage: python -m util.store init [--datapath credit_card_transactions.csv.bz2]
+       python -m util.store append new_transactions.csv [more.csv ...]
+
+Transactions are written under STOREPATH/month=YYYY-MM/part-<ns>.parquet by the
+month of trans_date_trans_time. Appending a batch only writes new part files, it
+never rewrites existing ones, so the app (and anything else reading the store) can
+pick up the files it has not seen yet instead of re-reading the full history.
+Run from the repository root.
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+import pandas as pd
+
+STOREPATH = "./util/data/transactions_store"
+PARTITION_COL = 'trans_date_trans_time'
+# rows per parquet row group of the transaction files, query engines scan row groups in parallel
+ROW_GROUP_ROWS = 122_880
+
+
+def store_exists(storepath=STOREPATH):
+    return bool(list_partition_files(storepath))
+
+
+def list_partition_files(storepath=STOREPATH):
+    """part files of the store in append order (month, then write time)"""
+    if not os.path.isdir(storepath):
+        return []
+    files = []
+    for month in sorted(os.listdir(storepath)):
+        month_dir = os.path.join(storepath, month)
+        if month.startswith("month=") and os.path.isdir(month_dir):
+            files.extend(os.path.join(month_dir, name) for name in sorted(os.listdir(month_dir))
+                         if name.endswith(".parquet"))
+    return files
+
+
+def source_files(datapath, storepath=STOREPATH):
+    """files the dataset is read from: the store partitions when initialised, otherwise the csv"""
+    return list_partition_files(storepath) or [datapath]
+
+
+def files_fingerprint(files, salt=()):
+    """hash of the files (path, size, mtime) and a json serialisable salt, e.g. a format version"""
+    h = hashlib.sha1(json.dumps(list(salt)).encode())
+    for path in files:
+        stat = os.stat(path)
+        h.update(f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return h.hexdigest()[:16]
+
+
+def read_partition_files(files):
+    """one frame of the given part files, categoricals with the union of their categories"""
+    import pyarrow.dataset as ds
+    return ds.dataset(list(files), format="parquet").to_table().to_pandas()
+
+
+def append_partitions(df, storepath=STOREPATH):
+    """write df as one new part file per month it covers, returns the written paths
+    each file goes through a temp name so readers never see a partial part"""
+    months = pd.to_datetime(df[PARTITION_COL]).dt.strftime("%Y-%m")
+    stamp = time.time_ns()
+    written = []
+    for month, part in df.groupby(months.to_numpy(), sort=True):
+        month_dir = os.path.join(storepath, f"month={month}")
+        os.makedirs(month_dir, exist_ok=True)
+        path = os.path.join(month_dir, f"part-{stamp}.parquet")
+        part.to_parquet(path + ".tmp", index=False, row_group_size=ROW_GROUP_ROWS)
+        os.replace(path + ".tmp", path)
+        written.append(path)
+    return written
+
+
+def main(argv=None):
+    from util.helper_function import read_raw_data, read_batch, DATAPATH
+    parser = argparse.ArgumentParser(prog="python -m util.store", description="Partitioned transaction store.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    init = commands.add_parser("init", help="seed the store from the full csv dataset")
+    init.add_argument("--datapath", default=DATAPATH)
+    init.add_argument("--storepath", default=STOREPATH)
+    append = commands.add_parser("append", help="append csv/parquet batches of new transactions")
+    append.add_argument("inputs", nargs="+")
+    append.add_argument("--storepath", default=STOREPATH)
+    args = parser.parse_args(argv)
+
+    if args.command == "init":
+        if store_exists(args.storepath):
+            parser.error(f"{args.storepath} already has partitions")
+        df = read_raw_data(args.datapath)
+        written = append_partitions(df, args.storepath)
+        print(f"{len(df):,} rows -> {len(written)} partitions in {args.storepath}")
+    else:
+        if not store_exists(args.storepath):
+            parser.error(f"no partitions in {args.storepath}, run python -m util.store init first")
+        for path in args.inputs:
+            df = read_batch(path)
+            written = append_partitions(df, args.storepath)
+            print(f"{path}: {len(df):,} rows -> {len(written)} part files")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""Train the fraud model and its label encoders from the transaction dataset.
+
+usage: python -m util.train [--model xgboost|random_forest] [--search halving|random] [--n-jobs -1]
+                            [--n-iter 30] [--seed 42] [--no-downsample] [--promote]
+
+Features come from the app's own fit_encoders/pre_process, so training and scoring
+encode the same way. The encoded feature matrix is cached under FEATURE_CACHE_DIR,
+keyed by the source files and FEATURE_VERSION, and reused by later runs on the same
+data. Hyperparameters are searched with successive halving (or a randomized search)
+in parallel over n_jobs processes. Every run writes model.pkl, dict_all.obj and
+metrics.json to ARTIFACT_DIR/<version>/; --promote also installs them as
+util/model.pkl and util/dict_all.obj, which the app picks up on the next use, and
+re-exports the flattened model of util/flat_model for xgboost models.
+Run from the repository root.
+"""
+import argparse
+import json
+import os
+import pickle
+import shutil
+import time
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+from util.helper_function import (fit_encoders, encoder_indexes, pre_process, read_data, read_raw_data, CATEGORICAL_COLS,
+                                  NUMERIC_COLS, DATAPATH, CACHEPATH, MODELPATH, DICTPATH, read_model)
+from util.flat_model import FLATMODELPATH, export_model, file_sha1
+from util.store import STOREPATH, read_partition_files, files_fingerprint, source_files as store_source_files
+
+ARTIFACT_DIR = "util/artifacts"
+FEATURE_CACHE_DIR = "./util/data/train_cache"
+# bump when pre_process or fit_encoders change what they produce, so cached features are rebuilt
+FEATURE_VERSION = 1
+TEST_SIZE = 0.2
+
+# search spaces of the notebook grids, sampled instead of searched exhaustively
+PARAM_DISTRIBUTIONS = {
+    'xgboost': {
+        'n_estimators': [50, 100, 200],
+        'max_depth': [6, 7, 8],
+        'learning_rate': [0.01, 0.1, 0.15],
+        'subsample': [0.8, 1.0],
+        'colsample_bytree': [0.8, 1.0],
+        'gamma': [0, 1, 5],
+    },
+    'random_forest': {
+        'max_depth': [2, 3, 5, None],
+        'min_samples_leaf': [1, 2, 3],
+        'min_samples_split': [2, 3, 4],
+        'max_features': [2, 3, 4],
+        'n_estimators': [50, 75, 100, 200],
+    },
+}
+
+
+def make_estimator(model, seed, n_jobs):
+    if model == 'xgboost':
+        from xgboost import XGBClassifier
+        return XGBClassifier(objective="binary:logistic", eval_metric='auc', random_state=seed, n_jobs=n_jobs)
+    from sklearn.ensemble import RandomForestClassifier
+    return RandomForestClassifier(random_state=seed, n_jobs=n_jobs)
+
+
+def source_files(datapath=DATAPATH, storepath=STOREPATH):
+    return store_source_files(datapath, storepath)
+
+
+def read_source(files, datapath=DATAPATH):
+    if files != [datapath]:
+        return read_partition_files(files)
+    # the parquet cache belongs to the default dataset only
+    return read_data(datapath, CACHEPATH) if datapath == DATAPATH else read_raw_data(datapath)
+
+
+def data_fingerprint(files, cate_cols=CATEGORICAL_COLS, numeric_cols=NUMERIC_COLS):
+    """hash of the source files (path, size, mtime) and the feature layout"""
+    return files_fingerprint(files, [FEATURE_VERSION, cate_cols, numeric_cols])
+
+
+def encoded_features(files, fingerprint, datapath=DATAPATH, cache_dir=FEATURE_CACHE_DIR):
+    """(X, y, dict_all) of the dataset, from the feature cache when this fingerprint was encoded before"""
+    featurepath = os.path.join(cache_dir, f"features-{fingerprint}.parquet")
+    dictpath = os.path.join(cache_dir, f"dict_all-{fingerprint}.obj")
+    if os.path.exists(featurepath) and os.path.exists(dictpath):
+        features = pd.read_parquet(featurepath)
+        with open(dictpath, 'rb') as f:
+            dict_all = pickle.load(f)
+        return features.drop(columns='is_fraud'), features['is_fraud'], dict_all, True
+    df = read_source(files, datapath)
+    dict_all = fit_encoders(df)
+    X, y = pre_process(df, encoders=encoder_indexes(dict_all))
+    os.makedirs(cache_dir, exist_ok=True)
+    X.assign(is_fraud=y).to_parquet(featurepath + ".tmp", index=False)
+    os.replace(featurepath + ".tmp", featurepath)
+    with open(dictpath, 'wb') as f:
+        pickle.dump(dict_all, f)
+    return X.reset_index(drop=True), y.reset_index(drop=True), dict_all, False
+
+
+def undersample(X, y, seed):
+    """every fraud row and as many random non fraud rows, like imblearn's RandomUnderSampler"""
+    rng = np.random.default_rng(seed)
+    fraud = np.flatnonzero(y.to_numpy() == 1)
+    normal = np.flatnonzero(y.to_numpy() == 0)
+    keep = np.sort(np.concatenate([fraud, rng.choice(normal, min(len(fraud), len(normal)), replace=False)]))
+    return X.iloc[keep], y.iloc[keep]
+
+
+def make_search(estimator, model, search, n_iter, n_jobs, seed):
+    from sklearn.model_selection import StratifiedKFold
+    cv = StratifiedKFold(n_splits=5, shuffle=True, random_state=seed)
+    if search == 'halving':
+        from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+        from sklearn.model_selection import HalvingRandomSearchCV
+        return HalvingRandomSearchCV(estimator, PARAM_DISTRIBUTIONS[model], n_candidates=n_iter, factor=3,
+                                     cv=cv, scoring='roc_auc', n_jobs=n_jobs, random_state=seed)
+    from sklearn.model_selection import RandomizedSearchCV
+    return RandomizedSearchCV(estimator, PARAM_DISTRIBUTIONS[model], n_iter=n_iter, cv=cv, scoring='roc_auc',
+                              n_jobs=n_jobs, random_state=seed)
+
+
+def evaluate(model, X_test, y_test):
+    from sklearn.metrics import (accuracy_score, average_precision_score, confusion_matrix, f1_score,
+                                 precision_score, recall_score, roc_auc_score)
+    probability = model.predict_proba(X_test)[:, 1]
+    prediction = (probability >= 0.5).astype(int)
+    return {
+        'roc_auc': roc_auc_score(y_test, probability),
+        'average_precision': average_precision_score(y_test, probability),
+        'accuracy': accuracy_score(y_test, prediction),
+        'precision': precision_score(y_test, prediction, zero_division=0),
+        'recall': recall_score(y_test, prediction),
+        'f1': f1_score(y_test, prediction),
+        'confusion_matrix': confusion_matrix(y_test, prediction).tolist(),
+    }
+
+
+def write_artifacts(model, dict_all, metrics, version, artifact_dir=ARTIFACT_DIR):
+    """model.pkl, dict_all.obj and metrics.json in artifact_dir/version, returns the directory"""
+    outdir = os.path.join(artifact_dir, version)
+    os.makedirs(outdir, exist_ok=True)
+    with open(os.path.join(outdir, "model.pkl"), 'wb') as f:
+        pickle.dump(model, f)
+    with open(os.path.join(outdir, "dict_all.obj"), 'wb') as f:
+        pickle.dump(dict_all, f)
+    with open(os.path.join(outdir, "metrics.json"), 'w') as f:
+        json.dump(metrics, f, indent=2, default=str)
+    return outdir
+
+
+def promote(outdir, modelpath=MODELPATH, dictpath=DICTPATH, flatdir=FLATMODELPATH):
+    """install a version as the app's artifacts, each file replaced atomically
+    boosted models are flattened too, a stale flat export is ignored by prediction_model"""
+    for name, target in (("dict_all.obj", dictpath), ("model.pkl", modelpath)):
+        shutil.copyfile(os.path.join(outdir, name), target + ".tmp")
+        os.replace(target + ".tmp", target)
+    model = read_model(modelpath)
+    if hasattr(model, 'get_booster'):
+        export_model(model, flatdir, file_sha1(modelpath))
+
+
+def train(model='xgboost', search='halving', n_iter=30, n_jobs=-1, seed=42, downsample=True,
+          datapath=DATAPATH, storepath=STOREPATH):
+    """run the pipeline, returns (best model, dict_all, metrics)"""
+    from sklearn.model_selection import train_test_split
+    started = time.perf_counter()
+    files = source_files(datapath, storepath)
+    fingerprint = data_fingerprint(files)
+    X, y, dict_all, cached = encoded_features(files, fingerprint, datapath)
+    encoded = time.perf_counter()
+
+    # evaluate on an untouched, imbalanced holdout; only the training part is downsampled
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=TEST_SIZE, stratify=y, random_state=seed)
+    if downsample:
+        X_train, y_train = undersample(X_train, y_train, seed)
+    # parallelism goes to the search, one thread per fit avoids oversubscribing the cores
+    estimator = make_estimator(model, seed, n_jobs=1 if n_jobs != 1 else None)
+    cv = make_search(estimator, model, search, n_iter, n_jobs, seed)
+    cv.fit(X_train, y_train)
+    searched = time.perf_counter()
+
+    metrics = {
+        'model': model,
+        'search': search,
+        # halving refits the survivors on more rows, count each candidate once
+        'candidates': getattr(cv, 'n_candidates_', [len(cv.cv_results_['params'])])[0],
+        'best_params': cv.best_params_,
+        'cv_roc_auc': cv.best_score_,
+        'test': evaluate(cv.best_estimator_, X_test, y_test),
+        'data_fingerprint': fingerprint,
+        'source_files': len(files),
+        'rows': len(X),
+        'train_rows': len(X_train),
+        'test_rows': len(X_test),
+        'downsample': downsample,
+        'seed': seed,
+        'n_jobs': n_jobs,
+        'feature_cache_hit': cached,
+        'seconds': {'features': encoded - started, 'search': searched - encoded, 'total': searched - started},
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+    }
+    return cv.best_estimator_, dict_all, metrics
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m util.train", description="Train the fraud model and encoders.")
+    parser.add_argument("--model", choices=list(PARAM_DISTRIBUTIONS), default='xgboost')
+    parser.add_argument("--search", choices=['halving', 'random'], default='halving')
+    parser.add_argument("--n-iter", type=int, default=30, help="sampled parameter combinations")
+    parser.add_argument("--n-jobs", type=int, default=-1, help="parallel fits, -1 uses every core")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-downsample", action="store_true", help="train on the imbalanced data as is")
+    parser.add_argument("--datapath", default=DATAPATH, help="csv.bz2 to train on when the store is not initialised")
+    parser.add_argument("--artifact-dir", default=ARTIFACT_DIR)
+    parser.add_argument("--promote", action="store_true", help=f"install the result as {MODELPATH} and {DICTPATH}")
+    args = parser.parse_args(argv)
+
+    model, dict_all, metrics = train(args.model, args.search, args.n_iter, args.n_jobs, args.seed,
+                                     not args.no_downsample, args.datapath)
+    version = f"{datetime.now(timezone.utc):%Y%m%d-%H%M%S}-{metrics['data_fingerprint'][:8]}"
+    metrics['version'] = version
+    outdir = write_artifacts(model, dict_all, metrics, version, args.artifact_dir)
+    print(f"{metrics['model']} {metrics['best_params']}")
+    print(f"cv roc_auc {metrics['cv_roc_auc']:.4f}, test roc_auc {metrics['test']['roc_auc']:.4f}, "
+          f"recall {metrics['test']['recall']:.4f}, precision {metrics['test']['precision']:.4f}")
+    print(f"{metrics['candidates']} candidates in {metrics['seconds']['total']:.1f}s "
+          f"(feature cache {'hit' if metrics['feature_cache_hit'] else 'miss'}) -> {outdir}")
+    if args.promote:
+        promote(outdir)
+        print(f"promoted to {MODELPATH} and {DICTPATH}")
+
+
+if __name__ == "__main__":
+    main()
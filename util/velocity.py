@@ -0,0 +1,186 @@
+"""Per-card velocity features for scoring: how fast and how far a card is being used.
+
+For every transaction, in time order per cc_num:
+    seconds_since_last       seconds since the card's previous transaction
+    count_1h, amount_1h      transactions and amount in the last hour, this one included
+    count_24h, amount_24h    the same over the last 24 hours
+    km_from_last_merchant    distance from the card's previous merchant location
+
+VelocityEngine keeps, per card, the last transaction and the transactions still
+inside the longest window. update() folds one event in amortized O(1) (online
+scoring); batch() computes a whole frame with numpy and continues from the same
+state, so a new file or request never rescans the card history. The state can be
+saved and loaded between runs.
+"""
+import os
+import pickle
+from collections import deque
+import numpy as np
+import pandas as pd
+from util.helper_function import haversine
+
+VELOCITY_WINDOWS = (('1h', 3600), ('24h', 86400))
+VELOCITY_COLS = (['seconds_since_last'] + [f"{kind}_{name}" for name, _ in VELOCITY_WINDOWS
+                                           for kind in ('count', 'amount')] + ['km_from_last_merchant'])
+VELOCITY_INPUT_COLS = ['cc_num', 'trans_date_trans_time', 'amt', 'merch_lat', 'merch_long']
+
+
+def event_seconds(trans_time):
+    """integer seconds of trans_date_trans_time values, a series or a single value"""
+    if isinstance(trans_time, pd.Series):
+        return pd.to_datetime(trans_time).to_numpy('datetime64[s]').astype(np.int64)
+    return int(pd.Timestamp(trans_time).timestamp())
+
+
+class CardState:
+    """last transaction of a card and its (time, amount) events inside each window"""
+    __slots__ = ('last_time', 'last_lat', 'last_long', 'windows', 'sums')
+
+    def __init__(self):
+        self.last_time = None
+        self.last_lat = self.last_long = np.nan
+        self.windows = [deque() for _ in VELOCITY_WINDOWS]
+        self.sums = [0.0] * len(VELOCITY_WINDOWS)
+
+
+class VelocityEngine:
+    """velocity features per card, online with update() or for whole frames with batch()"""
+
+    def __init__(self):
+        self.cards = {}
+
+    def __len__(self):
+        return len(self.cards)
+
+    def update(self, cc_num, seconds, amt, lat, long):
+        """features of one transaction, folding it into its card's state
+        an event older than the card's last one is not added to it; it is counted in the current
+        windows and has no previous transaction (NaN time and distance)"""
+        card = self.cards.get(cc_num)
+        if card is None:
+            card = self.cards[cc_num] = CardState()
+        if card.last_time is not None and seconds < card.last_time:
+            values = [np.nan]
+            for window, total in zip(card.windows, card.sums):
+                values += [len(window) + 1, total + amt]
+            return dict(zip(VELOCITY_COLS, values + [np.nan]))
+        since = np.nan if card.last_time is None else float(seconds - card.last_time)
+        km = float(haversine(card.last_lat, card.last_long, lat, long))
+        values = [since]
+        for i, (_, width) in enumerate(VELOCITY_WINDOWS):
+            window = card.windows[i]
+            window.append((seconds, amt))
+            card.sums[i] += amt
+            while window[0][0] <= seconds - width:
+                card.sums[i] -= window.popleft()[1]
+            if len(window) == 1:
+                # reset the running sum so float drift does not accumulate
+                card.sums[i] = amt
+            values += [len(window), card.sums[i]]
+        card.last_time, card.last_lat, card.last_long = seconds, lat, long
+        return dict(zip(VELOCITY_COLS, values + [km]))
+
+    def update_record(self, record):
+        """update() for a raw transaction record (a dict with VELOCITY_INPUT_COLS)"""
+        return self.update(int(record['cc_num']), event_seconds(record['trans_date_trans_time']),
+                           float(record['amt']), float(record['merch_lat']), float(record['merch_long']))
+
+    def batch(self, df):
+        """features of every row of df (VELOCITY_INPUT_COLS), aligned with df's index, and fold df into the state
+        rows are ordered by card and time; the state's earlier events are put in front of each card's rows"""
+        cards = df['cc_num'].to_numpy(np.int64)
+        seconds = event_seconds(df['trans_date_trans_time'])
+        amt = df['amt'].to_numpy(np.float64)
+        lat = df['merch_lat'].to_numpy(np.float64)
+        long = df['merch_long'].to_numpy(np.float64)
+
+        # events of the state for the cards in this batch, the longest window holds all of them
+        prior = [(cc, card) for cc in pd.unique(cards) if (card := self.cards.get(cc)) is not None]
+        prior_events = [(cc, t, a) for cc, card in prior for t, a in card.windows[-1]]
+        n_prior = len(prior_events)
+        if n_prior:
+            prior_cards, prior_seconds, prior_amt = (np.array(column) for column in zip(*prior_events))
+            # only the last event of a card is a predecessor of the batch, it carries the card's location
+            prior_lat = np.full(n_prior, np.nan)
+            prior_long = np.full(n_prior, np.nan)
+            last_rows = np.cumsum([len(card.windows[-1]) for _, card in prior]) - 1
+            prior_lat[last_rows] = [card.last_lat for _, card in prior]
+            prior_long[last_rows] = [card.last_long for _, card in prior]
+            cards = np.concatenate([prior_cards.astype(np.int64), cards])
+            seconds = np.concatenate([prior_seconds.astype(np.int64), seconds])
+            amt = np.concatenate([prior_amt.astype(np.float64), amt])
+            lat = np.concatenate([prior_lat, lat])
+            long = np.concatenate([prior_long, long])
+
+        # stable order by card then time, state events first on ties
+        order = np.lexsort((np.arange(len(cards)), seconds, cards))
+        cards, seconds, amt, lat, long = cards[order], seconds[order], amt[order], lat[order], long[order]
+        same = np.zeros(len(cards), dtype=bool)
+        same[1:] = cards[1:] == cards[:-1]
+        previous = np.maximum(np.arange(len(cards)) - 1, 0)
+        columns = {'seconds_since_last': np.where(same, seconds - seconds[previous], np.nan)}
+        # one sorted key: card number then time, the windows never reach into another card
+        card_code = np.cumsum(~same)
+        offset = seconds - seconds.min() if len(seconds) else seconds
+        span = int(offset.max()) + VELOCITY_WINDOWS[-1][1] + 1 if len(seconds) else 1
+        key = card_code * span + offset
+        amount_sum = np.concatenate([[0.0], np.cumsum(amt)])
+        rows = np.arange(len(cards))
+        for name, width in VELOCITY_WINDOWS:
+            start = np.searchsorted(key, key - width, side='right')
+            columns[f"count_{name}"] = rows - start + 1
+            columns[f"amount_{name}"] = amount_sum[rows + 1] - amount_sum[start]
+        columns['km_from_last_merchant'] = np.where(same, haversine(lat[previous], long[previous], lat, long), np.nan)
+
+        self._fold(cards, seconds, amt, lat, long, same)
+        # back to the batch rows in their original order
+        batch_rows = order >= n_prior
+        features = pd.DataFrame({col: values[batch_rows] for col, values in columns.items()},
+                                index=order[batch_rows] - n_prior).sort_index()
+        for name, _ in VELOCITY_WINDOWS:
+            features[f"count_{name}"] = features[f"count_{name}"].astype(np.int32)
+        return features.set_axis(df.index)
+
+    def _fold(self, cards, seconds, amt, lat, long, same):
+        """replace the state of the cards in these sorted events with their last event and windows"""
+        if not len(cards):
+            return
+        starts = np.flatnonzero(~same)
+        ends = np.append(starts[1:], len(cards))
+        last_seconds = np.repeat(seconds[ends - 1], ends - starts)
+        # same eviction rule as update(): the longest window keeps events newer than last - width
+        kept = np.flatnonzero(seconds > last_seconds - VELOCITY_WINDOWS[-1][1])
+        kept_cards = cards[kept]
+        bounds = zip(np.searchsorted(kept_cards, cards[starts], side='left'),
+                     np.searchsorted(kept_cards, cards[starts], side='right'))
+        for g, (lo, hi) in enumerate(bounds):
+            card = CardState()
+            end = ends[g] - 1
+            card.last_time, card.last_lat, card.last_long = int(seconds[end]), float(lat[end]), float(long[end])
+            events = kept[lo:hi]
+            for i, (_, width) in enumerate(VELOCITY_WINDOWS):
+                window = events[seconds[events] > card.last_time - width]
+                card.windows[i] = deque(zip(seconds[window].tolist(), amt[window].tolist()))
+                card.sums[i] = float(amt[window].sum())
+            self.cards[int(cards[starts[g]])] = card
+
+    def save(self, path):
+        with open(path + ".tmp", 'wb') as f:
+            pickle.dump(self.cards, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path):
+        """engine with the state saved at path, an empty one when there is none yet"""
+        engine = cls()
+        if path and os.path.exists(path):
+            with open(path, 'rb') as f:
+                engine.cards = pickle.load(f)
+        return engine
+
+
+def with_velocity(df, engine):
+    """df with its velocity columns joined, df unchanged when it lacks the input columns"""
+    if engine is None or not set(VELOCITY_INPUT_COLS) <= set(df.columns):
+        return df
+    return df.join(engine.batch(df))
@@ -0,0 +1,186 @@
+"""Background warm-up of the shared caches at server start.
+
+Streamlit runs no app code before the first session, so the first script run of a server
+process (whichever page it is) starts the warm-up: start_warmup() creates one Warmup per
+process, which submits every component to a thread pool and returns at once while the
+page keeps rendering. A component fills the same process wide caches the pages read
+(st.cache_resource, st.cache_data, load_artifact), and those compute a key once while
+concurrent callers wait, so a page needing a component that is still warming waits for
+that work instead of repeating it. The in-memory dataset is only warmed when the pages
+read it (the pandas query backend, or no aggregate build of the current data), so a
+worker served by DuckDB and a build keeps its memory flat.
+
+Sections that depend on a component ask ready() first and show a placeholder while it
+warms, so the rest of the page renders. warmup_status() lists the components in the
+sidebar and, when the run skipped sections, polls and reruns the page once they are ready.
+Set FRAUD_APP_WARMUP=0 to disable the warm-up.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+import streamlit as st
+
+WARMUP_ENV = "FRAUD_APP_WARMUP"
+POLL_SECONDS = 1
+THREAD_PREFIX = "warmup"
+
+# components the current script run skipped, each session runs its script in its own thread
+_state = threading.local()
+
+
+class _WarmupThreadFilter(logging.Filter):
+    """drop the missing ScriptRunContext warnings of the warm-up threads
+    cached functions try to show their spinner, the warm-up runs outside any session on purpose"""
+
+    def filter(self, record):
+        return not record.threadName.startswith(THREAD_PREFIX)
+
+
+logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").addFilter(_WarmupThreadFilter())
+
+
+def dataset_needed():
+    """whether the pages read the in-memory dataset: with the pandas query backend, or without an aggregate
+    build of the current data; otherwise it stays unloaded until a lookup needs it (the radius search)"""
+    from util.aggregates import data_fingerprint, manifest_path
+    from util.helper_function import query_backend_name
+    return query_backend_name() == 'pandas' or not os.path.exists(manifest_path(data_fingerprint()))
+
+
+def warm_data():
+    """the in-memory dataset with its fraud stats, card index and time gaps, False when the pages do not need it"""
+    if not dataset_needed():
+        return False
+    from util.helper_function import load_dataset
+    load_dataset()
+
+
+def warm_queries():
+    """fraud stats and high risk summaries, from the aggregate build or the query backend"""
+    from util.aggregates import BACKEND_AGGREGATES, load_aggregate
+    for name in BACKEND_AGGREGATES:
+        load_aggregate(name)
+
+
+def warm_aggregates():
+    """the other page aggregates and the identity linkages, computed live ones wait for the dataset"""
+    from util.aggregates import AGGREGATES, BACKEND_AGGREGATES, load_aggregate, load_identity_links
+    for name in AGGREGATES:
+        if name not in BACKEND_AGGREGATES:
+            load_aggregate(name)
+    load_identity_links()
+
+
+def warm_model():
+    """the prediction model and the encoders"""
+    from util.helper_function import prediction_model, load_encoders
+    prediction_model()
+    load_encoders()
+
+
+# name -> function loading the component into the shared caches, returning False when it skipped it
+COMPONENTS = {'data': warm_data, 'queries': warm_queries, 'aggregates': warm_aggregates, 'model': warm_model}
+
+
+class Warmup:
+    """components loading concurrently in a thread pool, one thread each, with the state of every component"""
+
+    def __init__(self, components=COMPONENTS):
+        self.components = dict(components)
+        self.state = {name: {'status': 'pending', 'seconds': None, 'error': None} for name in self.components}
+        self.lock = threading.Lock()
+        pool = ThreadPoolExecutor(max_workers=len(self.components), thread_name_prefix=THREAD_PREFIX)
+        self.futures = {name: pool.submit(self._run, name) for name in self.components}
+        pool.shutdown(wait=False)
+
+    def _run(self, name):
+        self._update(name, status='running')
+        start = time.perf_counter()
+        try:
+            loaded = self.components[name]()
+        except Exception as e:
+            # the page loading the component raises the error itself
+            self._update(name, status='failed', seconds=time.perf_counter() - start, error=repr(e))
+        else:
+            self._update(name, status='skipped' if loaded is False else 'ready', seconds=time.perf_counter() - start)
+
+    def _update(self, name, **state):
+        with self.lock:
+            self.state[name] = {**self.state[name], **state}
+
+    def ready(self, name):
+        """whether the component has finished warming, failed and skipped included"""
+        return self.futures[name].done()
+
+    def done(self):
+        return all(future.done() for future in self.futures.values())
+
+    def wait(self, timeout=None):
+        """block until every component has finished warming or timeout seconds passed"""
+        wait(self.futures.values(), timeout)
+        return self.done()
+
+    def status(self):
+        """{component: {status, seconds, error}}"""
+        with self.lock:
+            return {name: dict(state) for name, state in self.state.items()}
+
+
+def warmup_enabled():
+    return os.environ.get(WARMUP_ENV, "1") not in ("", "0")
+
+
+@st.cache_resource(show_spinner=False)
+def _warmup():
+    return Warmup()
+
+
+def start_warmup():
+    """start the warm-up once per server process and begin the current run, call on every page before ready()
+    once the page has sent its first elements; returns the Warmup, None when disabled"""
+    _state.waiting = set()
+    return _warmup() if warmup_enabled() else None
+
+
+def current_warmup():
+    return _warmup() if warmup_enabled() else None
+
+
+def ready(*components, placeholder=None):
+    """whether the components are warm (or no warm-up is running), so the section using them renders now
+    otherwise shows placeholder, and warmup_status() reruns the page once they are"""
+    warmup = current_warmup()
+    if warmup is None:
+        return True
+    pending = {name for name in components if not warmup.ready(name)}
+    if not pending:
+        return True
+    _state.waiting = getattr(_state, 'waiting', set()) | pending
+    if placeholder:
+        st.info(placeholder)
+    return False
+
+
+def warmup_status():
+    """readiness of every component in the sidebar while warming, call at the end of every page
+    polls while the run skipped sections and reruns the page once their components are ready"""
+    warmup = current_warmup()
+    waiting = tuple(sorted(getattr(_state, 'waiting', ())))
+    if warmup is None or (warmup.done() and not waiting):
+        return
+    with st.sidebar:
+        st.fragment(_status_panel, run_every=POLL_SECONDS if waiting else None)(warmup, waiting)
+
+
+def _status_panel(warmup, waiting):
+    if waiting and all(warmup.ready(name) for name in waiting):
+        st.rerun()
+    lines = []
+    for name, state in warmup.status().items():
+        if state['status'] in ('ready', 'failed'):
+            lines.append(f"{name}: {state['status']} in {state['seconds']:.1f}s")
+        else:
+            lines.append(f"{name}: {state['status']}")
+    st.caption("Warming up  \n" + "  \n".join(lines))